@@ -0,0 +1,244 @@
+#-*- coding: utf-8 -*-
+u"""Batch recommendation functions, operating on the whole graph at once.
+
+Rather than traversing the object graph once per user, the functions in this
+module export the relevant relationships into compressed sparse row (CSR)
+arrays and compute suggestions for every user through vectorized operations.
+
+This module requires NumPy.
+"""
+import numpy as np
+from recomendalia.user import FriendSuggestion
+
+#: The maximum number of friend-of-friend paths expanded at once by
+#: `suggest_friends_for_all`. Bounds the memory used by the batch.
+EXPANSION_BUDGET = 1 << 22
+
+
+def friendship_matrix(users):
+    """Export the friendships between the given users as a CSR adjacency
+    matrix.
+
+    Friends that are not included in `users` are ignored.
+
+    :param users: A sequence of `User` objects.
+    :return: A tuple with two integer arrays: the row pointers (`indptr`) and
+        the column indices (`indices`) of the matrix. The friends of the user
+        at position *i* are the users at the positions given by
+        ``indices[indptr[i]:indptr[i + 1]]``, in ascending order.
+    """
+    index = dict((user, i) for i, user in enumerate(users))
+    indptr = np.zeros(len(users) + 1, dtype = np.int64)
+    indices = []
+
+    for i, user in enumerate(users):
+        row = sorted(
+            index[friend]
+            for friend in user._friends
+            if friend in index
+        )
+        indices.extend(row)
+        indptr[i + 1] = indptr[i] + len(row)
+
+    return indptr, np.array(indices, dtype = np.int64)
+
+
+def mutual_friend_counts(indptr, indices, start = 0, stop = None):
+    """Compute the number of friends in common between users and the friends
+    of their friends, for a range of rows of a friendship matrix.
+
+    This is the sparse product of the adjacency matrix by itself, with the
+    diagonal and the existing friendships masked out.
+
+    :param indptr: The row pointers of the friendship matrix.
+    :param indices: The column indices of the friendship matrix.
+    :param start: The first row to compute.
+    :param stop: The row after the last one to compute. Defaults to the number
+        of rows in the matrix.
+    :return: A tuple with three arrays of the same length: rows, candidate
+        columns, and friends in common. Entries are sorted by row, then by
+        column.
+    """
+    size = len(indptr) - 1
+    if stop is None:
+        stop = size
+
+    degrees = np.diff(indptr)
+    edge_start = indptr[start]
+    edge_stop = indptr[stop]
+
+    # Expand each friendship (row, friend) into the paths going through it:
+    # (row, friend of friend)
+    edge_rows = np.repeat(
+        np.arange(start, stop, dtype = np.int64),
+        degrees[start:stop]
+    )
+    middle = indices[edge_start:edge_stop]
+    lengths = degrees[middle]
+    total = lengths.sum()
+    offsets = (
+        np.repeat(indptr[middle] - (np.cumsum(lengths) - lengths), lengths)
+        + np.arange(total, dtype = np.int64)
+    )
+    candidates = indices[offsets]
+    rows = np.repeat(edge_rows, lengths)
+
+    # Discard the users themselves and their existing friends
+    keys = rows * size + candidates
+    mask = (candidates != rows) & ~np.in1d(keys, edge_rows * size + middle)
+    keys, counts = np.unique(keys[mask], return_counts = True)
+
+    return keys // size, keys % size, counts
+
+
+def top_mutual_friends(rows,
+    columns,
+    counts,
+    count,
+    min_friends_in_common = 1
+):
+    """Select the top candidates of each row from the output of
+    `mutual_friend_counts`.
+
+    :return: A tuple with three arrays, like `mutual_friend_counts`. Entries
+        are sorted by row, then by decreasing number of friends in common,
+        keeping at most `count` entries per row. Ties are resolved in favour
+        of the lowest column.
+    """
+    mask = counts >= min_friends_in_common
+    rows = rows[mask]
+    columns = columns[mask]
+    counts = counts[mask]
+
+    # lexsort is stable, so columns stay in ascending order among ties
+    order = np.lexsort((-counts, rows))
+    rows = rows[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    order = order[rank < count]
+
+    return rows[rank < count], columns[order], counts[order]
+
+
+def _row_blocks(cost, budget):
+    # Split a range of rows into contiguous blocks whose accumulated cost
+    # stays within the given budget (single rows may exceed it)
+    cumulative = np.cumsum(cost)
+    start = 0
+    size = len(cost)
+
+    while start < size:
+        base = cumulative[start - 1] if start else 0
+        stop = max(
+            int(np.searchsorted(cumulative, base + budget, side = "right")),
+            start + 1
+        )
+        yield start, stop
+        start = stop
+
+
+def suggest_friends_for_all(users, count = 8, min_friends_in_common = 2):
+    """Suggest potential friends for every user in the given sequence.
+
+    Produces the same kind of suggestions as `User.suggest_friends`, but
+    computes them for the whole graph through sparse matrix products.
+
+    :param users: A sequence of `User` objects. Friends that are not included
+        in the sequence are ignored.
+    :param count: The maximum number of suggestions to produce for each user.
+    :param min_friends_in_common: Candidates sharing less friends than this
+        with a user are not suggested.
+    :return: A dictionary mapping each `User` to a list of `FriendSuggestion`
+        objects, ordered by decreasing afinity.
+    """
+    users = list(users)
+    indptr, indices = friendship_matrix(users)
+    degrees = np.diff(indptr)
+
+    # The number of paths expanded for each row
+    cost = np.bincount(
+        np.repeat(np.arange(len(users)), degrees),
+        weights = degrees[indices],
+        minlength = len(users)
+    )
+
+    suggestions = dict((user, []) for user in users)
+
+    for start, stop in _row_blocks(cost, EXPANSION_BUDGET):
+        rows, columns, counts = top_mutual_friends(
+            *mutual_friend_counts(indptr, indices, start, stop),
+            count = count,
+            min_friends_in_common = min_friends_in_common
+        )
+        for row, column, rank in zip(
+            rows.tolist(),
+            columns.tolist(),
+            counts.tolist()
+        ):
+            user = users[row]
+            candidate = users[column]
+            suggestions[user].append(
+                FriendSuggestion(
+                    candidate,
+                    rank,
+                    user.get_friends_in_common(candidate)
+                )
+            )
+
+    return suggestions
+
+
+def suggest_friends_for_users(users, count = 8, min_friends_in_common = 2):
+    """Suggest potential friends for a few users at once.
+
+    Unlike `suggest_friends_for_all`, only the friendships within two steps
+    of the given users are exported, so the cost depends on the size of
+    their networks rather than on the size of the whole graph.
+
+    :param users: A sequence of `User` objects.
+    :param count: The maximum number of suggestions to produce for each user.
+    :param min_friends_in_common: Candidates sharing less friends than this
+        with a user are not suggested.
+    :return: A dictionary mapping each of the given users to a list of
+        `FriendSuggestion` objects, ordered by decreasing afinity.
+    """
+    # The requested users come first, so that they take up the first rows of
+    # the matrix
+    users = list(set(users))
+    neighbourhood = list(users)
+    included = set(users)
+    for user in users:
+        for friend in user._friends:
+            for candidate in friend._friends:
+                if candidate not in included:
+                    included.add(candidate)
+                    neighbourhood.append(candidate)
+            if friend not in included:
+                included.add(friend)
+                neighbourhood.append(friend)
+
+    indptr, indices = friendship_matrix(neighbourhood)
+    suggestions = dict((user, []) for user in users)
+    if not users:
+        return suggestions
+
+    rows, columns, counts = top_mutual_friends(
+        *mutual_friend_counts(indptr, indices, 0, len(users)),
+        count = count,
+        min_friends_in_common = min_friends_in_common
+    )
+    for row, column, rank in zip(
+        rows.tolist(),
+        columns.tolist(),
+        counts.tolist()
+    ):
+        user = neighbourhood[row]
+        candidate = neighbourhood[column]
+        suggestions[user].append(
+            FriendSuggestion(
+                candidate,
+                rank,
+                user.get_friends_in_common(candidate)
+            )
+        )
+
+    return suggestions
@@ -0,0 +1,6 @@
+#-*- coding: utf-8 -*-
+u"""Benchmarks for the recomendalia data model and recommenders.
+
+Each module in this package can be run as a script (for example, ``python -m
+recomendalia.benchmarks.memory``).
+"""
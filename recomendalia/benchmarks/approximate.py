@@ -0,0 +1,176 @@
+#-*- coding: utf-8 -*-
+u"""Measures the recall and latency of approximate friend suggestions.
+
+The benchmark generates a seeded sample data set with skewed (power law)
+numbers of friends per user, and compares the suggestions produced by
+`User.suggest_friends` with a `MinHashIndex`, for several band and row
+configurations, against the exact suggestions.
+
+Recall is the fraction of the exact suggestions matched by the approximate
+ones: an approximate suggestion counts as a match if it has at least as many
+friends in common as the last exact suggestion, so that ties between
+candidates don't affect the measure. Usage::
+
+    python -m recomendalia.benchmarks.approximate --users 100000
+"""
+import json
+import random
+from argparse import ArgumentParser
+from timeit import default_timer
+from recomendalia.benchmarks.hotpaths import percentile
+
+CONFIGURATIONS = ((64, 1), (32, 1), (32, 2), (16, 4))
+
+
+def recall(exact, approximate):
+    """Compute the recall of a list of approximate suggestions.
+
+    :param exact: The exact suggestions for a user, as a list of
+        `FriendSuggestion` objects.
+    :param approximate: The approximate suggestions for the same user.
+    :return: The fraction of exact suggestions matched, or None if there are
+        no exact suggestions.
+    """
+    if not exact:
+        return None
+    threshold = exact[-1].rank
+    hits = sum(1 for suggestion in approximate if suggestion.rank >= threshold)
+    return float(min(hits, len(exact))) / len(exact)
+
+
+def timed(calls):
+    """Run the given calls and time each of them.
+
+    :return: A tuple with the list of results and the sorted list of
+        durations, in seconds.
+    """
+    results = []
+    timings = []
+    for call in calls:
+        start = default_timer()
+        results.append(call())
+        timings.append(default_timer() - start)
+    return results, sorted(timings)
+
+
+def measure(user_count,
+    samples,
+    count,
+    exponent,
+    max_candidates,
+    configurations,
+    seed
+):
+    """Generate a data set and compare approximate and exact suggestions.
+
+    :return: A list of dictionaries, one for the exact engine and one for each
+        (bands, rows) configuration, with latency percentiles, the mean recall
+        and the time taken to build the index.
+    """
+    from recomendalia.registry import Registry
+    from recomendalia.sampledata import generate_sample_data, power_law
+    from recomendalia.minhash import MinHashIndex
+
+    users = generate_sample_data(
+        user_count,
+        friends_per_user = power_law(
+            exponent,
+            minimum = 4,
+            maximum = max(user_count // 10, 4)
+        ),
+        seed = seed,
+        registry = Registry()
+    )[0]
+    rng = random.Random(seed)
+    sample = [users[rng.randrange(len(users))] for i in xrange(samples)]
+
+    exact, timings = timed(
+        (lambda user = user: user.suggest_friends(count))
+        for user in sample
+    )
+    results = [_summary("exact", timings, 1.0, 0.0)]
+
+    for bands, rows in configurations:
+        start = default_timer()
+        index = MinHashIndex.from_users(
+            users,
+            bands = bands,
+            rows = rows,
+            max_candidates = max_candidates
+        )
+        build_time = default_timer() - start
+        approximate, timings = timed(
+            (lambda user = user: user.suggest_friends(count, index = index))
+            for user in sample
+        )
+        recalls = [
+            value
+            for value in map(recall, exact, approximate)
+            if value is not None
+        ]
+        results.append(_summary(
+            "minhash %dx%d" % (bands, rows),
+            timings,
+            sum(recalls) / len(recalls) if recalls else 0.0,
+            build_time
+        ))
+
+    return results
+
+
+def _summary(engine, timings, mean_recall, build_time):
+    return {
+        "engine": engine,
+        "p50": percentile(timings, 0.5),
+        "p99": percentile(timings, 0.99),
+        "max": timings[-1] if timings else 0.0,
+        "recall": mean_recall,
+        "build_time": build_time
+    }
+
+
+def main(argv = None):
+    parser = ArgumentParser(description = __doc__.split("\n")[0])
+    parser.add_argument("--users", type = int, default = 100000)
+    parser.add_argument("--samples", type = int, default = 1000,
+        help = "the number of users to produce suggestions for")
+    parser.add_argument("--count", type = int, default = 8,
+        help = "the number of suggestions per user")
+    parser.add_argument("--exponent", type = float, default = 2.1,
+        help = "the exponent of the power law distribution of friends")
+    parser.add_argument("--max-candidates", type = int, default = 256)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--json", action = "store_true",
+        help = "output the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = measure(
+        args.users,
+        args.samples,
+        args.count,
+        args.exponent,
+        args.max_candidates,
+        CONFIGURATIONS,
+        args.seed
+    )
+
+    if args.json:
+        print json.dumps(results, indent = 4)
+        return
+
+    print "%-16s %10s %10s %10s %8s %10s" % (
+        "engine", "p50 ms", "p99 ms", "max ms", "recall", "build s"
+    )
+    for result in results:
+        print "%-16s %10.3f %10.3f %10.3f %8.3f %10.2f" % (
+            result["engine"],
+            result["p50"] * 1000,
+            result["p99"] * 1000,
+            result["max"] * 1000,
+            result["recall"],
+            result["build_time"]
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#-*- coding: utf-8 -*-
+u"""Compares friend suggestions over friend sets and over bitsets.
+
+The benchmark generates a seeded sample data set with skewed (power law)
+numbers of friends per user, indexes it with `FriendBitsets`, and times, for
+both the set based path and the bitset index:
+
+    - ``suggest_friends``: a complete call to `User.suggest_friends`.
+    - ``friends_in_common``: listing the friends in common between a user and
+      all of its suggested candidates (`User.get_friends_in_common` for each
+      candidate, against a single call to
+      `FriendBitsets.list_friends_in_common`).
+
+Users are drawn from three groups: ``typical`` users (picked at random),
+``hubs`` (the users with the most friends) and ``hub friends`` (random friends
+of the hubs, whose networks include the hubs' friends). The script also checks
+that both paths agree on the rank of every suggestion. Usage::
+
+    python -m recomendalia.benchmarks.bitsets --users 20000
+"""
+import json
+import random
+from argparse import ArgumentParser
+from timeit import default_timer
+from recomendalia.benchmarks.hotpaths import percentile
+from recomendalia.benchmarks.approximate import timed
+
+
+def measure(user_count, samples, count, exponent, max_friends, seed):
+    """Generate a data set and time both suggestion paths on it.
+
+    :return: A dictionary with the time taken to build the index, its size in
+        bytes, the number of mismatched suggestions, and a list of
+        dictionaries with latency percentiles for each group of users,
+        operation and path.
+    """
+    from recomendalia.registry import Registry
+    from recomendalia.sampledata import generate_sample_data, power_law
+    from recomendalia.bitsets import FriendBitsets
+
+    users = generate_sample_data(
+        user_count,
+        friends_per_user = power_law(
+            exponent,
+            minimum = 4,
+            maximum = max_friends or max(user_count // 10, 4)
+        ),
+        seed = seed,
+        registry = Registry()
+    )[0]
+
+    start = default_timer()
+    bitsets = FriendBitsets.from_users(users)
+    build_time = default_timer() - start
+
+    rng = random.Random(seed)
+    by_degree = sorted(users, key = lambda user: -len(user._friends))
+    hubs = by_degree[:samples]
+    hub_friends = [
+        rng.choice(list(hub._friends))
+        for hub in hubs
+        if hub._friends
+    ]
+    groups = (
+        ("typical", [rng.choice(users) for i in xrange(samples)]),
+        ("hubs", hubs),
+        ("hub friends", hub_friends)
+    )
+
+    results = []
+    mismatches = 0
+
+    for group, sample in groups:
+        exact, set_timings = timed(
+            (lambda user = user: user.suggest_friends(count))
+            for user in sample
+        )
+        indexed, bitset_timings = timed(
+            (lambda user = user: user.suggest_friends(count, index = bitsets))
+            for user in sample
+        )
+        for a, b in zip(exact, indexed):
+            if [s.rank for s in a] != [s.rank for s in b]:
+                mismatches += 1
+
+        candidates = [
+            [suggestion.user for suggestion in suggestions]
+            for suggestions in exact
+        ]
+        set_common = timed(
+            (
+                lambda user = user, others = others: [
+                    user.get_friends_in_common(other)
+                    for other in others
+                ]
+            )
+            for user, others in zip(sample, candidates)
+        )[1]
+        bitset_common = timed(
+            (
+                lambda user = user, others = others:
+                    bitsets.list_friends_in_common(user, others)
+            )
+            for user, others in zip(sample, candidates)
+        )[1]
+
+        degree = sum(len(user._friends) for user in sample)
+        for operation, path, timings in (
+            ("suggest_friends", "sets", set_timings),
+            ("suggest_friends", "bitsets", bitset_timings),
+            ("friends_in_common", "sets", set_common),
+            ("friends_in_common", "bitsets", bitset_common)
+        ):
+            results.append({
+                "group": group,
+                "mean_degree": float(degree) / len(sample) if sample else 0,
+                "operation": operation,
+                "path": path,
+                "p50": percentile(timings, 0.5),
+                "p99": percentile(timings, 0.99),
+                "max": timings[-1] if timings else 0.0
+            })
+
+    return {
+        "build_time": build_time,
+        "index_bytes": bitsets._rows.nbytes,
+        "mismatches": mismatches,
+        "results": results
+    }
+
+
+def main(argv = None):
+    parser = ArgumentParser(description = __doc__.split("\n")[0])
+    parser.add_argument("--users", type = int, default = 20000)
+    parser.add_argument("--samples", type = int, default = 200,
+        help = "the number of users in each group")
+    parser.add_argument("--count", type = int, default = 8,
+        help = "the number of suggestions per user")
+    parser.add_argument("--exponent", type = float, default = 2.1,
+        help = "the exponent of the power law distribution of friends")
+    parser.add_argument("--max-friends", type = int, default = None,
+        help = "the maximum number of friends drawn for each user "
+            "(defaults to a tenth of the users)")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--json", action = "store_true",
+        help = "output the results as JSON")
+    args = parser.parse_args(argv)
+
+    measurement = measure(
+        args.users,
+        args.samples,
+        args.count,
+        args.exponent,
+        args.max_friends,
+        args.seed
+    )
+
+    if args.json:
+        print json.dumps(measurement, indent = 4)
+        return
+
+    print "Index built in %.2fs, %.1f MB, %d mismatches" % (
+        measurement["build_time"],
+        measurement["index_bytes"] / 1e6,
+        measurement["mismatches"]
+    )
+    print "%-12s %8s %-18s %-8s %10s %10s %10s" % (
+        "group", "degree", "operation", "path", "p50 ms", "p99 ms", "max ms"
+    )
+    for result in measurement["results"]:
+        print "%-12s %8.1f %-18s %-8s %10.3f %10.3f %10.3f" % (
+            result["group"],
+            result["mean_degree"],
+            result["operation"],
+            result["path"],
+            result["p50"] * 1000,
+            result["p99"] * 1000,
+            result["max"] * 1000
+        )
+
+
+if __name__ == "__main__":
+    main()
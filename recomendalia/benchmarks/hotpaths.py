@@ -0,0 +1,313 @@
+#-*- coding: utf-8 -*-
+u"""Measures the latency, throughput and memory use of the hot paths.
+
+The benchmark generates seeded sample data sets of increasing size, with
+either uniform or skewed (power law) numbers of friends per user, and times
+these entry points on each of them:
+
+    - ``generate_sample_data``: a single call, creating the data set.
+    - ``suggest_friends``, ``gen_network``: one call for each of a random
+      sample of users.
+    - ``get_friends_in_common``: one call for each of a random sample of
+      users, paired with a random friend of one of their friends.
+
+For each entry point it reports latency percentiles, throughput (calls per
+second; users created per second for ``generate_sample_data``) and the peak
+resident memory used while it ran. Each data set is measured in a separate
+process.
+
+Results can be written as JSON, and compared against the results of a
+previous run, to catch regressions::
+
+    python -m recomendalia.benchmarks.hotpaths --output baseline.json
+    python -m recomendalia.benchmarks.hotpaths --baseline baseline.json
+
+When comparing, the script exits with status 1 if any median latency, 99th
+percentile latency or peak memory grows by more than the given tolerance.
+"""
+import gc
+import json
+import random
+import subprocess
+import sys
+from argparse import ArgumentParser
+from timeit import default_timer
+from recomendalia.benchmarks.memory import memory_usage
+
+ENTRY_POINTS = (
+    "generate_sample_data",
+    "suggest_friends",
+    "gen_network",
+    "get_friends_in_common"
+)
+SKEWS = ("uniform", "power_law")
+COMPARED_METRICS = ("p50", "p99", "peak_memory")
+
+
+def reset_peak_memory():
+    """Reset the peak resident memory of the current process, if possible.
+
+    :return: True if the peak was reset (only supported on Linux 4.0 and
+        newer), False otherwise.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def peak_memory_usage():
+    """Return the peak resident memory of the current process, in bytes."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    import resource
+    # In kilobytes on Linux and bytes on macOS
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def percentile(values, fraction):
+    """Return a percentile of a sorted list of values, with linear
+    interpolation.
+    """
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(name, timings, units, peak_memory):
+    """Summarize the timings of an entry point.
+
+    :param name: The name of the entry point.
+    :param timings: A list with the duration of each call, in seconds.
+    :param units: The number of units of work performed by all the calls,
+        used to compute the throughput.
+    :param peak_memory: The peak memory used by the calls, in bytes.
+    :return: A dictionary with the results.
+    """
+    timings = sorted(timings)
+    total = sum(timings)
+    return {
+        "entry_point": name,
+        "calls": len(timings),
+        "mean": total / len(timings) if timings else 0.0,
+        "p50": percentile(timings, 0.5),
+        "p90": percentile(timings, 0.9),
+        "p99": percentile(timings, 0.99),
+        "max": timings[-1] if timings else 0.0,
+        "throughput": units / total if total else 0.0,
+        "peak_memory": peak_memory
+    }
+
+
+def measure(user_count, skew, samples, exponent, seed):
+    """Generate a data set and time each entry point on it.
+
+    :param user_count: The number of users to generate.
+    :param skew: Either "uniform" (the default distribution of
+        `generate_sample_data`) or "power_law", for a few users with lots of
+        friends and many with few.
+    :param samples: The number of users to call each entry point for.
+    :param exponent: The exponent of the power law distribution.
+    :param seed: The seed used to generate the data set and pick users.
+    :return: A list of dictionaries, one for each entry point (see
+        `summarize`).
+    """
+    from recomendalia.registry import Registry
+    from recomendalia.sampledata import generate_sample_data, power_law
+
+    kwargs = {}
+    if skew == "power_law":
+        kwargs["friends_per_user"] = power_law(
+            exponent,
+            minimum = 4,
+            maximum = max(user_count // 10, 4)
+        )
+
+    results = []
+
+    def run(name, calls, units = None):
+        gc.collect()
+        base = memory_usage()
+        reset_peak_memory()
+        timings = []
+        for call in calls:
+            start = default_timer()
+            call()
+            timings.append(default_timer() - start)
+        results.append(summarize(
+            name,
+            timings,
+            len(timings) if units is None else units,
+            max(peak_memory_usage() - base, 0)
+        ))
+
+    data = []
+    run(
+        "generate_sample_data",
+        [lambda: data.extend(generate_sample_data(
+            user_count,
+            seed = seed,
+            registry = Registry(),
+            **kwargs
+        ))],
+        user_count
+    )
+    users = data[0]
+
+    rng = random.Random(seed)
+    sample = [users[rng.randrange(len(users))] for i in xrange(samples)]
+    pairs = []
+    for user in sample:
+        friend = rng.choice(list(user._friends)) if user._friends else user
+        other = rng.choice(list(friend._friends)) if friend._friends else user
+        pairs.append((user, other))
+
+    run("suggest_friends", [user.suggest_friends for user in sample])
+    run("gen_network", [user.gen_network for user in sample])
+    run(
+        "get_friends_in_common",
+        [
+            (lambda user = user, other = other:
+                user.get_friends_in_common(other))
+            for user, other in pairs
+        ]
+    )
+
+    for result in results:
+        result["users"] = user_count
+        result["skew"] = skew
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Compare results against a baseline.
+
+    :param results: A list of results, as produced by `measure`.
+    :param baseline: A list of results from a previous run.
+    :param tolerance: The maximum accepted relative increase of each metric
+        in `COMPARED_METRICS` (0.2 accepts increases of up to 20%).
+    :return: A list of (result, metric, baseline value, current value)
+        tuples, one for each regression.
+    """
+    previous = dict(
+        ((item["entry_point"], item["users"], item["skew"]), item)
+        for item in baseline
+    )
+    regressions = []
+
+    for result in results:
+        item = previous.get(
+            (result["entry_point"], result["users"], result["skew"])
+        )
+        if item is None:
+            continue
+        for metric in COMPARED_METRICS:
+            old = item.get(metric)
+            new = result[metric]
+            if old and new > old * (1 + tolerance):
+                regressions.append((result, metric, old, new))
+
+    return regressions
+
+
+def main(argv = None):
+    parser = ArgumentParser(description = __doc__.split("\n")[0])
+    parser.add_argument("--sizes", type = int, nargs = "+",
+        default = [1000, 10000, 100000, 1000000],
+        help = "the numbers of users to measure")
+    parser.add_argument("--skews", choices = SKEWS, nargs = "+",
+        default = list(SKEWS),
+        help = "the distributions of friends per user to measure")
+    parser.add_argument("--exponent", type = float, default = 2.1,
+        help = "the exponent of the power law distribution")
+    parser.add_argument("--samples", type = int, default = 1000,
+        help = "the number of users to call each entry point for")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--output",
+        help = "write the results to this file, as JSON")
+    parser.add_argument("--baseline",
+        help = "compare the results against this JSON file")
+    parser.add_argument("--tolerance", type = float, default = 0.2,
+        help = "the accepted relative increase of each metric when "
+            "comparing against a baseline")
+    parser.add_argument("--single", action = "store_true",
+        help = "measure a single size and skew, in this process, and "
+            "output the results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.single:
+        print json.dumps(measure(
+            args.sizes[0],
+            args.skews[0],
+            args.samples,
+            args.exponent,
+            args.seed
+        ))
+        return
+
+    results = []
+    for size in args.sizes:
+        for skew in args.skews:
+            output = subprocess.check_output([
+                sys.executable, "-m", "recomendalia.benchmarks.hotpaths",
+                "--single",
+                "--sizes", str(size),
+                "--skews", skew,
+                "--exponent", str(args.exponent),
+                "--samples", str(args.samples),
+                "--seed", str(args.seed)
+            ])
+            results.extend(json.loads(output))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent = 4)
+
+    print "%-22s %9s %-9s %10s %10s %10s %12s %10s" % (
+        "entry point", "users", "skew", "p50 ms", "p90 ms", "p99 ms",
+        "calls/s", "peak MB"
+    )
+    for result in results:
+        print "%-22s %9d %-9s %10.3f %10.3f %10.3f %12.1f %10.1f" % (
+            result["entry_point"],
+            result["users"],
+            result["skew"],
+            result["p50"] * 1000,
+            result["p90"] * 1000,
+            result["p99"] * 1000,
+            result["throughput"],
+            result["peak_memory"] / 1048576.0
+        )
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        for result, metric, old, new in regressions:
+            print "Regression: %s (%d users, %s) %s %.6g -> %.6g (%+.0f%%)" % (
+                result["entry_point"],
+                result["users"],
+                result["skew"],
+                metric,
+                old,
+                new,
+                (float(new) / old - 1) * 100
+            )
+        if regressions:
+            sys.exit(1)
+        print "No regressions"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#-*- coding: utf-8 -*-
+u"""Measures the memory used by users, friendships and ratings.
+
+The benchmark builds synthetic data sets of increasing size, both with the
+current data model and with a replica of the original one (plain objects with
+a ``__dict__``, and a `Rating` object referenced from two dictionaries for
+each rating). It reports the resident memory used per user (including its
+friendships) and per rating.
+
+Each measurement runs in a separate process, so that memory freed by one data
+set doesn't skew the next. Usage::
+
+    python -m recomendalia.benchmarks.memory [--sizes 100000 1000000]
+"""
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+LAYOUTS = ("legacy", "compact")
+
+
+def memory_usage():
+    """Return the resident memory of the current process, in bytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError):
+        import resource
+        # Peak usage, in kilobytes on Linux and bytes on macOS
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+
+
+class LegacyUser(object):
+    # A replica of the original User layout
+
+    def __init__(self, name):
+        self.name = name
+        self._friends = set()
+        self._ratings = {}
+
+    def befriend(self, user):
+        self._friends.add(user)
+        user._friends.add(self)
+
+
+class LegacyConcept(object):
+    # A replica of the original Concept layout
+
+    def __init__(self, name):
+        self.name = name
+        self._ratings = {}
+        self._relations = []
+        self._referrers = []
+
+
+class LegacyRating(object):
+    # A replica of the original Rating layout
+
+    def __init__(self, user, concept, score):
+        self.__user = user
+        self.__concept = concept
+        self.__score = score
+        user._ratings[concept] = self
+        concept._ratings[user] = self
+
+
+def measure(layout, user_count, friends, ratings, concept_count, seed):
+    """Build a data set with the given layout and measure its memory usage.
+
+    :return: A dictionary with the number of users and ratings created, and
+        the bytes used per user and per rating.
+    """
+    rng = random.Random(seed)
+
+    if layout == "legacy":
+        user_factory = LegacyUser
+        concept_factory = LegacyConcept
+        rating_factory = LegacyRating
+        finish = lambda: None
+    else:
+        from recomendalia.registry import Registry
+        from recomendalia.user import User
+        from recomendalia.concept import Concept
+        from recomendalia.rating import Rating
+        registry = Registry()
+        user_factory = lambda name: User(name, registry)
+        concept_factory = lambda name: Concept(name, registry)
+        rating_factory = Rating
+        finish = registry.ratings.compact
+
+    concepts = [
+        concept_factory(u"Concept %d" % i)
+        for i in xrange(concept_count)
+    ]
+
+    gc.collect()
+    start = memory_usage()
+
+    users = [user_factory(u"User %d" % i) for i in xrange(user_count)]
+    for user in users:
+        for i in xrange(friends // 2):
+            friend = users[rng.randrange(user_count)]
+            if friend is not user:
+                user.befriend(friend)
+
+    gc.collect()
+    after_users = memory_usage()
+
+    rating_count = 0
+    for user in users:
+        for concept in rng.sample(concepts, ratings):
+            rating_factory(user, concept, rng.randint(0, 5))
+            rating_count += 1
+    finish()
+
+    gc.collect()
+    after_ratings = memory_usage()
+
+    return {
+        "layout": layout,
+        "users": user_count,
+        "ratings": rating_count,
+        "bytes_per_user": float(after_users - start) / user_count,
+        "bytes_per_rating": float(after_ratings - after_users) / rating_count
+    }
+
+
+def main(argv = None):
+    parser = ArgumentParser(description = __doc__.split("\n")[0])
+    parser.add_argument("--sizes", type = int, nargs = "+",
+        default = [100000, 1000000],
+        help = "the numbers of users to measure")
+    parser.add_argument("--friends", type = int, default = 16,
+        help = "the average number of friends per user")
+    parser.add_argument("--ratings", type = int, default = 10,
+        help = "the number of ratings per user")
+    parser.add_argument("--concepts", type = int, default = 1000,
+        help = "the number of concepts")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--layout", choices = LAYOUTS,
+        help = "measure a single layout and size, in this process")
+    parser.add_argument("--json", action = "store_true",
+        help = "output the results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.layout:
+        print json.dumps(measure(
+            args.layout,
+            args.sizes[0],
+            args.friends,
+            args.ratings,
+            args.concepts,
+            args.seed
+        ))
+        return
+
+    results = []
+    for size in args.sizes:
+        for layout in LAYOUTS:
+            output = subprocess.check_output([
+                sys.executable, "-m", "recomendalia.benchmarks.memory",
+                "--layout", layout,
+                "--sizes", str(size),
+                "--friends", str(args.friends),
+                "--ratings", str(args.ratings),
+                "--concepts", str(args.concepts),
+                "--seed", str(args.seed)
+            ])
+            results.append(json.loads(output))
+
+    if args.json:
+        print json.dumps(results, indent = 4)
+        return
+
+    print "%-8s %10s %12s %16s %18s" % (
+        "layout", "users", "ratings", "bytes/user", "bytes/rating"
+    )
+    for result in results:
+        print "%-8s %10d %12d %16.1f %18.1f" % (
+            result["layout"],
+            result["users"],
+            result["ratings"],
+            result["bytes_per_user"],
+            result["bytes_per_rating"]
+        )
+
+
+if __name__ == "__main__":
+    main()
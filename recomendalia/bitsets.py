@@ -0,0 +1,263 @@
+#-*- coding: utf-8 -*-
+u"""Friend sets stored as bitsets, for word level intersections.
+
+The `FriendBitsets` class keeps, for every user, a row of 64 bit words with
+one bit per user id, set for each of its friends. Intersecting the friends of
+two users is then a vectorized AND followed by a population count, instead of
+a Python membership test for each friend. Only the words where the user being
+served has friends are read, so the cost of an intersection is bounded by the
+user's number of friends, not by the number of users.
+
+Counting the friends in common with every friend of a friend adds up the
+unpacked rows of the user's friends, so its cost is proportional to the
+number of friends of the user times the number of users, regardless of how
+many friends those friends have. In graphs of a few tens of thousands of
+users this is several times faster than the set based traversal of
+`recomendalia.network` for typical users and for the neighbours of hubs, and
+on par for the hubs themselves, but the advantage shrinks as the number of
+users grows. The ``recomendalia.benchmarks.bitsets`` script compares both.
+
+Rows span every user id, so the index takes ``n * n / 8`` bytes for *n*
+users (about 50 MB for 20,000 users, 1.25 GB for 100,000).
+
+This module requires NumPy.
+"""
+import numpy as np
+
+#: The maximum number of words read at once when intersecting rows. Bounds
+#: the memory used by each query.
+BLOCK_BUDGET = 1 << 20
+
+_ONE = np.uint64(1)
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0f0f0f0f0f0f0f0f)
+_H01 = np.uint64(0x0101010101010101)
+_S1 = np.uint64(1)
+_S2 = np.uint64(2)
+_S4 = np.uint64(4)
+_S7 = np.uint64(7)
+_S56 = np.uint64(56)
+
+
+class FriendBitsets(object):
+    """An index of the friend sets of users, stored as bitsets.
+
+    The index can be passed to `User.suggest_friends`, as an alternative to
+    traversing the network of the user::
+
+        bitsets = FriendBitsets.from_users(users)
+        bitsets.attach()
+        user.suggest_friends(index = bitsets)
+
+    Both the counts of friends in common and the
+    `FriendSuggestion.friendsincommon` lists are then obtained from the
+    bitsets. The `User.friends` sets are left untouched, and remain the
+    authoritative data.
+    """
+
+    def __init__(self):
+        """Create an empty index."""
+        self._rows = np.zeros((0, 0), dtype = np.uint64)
+
+    @classmethod
+    def from_users(cls, users):
+        """Create an index containing the friend sets of the given users.
+
+        Candidates are counted from their own rows, so the index should
+        contain every user that may be suggested (usually, all the users in
+        a `Registry`).
+        """
+        users = list(users)
+        index = cls()
+        if users:
+            index._reserve(max(user.id for user in users))
+        for user in users:
+            index.update_user(user)
+        return index
+
+    def attach(self):
+        """Start updating the index with every change in friendships."""
+        from recomendalia.user import User
+        if self.update not in User.listeners:
+            User.listeners.append(self.update)
+
+    def detach(self):
+        """Stop updating the index with changes in friendships."""
+        from recomendalia.user import User
+        if self.update in User.listeners:
+            User.listeners.remove(self.update)
+
+    def update(self, a, b, befriended):
+        """Update the index after a friendship is established or ended.
+
+        :param a: One of the users involved in the friendship.
+        :param b: The other user involved in the friendship.
+        :param befriended: True if the friendship was established, False if it
+            was ended.
+        """
+        self._reserve(max(a.id, b.id))
+        for user, friend in ((a, b), (b, a)):
+            word = friend.id >> 6
+            bit = _bits(friend.id)
+            if befriended:
+                self._rows[user.id, word] |= bit
+            else:
+                self._rows[user.id, word] &= ~bit
+
+    def update_user(self, user):
+        """Rebuild the row of a user from its current friends."""
+        ids = np.array(
+            [friend.id for friend in user._friends],
+            dtype = np.int64
+        )
+        self._reserve(max(ids.max() if len(ids) else 0, user.id))
+        row = self._rows[user.id]
+        row[:] = 0
+        if len(ids):
+            np.bitwise_or.at(row, ids >> 6, _bits(ids))
+
+    def friend_ids(self, user):
+        """Obtain the ids of the friends of a user, in ascending order."""
+        words, mine = self._words(user)
+        return _members(mine, words)
+
+    def count_in_common(self, a, b):
+        """Count the friends that two users have in common."""
+        words, mine = self._words(a)
+        if b.id >= len(self._rows) or not len(words):
+            return 0
+        return int(_popcount(self._rows[b.id, words] & mine).sum())
+
+    def list_friends_in_common(self, user, candidates):
+        """Obtain the friends that a user has in common with each of the given
+        candidates.
+
+        :param user: The `User` to compare the candidates with.
+        :param candidates: A sequence of `User` objects.
+        :return: A list with a list of `User` objects for each candidate, in
+            ascending order of id.
+        """
+        words, mine = self._words(user)
+        ids = np.array(
+            [candidate.id for candidate in candidates],
+            dtype = np.int64
+        )
+        known = ids < len(self._rows)
+        if not len(words) or not known.any():
+            return [[] for candidate in candidates]
+
+        block = np.zeros((len(ids), len(words)), dtype = np.uint64)
+        block[known] = self._rows[np.ix_(ids[known], words)]
+        block &= mine
+        rows, positions = np.nonzero(
+            np.unpackbits(block.view(np.uint8), axis = 1)
+        )
+        members = (words[positions >> 6] * 64 + (positions & 63)).tolist()
+
+        users = user.registry.users
+        result = [[] for candidate in candidates]
+        for row, member in zip(rows.tolist(), members):
+            result[row].append(users[member])
+        return result
+
+    def mutual_friend_counts(self, user):
+        """Count the friends that the given user has in common with each of the
+        friends of its friends.
+
+        The rows of the user's friends are unpacked and added up, in blocks,
+        giving the number of friends in common with every user at once.
+
+        :return: A tuple with an array of candidate user ids, in ascending
+            order, and an array with the number of friends each of them has
+            in common with the user.
+        """
+        friends = self.friend_ids(user)
+        rows = self._rows
+        totals = np.zeros(rows.shape[1] * 64, dtype = np.int32)
+
+        # Add up blocks of at most 255 rows as bytes, which can't overflow
+        step = min(max(BLOCK_BUDGET // max(rows.shape[1], 1), 1), 255)
+        for start in xrange(0, len(friends), step):
+            bits = np.unpackbits(
+                rows[friends[start:start + step]].view(np.uint8),
+                axis = 1
+            )
+            totals += bits.sum(axis = 0, dtype = np.uint8)
+
+        # Discard the user and its current friends
+        totals[friends] = 0
+        totals[user.id] = 0
+
+        candidates = np.flatnonzero(totals)
+        return candidates, totals[candidates].astype(np.int64)
+
+    def top_candidates(self, user, count, min_friends_in_common = 1):
+        """Select the users with the most friends in common with the given
+        user.
+
+        :return: A list of (candidate, friends in common) tuples, ordered by
+            decreasing number of friends in common (and by id, for candidates
+            with the same number), like `recomendalia.network.top_candidates`.
+        """
+        candidates, counts = self.mutual_friend_counts(user)
+        selected = np.flatnonzero(counts >= max(min_friends_in_common, 1))
+        order = selected[
+            np.argsort(-counts[selected], kind = "mergesort")[:count]
+        ]
+        users = user.registry.users
+        return [
+            (users[candidate], common)
+            for candidate, common in zip(
+                candidates[order].tolist(),
+                counts[order].tolist()
+            )
+        ]
+
+    def _reserve(self, user_id):
+        # Grow the matrix (doubling its capacity) to hold the given id
+        size, width = self._rows.shape
+        if user_id < size:
+            return
+        capacity = max(size * 2, user_id + 1, 64)
+        rows = np.zeros((capacity, (capacity + 63) >> 6), dtype = np.uint64)
+        rows[:size, :width] = self._rows
+        self._rows = rows
+
+    def _words(self, user):
+        # The indices and values of the non empty words in a user's row
+        if user.id >= len(self._rows):
+            return (
+                np.zeros(0, dtype = np.int64),
+                np.zeros(0, dtype = np.uint64)
+            )
+        row = self._rows[user.id]
+        words = np.flatnonzero(row)
+        return words, row[words]
+
+
+def _popcount(words):
+    # Count the bits set in each element of an array of 64 bit words
+    words = words - ((words >> _S1) & _M1)
+    words = (words & _M2) + ((words >> _S2) & _M2)
+    words = (words + (words >> _S4)) & _M4
+    return (words * _H01) >> _S56
+
+
+def _bits(ids):
+    # The word masks for the given ids. Bits are laid out so that unpacking
+    # the bytes of a row (most significant bit first, little endian words)
+    # yields them in the order of their ids.
+    ids = np.asarray(ids, dtype = np.uint64)
+    return _ONE << ((ids & _S56) | (_S7 - (ids & _S7)))
+
+
+def _members(values, words):
+    # The ids of the bits set in the given words, in ascending order
+    values = np.ascontiguousarray(values, dtype = "<u8")
+    if not len(values):
+        return np.zeros(0, dtype = np.int64)
+    rows, positions = np.nonzero(
+        np.unpackbits(values.view(np.uint8)).reshape(len(values), 64)
+    )
+    return np.asarray(words, dtype = np.int64)[rows] * 64 + positions
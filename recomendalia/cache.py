@@ -0,0 +1,150 @@
+#-*- coding: utf-8 -*-
+u"""Module for the `SuggestionCache` class.
+"""
+from collections import OrderedDict
+from recomendalia import instrumentation
+
+
+class SuggestionCache(object):
+    """A least recently used cache for the suggestions produced for users.
+
+    The cache stores the results of `User.suggest_friends` and
+    `User.suggest_concepts`, keyed by user and by the arguments of the call.
+    Each entry is tagged with the versions of the data it was computed from,
+    and it is discarded as soon as any of them changes:
+
+        - Friend suggestions depend on the `User.version` of their user, which
+          changes whenever the user or one of its friends makes a new friend,
+          or when the user rates a concept.
+
+        - Concept suggestions also depend on the ratings of other users.
+          Collaborative filtering suggestions are tagged with the versions of
+          the concepts rated by the user (see
+          `RatingStore.concept_version`), which change when those concepts
+          are rated, or when their raters rate other concepts. Ratings by
+          users that share no concept with the user only change the norms of
+          candidate concepts, and are not tracked.
+
+        - Popular concepts, served to users with few ratings, are tagged with
+          the `PopularityRanking.version` of the registry's rankings, which
+          is only updated when the rankings are rebuilt.
+
+        - Suggestions from a recommender are tagged with the value returned
+          by its ``cache_tag(user)`` method, if it has one (see
+          `PopularityRanking`, `ContentRecommender` and `Embeddings`).
+          Otherwise they are tagged with the version of the registry's
+          `RatingStore` and with its number of relations, since they may
+          depend on any rating or relation.
+
+    Apart from the case noted above, stale entries are never served. The
+    `hits`, `misses` and `evictions` attributes count cache events; see also
+    the `stats` method. Hits and misses are also reported to the installed
+    `recomendalia.instrumentation.Recorder`, if any.
+
+    Cached results are shared between callers, and must not be modified.
+    """
+
+    def __init__(self, size = 10000):
+        """Create a new cache.
+
+        :param size: The maximum number of entries kept by the cache. Least
+            recently used entries are evicted to make room for new ones.
+        """
+        self.size = size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Remove all the entries in the cache."""
+        self._entries.clear()
+
+    def stats(self):
+        """Obtain the cache statistics.
+
+        :return: A dictionary with the number of entries, hits, misses and
+            evictions, and the hit ratio.
+        """
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": float(self.hits) / requests if requests else 0.0
+        }
+
+    def suggest_friends(self, user, *args, **kwargs):
+        """A cached version of `User.suggest_friends`."""
+        return self._get(
+            "suggest_friends",
+            ("friends", user, args, tuple(sorted(kwargs.iteritems()))),
+            (user._version,),
+            user.suggest_friends,
+            args,
+            kwargs
+        )
+
+    def suggest_concepts(self, user, *args, **kwargs):
+        """A cached version of `User.suggest_concepts`."""
+        return self._get(
+            "suggest_concepts",
+            ("concepts", user, args, tuple(sorted(kwargs.iteritems()))),
+            (user._version, _concepts_tag(user, args, kwargs)),
+            user.suggest_concepts,
+            args,
+            kwargs
+        )
+
+    def _get(self, operation, key, versions, compute, args, kwargs):
+        entries = self._entries
+        entry = entries.pop(key, None)
+        hit = entry is not None and entry[0] == versions
+
+        recorder = instrumentation.recorder
+        if recorder is not None:
+            recorder.cache_lookup(operation, hit)
+
+        if hit:
+            self.hits += 1
+            entries[key] = entry
+            return entry[1]
+
+        self.misses += 1
+        result = compute(*args, **kwargs)
+        entries[key] = (versions, result)
+
+        while len(entries) > self.size:
+            entries.popitem(last = False)
+            self.evictions += 1
+
+        return result
+
+
+def _concepts_tag(user, args, kwargs):
+    # The version of the data that the concept suggestions of a user depend
+    # on, besides the user's own ratings (see SuggestionCache)
+    if len(args) > 2:
+        recommender = args[2]
+    else:
+        recommender = kwargs.get("recommender")
+
+    registry = user.registry
+    store = registry.ratings
+
+    if recommender is None:
+        if len(user._ratings) < user.COLD_START_RATINGS:
+            return registry.popularity.cache_tag(user)
+        return store.concepts_version(
+            concept.id
+            for concept in user._ratings
+        )
+    elif hasattr(recommender, "cache_tag"):
+        return recommender.cache_tag(user)
+
+    return (store.version, len(registry.relations))
@@ -0,0 +1,641 @@
+#-*- coding: utf-8 -*-
+u"""An append only log of the changes made to a data set.
+
+Creating users, concepts, ratings and relations, and establishing or ending
+friendships, only changes objects in memory. A `ChangeLog` attached to a
+`Registry` records each of those changes in a binary file, numbered with an
+increasing sequence number, so that:
+
+    - A data set can be restored by loading a snapshot and replaying the
+      changes logged after it (see `ChangeLog.checkpoint` and
+      `ChangeLog.replay`).
+    - Derived indexes that saved their own state, along with the sequence
+      number it reflects, can catch up with the changes made since then,
+      instead of being rebuilt from scratch (see `ChangeLog.subscribe`).
+
+Changes made in bulk (`BulkLoader`, `RatingStore.merge`, loading a snapshot)
+don't go through the listeners that the log relies on, and aren't logged.
+
+The file starts with a fixed header (`MAGIC`, the format version, and the
+`base` and `compacted` sequence numbers, see `ChangeLog.compact`), followed
+by the records. Each record has a header with the size of its payload, a
+CRC32 checksum, its sequence number and its kind, all little endian. A
+record that was only partially written when the process stopped fails its
+checksum, and is discarded when the log is opened again.
+
+Writes are buffered, and the file is synced to disk every `sync_every`
+records or `sync_interval` seconds, whichever comes first: a crash may lose
+the changes logged since the last sync, but never corrupts the log.
+"""
+import os
+import struct
+import threading
+from collections import namedtuple
+from timeit import default_timer
+from zlib import crc32
+from recomendalia.registry import Registry
+from recomendalia.user import User
+from recomendalia.concept import Concept
+from recomendalia.rating import Rating
+from recomendalia.relation import Relation
+
+MAGIC = b"RCMDLOG\0"
+FORMAT_VERSION = 1
+
+#: Change kinds.
+USER = 1
+CONCEPT = 2
+FRIENDSHIP = 3
+RATING = 4
+RELATION = 5
+
+_HEADER = struct.Struct("<8sIQQ")
+_RECORD = struct.Struct("<IIQB")
+_ID = struct.Struct("<I")
+_FRIENDSHIP = struct.Struct("<IIB")
+_RATING = struct.Struct("<IIBB")
+_RELATION = struct.Struct("<III")
+_NO_SCORE = 255
+
+
+#: A logged change. The values depend on its kind:
+#:
+#:     USER, CONCEPT:
+#:         (id, name)
+#:     FRIENDSHIP:
+#:         (user id, user id, befriended)
+#:     RATING:
+#:         (user id, concept id, score, previous score or None)
+#:     RELATION:
+#:         (relation id, source id, relation type, target id)
+Change = namedtuple("Change", ("sequence", "kind", "values"))
+
+
+class ChangeLog(object):
+    """An append only log of the changes made to the objects of a `Registry`.
+
+    Logging is opt in: call `attach` to start recording changes::
+
+        log = ChangeLog("data.log", registry)
+        log.attach()
+
+    To restore the data set after a restart, load the last snapshot taken
+    with `checkpoint` and replay the changes logged after it::
+
+        snapshot = load_snapshot("data.snap")
+        log = ChangeLog("data.log", snapshot.registry)
+        log.replay(since = snapshot.sequence)
+        log.attach()
+
+    All the methods of the log are thread safe.
+
+    :ivar sequence: The sequence number of the last logged change.
+    :ivar base: Changes up to this sequence number have been discarded by
+        `compact`, and can't be replayed.
+    :ivar compacted: Changes up to this sequence number have been merged by
+        `compact`, and can't be delivered to subscribers.
+    """
+
+    def __init__(self,
+        path,
+        registry = None,
+        sync_every = 1000,
+        sync_interval = 1.0
+    ):
+        """Open a log, creating its file if it doesn't exist.
+
+        :param path: The path of the log file.
+        :param registry: The `Registry` whose changes are logged, and onto
+            which they are replayed. Defaults to `Registry.default`.
+        :param sync_every: The maximum number of changes written between
+            syncs to disk.
+        :param sync_interval: The maximum time between syncs to disk, in
+            seconds. It is checked whenever a change is logged.
+        :raise ValueError: If the file is not a change log, or was written
+            with an unsupported format version.
+        """
+        if registry is None:
+            registry = Registry.default
+        self.path = path
+        self.registry = registry
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._lock = threading.RLock()
+        self._subscriptions = []
+        self._replaying = False
+        self._file = None
+        self._open()
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.path)
+
+    def attach(self):
+        """Start logging the changes made to the registry."""
+        for listeners, listener in self._listeners():
+            if listener not in listeners:
+                listeners.append(listener)
+
+    def detach(self):
+        """Stop logging the changes made to the registry."""
+        for listeners, listener in self._listeners():
+            if listener in listeners:
+                listeners.remove(listener)
+
+    def close(self):
+        """Detach the log, sync it and close its file."""
+        self.detach()
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+    def sync(self):
+        """Write the buffered changes to the file and sync it to disk."""
+        with self._lock:
+            self._sync()
+
+    def changes(self, since = None):
+        """Iterate over the logged changes.
+
+        :param since: If given, only changes with a greater sequence number
+            are included.
+        :return: An iterable sequence of `Change` tuples, in ascending order
+            of sequence number.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            end = self._end
+        since = since or 0
+        with open(self.path, "rb") as file:
+            file.seek(_HEADER.size)
+            for change, offset in _read(file, end):
+                if change.sequence > since:
+                    yield change
+
+    def replay(self, since = None):
+        """Apply the logged changes to the registry.
+
+        Changes are applied through the usual constructors and methods, so
+        `User.listeners`, `Rating.listeners` and `Relation.listeners` are
+        notified, but the replayed changes aren't logged again.
+
+        :param since: The sequence number of the last change already present
+            in the registry, usually the `Snapshot.sequence` of the snapshot
+            it was loaded from. Defaults to 0 (the registry is empty).
+        :return: The number of changes applied.
+        :raise ValueError: If changes after `since` have been discarded, or if
+            the registry doesn't match the log (a new user, concept or
+            relation would get a different id than when it was logged).
+        """
+        since = since or 0
+        if since < self.base:
+            raise ValueError(
+                "Can't replay %r from sequence %d: changes up to %d have "
+                "been discarded" % (self.path, since, self.base)
+            )
+
+        registry = self.registry
+        users = registry.users
+        concepts = registry.concepts
+        applied = 0
+
+        with self._lock:
+            for subscription in self._subscriptions:
+                if subscription.position < since:
+                    raise ValueError(
+                        "Can't replay %r from sequence %d: a subscription "
+                        "is at sequence %d, and would miss changes"
+                        % (self.path, since, subscription.position)
+                    )
+
+            self._replaying = True
+            try:
+                for change in self.changes(since):
+                    kind = change.kind
+                    values = change.values
+                    if kind == USER:
+                        _check_id(change, len(users))
+                        User(values[1], registry)
+                    elif kind == CONCEPT:
+                        _check_id(change, len(concepts))
+                        Concept(values[1], registry)
+                    elif kind == FRIENDSHIP:
+                        a, b, befriended = values
+                        if befriended:
+                            users[a].befriend(users[b])
+                        else:
+                            users[a].unfriend(users[b])
+                    elif kind == RATING:
+                        Rating(
+                            users[values[0]],
+                            concepts[values[1]],
+                            values[2]
+                        )
+                    elif kind == RELATION:
+                        relation_id, source, relation_type, target = values
+                        _check_id(change, len(registry.relations))
+                        Relation(
+                            concepts[source],
+                            relation_type,
+                            concepts[target],
+                            _is_complementary = True
+                        )
+                    self._deliver(change, self._resolve(change))
+                    applied += 1
+            finally:
+                self._replaying = False
+
+        return applied
+
+    def subscribe(self, kind, listener, since = None):
+        """Deliver the changes of a kind to a listener, as they are logged or
+        replayed.
+
+        Listeners are called with the same arguments as the corresponding
+        listener lists: ``(a, b, befriended)`` for `FRIENDSHIP` changes (see
+        `User.listeners`), ``(rating, previous)`` for `RATING` changes (see
+        `Rating.listeners`) and ``(relation)`` for `RELATION` changes (see
+        `Relation.listeners`). The `update` methods of indexes such as
+        `recomendalia.network.MutualFriendIndex` or
+        `recomendalia.similarityindex.SimilarityIndex` can be subscribed
+        directly; they shouldn't also be attached, or they would receive
+        each change twice.
+
+        Indexes update themselves from the current state of the registry, so
+        they can only catch up while the changes they missed are replayed:
+        an index saved at a later sequence number than the snapshot the
+        registry was loaded from should subscribe before calling `replay`,
+        and it then receives the changes after its own sequence number
+        only::
+
+            index = load_index()    # saved at sequence 1200
+            snapshot = load_snapshot("data.snap")   # sequence 1000
+            log = ChangeLog("data.log", snapshot.registry)
+            log.subscribe(FRIENDSHIP, index.update, since = 1200)
+            log.replay(since = snapshot.sequence)
+            log.attach()
+
+        :param kind: `FRIENDSHIP`, `RATING` or `RELATION`.
+        :param listener: The callable to notify.
+        :param since: The sequence number of the last change reflected by the
+            listener. Defaults to the last logged change.
+        :return: A `Subscription`.
+        :raise ValueError: If changes after `since` have been merged or
+            discarded by `compact`; the listener's state must be rebuilt
+            instead.
+        """
+        if kind not in (FRIENDSHIP, RATING, RELATION):
+            raise ValueError("Can't subscribe to changes of kind %r" % kind)
+
+        with self._lock:
+            if since is None:
+                since = self.sequence
+            elif since < self.compacted:
+                raise ValueError(
+                    "Can't deliver the changes in %r since sequence %d: "
+                    "changes up to %d have been compacted"
+                    % (self.path, since, self.compacted)
+                )
+
+            subscription = Subscription(self, kind, listener, since)
+            self._subscriptions.append(subscription)
+
+        return subscription
+
+    def checkpoint(self, path):
+        """Save a snapshot of the registry, recording the sequence number of
+        the last logged change in it.
+
+        :param path: The path of the snapshot file.
+        :return: The sequence number recorded in the snapshot.
+        """
+        from recomendalia.snapshot import save_snapshot
+        with self._lock:
+            self._sync()
+            save_snapshot(path, self.registry, self.sequence)
+            return self.sequence
+
+    def compact(self, upto = None, discard = False):
+        """Shrink the log, by rewriting the changes up to a sequence number.
+
+        By default, changes are merged: only the last change to each
+        friendship and to each rating is kept (with its original sequence
+        number), which is enough to replay them onto an earlier snapshot.
+        Subscribers can no longer catch up from a sequence number before
+        `upto`, since they would miss the intermediate changes.
+
+        If `discard` is True, changes are removed altogether, and replaying
+        the log requires a snapshot taken at `upto` or later (see
+        `checkpoint`).
+
+        The log is written to a temporary file first, and then moved into
+        place.
+
+        :param upto: The sequence number of the last change to compact.
+            Defaults to the last logged change.
+        :param discard: Whether to remove changes instead of merging them.
+        :return: The number of records removed.
+        """
+        with self._lock:
+            if upto is None:
+                upto = self.sequence
+            upto = min(upto, self.sequence)
+
+            kept = []
+            latest = {}
+            previous_scores = {}
+            removed = 0
+
+            for change in self.changes():
+                if change.sequence > upto:
+                    kept.append(change)
+                    continue
+                if discard:
+                    removed += 1
+                    continue
+
+                kind = change.kind
+                if kind == FRIENDSHIP:
+                    key = (kind,) + tuple(sorted(change.values[:2]))
+                elif kind == RATING:
+                    key = (kind,) + change.values[:2]
+                    previous_scores.setdefault(key, change.values[3])
+                else:
+                    kept.append(change)
+                    continue
+
+                if key in latest:
+                    removed += 1
+                latest[key] = change
+
+            for key, change in latest.iteritems():
+                if key[0] == RATING:
+                    values = change.values[:3] + (previous_scores[key],)
+                    change = change._replace(values = values)
+                kept.append(change)
+            kept.sort(key = lambda change: change.sequence)
+
+            base = max(self.base, upto) if discard else self.base
+            compacted = max(self.compacted, upto)
+            self._sync()
+
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "wb") as file:
+                file.write(
+                    _HEADER.pack(MAGIC, FORMAT_VERSION, base, compacted)
+                )
+                for change in kept:
+                    file.write(_encode(change))
+                file.flush()
+                os.fsync(file.fileno())
+
+            self._file.close()
+            os.rename(temp_path, self.path)
+            self._open()
+            return removed
+
+    def _open(self):
+        # Open the file for appending, creating it or discarding a partially
+        # written record at its end
+        if not os.path.exists(self.path):
+            with open(self.path, "wb") as file:
+                file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, 0))
+                file.flush()
+                os.fsync(file.fileno())
+
+        with open(self.path, "rb") as file:
+            header = file.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError("%r is not a change log" % self.path)
+            magic, version, base, compacted = _HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError("%r is not a change log" % self.path)
+            if version != FORMAT_VERSION:
+                raise ValueError(
+                    "%r uses change log format version %d; expected version "
+                    "%d" % (self.path, version, FORMAT_VERSION)
+                )
+            sequence = max(base, compacted)
+            end = _HEADER.size
+            for change, end in _read(file):
+                sequence = change.sequence
+
+        self.base = base
+        self.compacted = compacted
+        self.sequence = sequence
+        self._end = end
+        self._file = open(self.path, "r+b")
+        self._file.truncate(end)
+        self._file.seek(end)
+        self._pending = 0
+        self._last_sync = default_timer()
+
+    def _sync(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = default_timer()
+
+    def _listeners(self):
+        return (
+            (Registry.listeners, self._object_added),
+            (User.listeners, self._friendship_changed),
+            (Rating.listeners, self._rating_added),
+            (Relation.listeners, self._relation_added)
+        )
+
+    def _object_added(self, registry, item):
+        if registry is self.registry:
+            kind = USER if isinstance(item, User) else CONCEPT
+            self._append(kind, (item.id, item.name))
+
+    def _friendship_changed(self, a, b, befriended):
+        if a.registry is self.registry:
+            self._append(
+                FRIENDSHIP,
+                (a.id, b.id, befriended),
+                a,
+                b,
+                befriended
+            )
+
+    def _rating_added(self, rating, previous):
+        user = rating.user
+        if user.registry is self.registry:
+            self._append(
+                RATING,
+                (
+                    user.id,
+                    rating.concept.id,
+                    rating.score,
+                    None if previous is None else previous.score
+                ),
+                rating,
+                previous
+            )
+
+    def _relation_added(self, relation):
+        source = relation.source
+        if source.registry is self.registry:
+            self._append(
+                RELATION,
+                (
+                    relation.id,
+                    source.id,
+                    relation.relation_type,
+                    relation.target.id
+                ),
+                relation
+            )
+
+    def _append(self, kind, values, *arguments):
+        with self._lock:
+            if self._replaying or self._file is None:
+                return
+            self.sequence += 1
+            change = Change(self.sequence, kind, values)
+            data = _encode(change)
+            self._file.write(data)
+            self._end += len(data)
+            self._pending += 1
+            if (
+                self._pending >= self.sync_every
+                or default_timer() - self._last_sync >= self.sync_interval
+            ):
+                self._sync()
+
+            self._deliver(change, arguments)
+
+    def _deliver(self, change, arguments):
+        for subscription in self._subscriptions:
+            if subscription.position < change.sequence:
+                if subscription.kind == change.kind:
+                    subscription.listener(*arguments)
+                subscription.position = change.sequence
+
+    def _resolve(self, change):
+        # The listener arguments for a logged change
+        registry = self.registry
+        kind = change.kind
+        values = change.values
+        if kind == FRIENDSHIP:
+            users = registry.users
+            return users[values[0]], users[values[1]], values[2]
+        elif kind == RATING:
+            user = registry.users[values[0]]
+            concept = registry.concepts[values[1]]
+            return (
+                Rating._view(user, concept, values[2]),
+                None if values[3] is None
+                else Rating._view(user, concept, values[3])
+            )
+        elif kind == RELATION:
+            return (registry.relations[values[0]],)
+        return ()
+
+
+class Subscription(object):
+    """The delivery of the changes in a `ChangeLog` to a listener.
+
+    :ivar position: The sequence number of the last change handled by the
+        subscription. Indexes that save their state can store it along, and
+        subscribe from it when they are loaded again.
+    """
+
+    def __init__(self, log, kind, listener, position):
+        self.log = log
+        self.kind = kind
+        self.listener = listener
+        self.position = position
+
+    def cancel(self):
+        """Stop delivering changes to the listener."""
+        with self.log._lock:
+            if self in self.log._subscriptions:
+                self.log._subscriptions.remove(self)
+
+
+def _check_id(change, expected):
+    if change.values[0] != expected:
+        raise ValueError(
+            "Can't replay change %d: it assigned id %d, but the registry "
+            "would assign id %d"
+            % (change.sequence, change.values[0], expected)
+        )
+
+
+def _encode(change):
+    kind = change.kind
+    values = change.values
+    if kind in (USER, CONCEPT):
+        payload = _ID.pack(values[0]) + values[1].encode("utf-8")
+    elif kind == FRIENDSHIP:
+        payload = _FRIENDSHIP.pack(*values)
+    elif kind == RATING:
+        payload = _RATING.pack(
+            values[0],
+            values[1],
+            values[2],
+            _NO_SCORE if values[3] is None else values[3]
+        )
+    else:
+        relation_id, source, relation_type, target = values
+        payload = _RELATION.pack(relation_id, source, target) \
+            + relation_type.encode("utf-8")
+    body = _RECORD.pack(0, 0, change.sequence, kind)[8:] + payload
+    return _RECORD.pack(
+        len(payload),
+        crc32(body) & 0xffffffff,
+        change.sequence,
+        kind
+    ) + payload
+
+
+def _decode(sequence, kind, payload):
+    if kind in (USER, CONCEPT):
+        values = (
+            _ID.unpack_from(payload)[0],
+            payload[_ID.size:].decode("utf-8")
+        )
+    elif kind == FRIENDSHIP:
+        a, b, befriended = _FRIENDSHIP.unpack(payload)
+        values = (a, b, bool(befriended))
+    elif kind == RATING:
+        user_id, concept_id, score, previous = _RATING.unpack(payload)
+        values = (
+            user_id,
+            concept_id,
+            score,
+            None if previous == _NO_SCORE else previous
+        )
+    else:
+        relation_id, source, target = _RELATION.unpack_from(payload)
+        values = (
+            relation_id,
+            source,
+            payload[_RELATION.size:].decode("utf-8"),
+            target
+        )
+    return Change(sequence, kind, values)
+
+
+def _read(file, end = None):
+    # Yield (change, end offset) pairs for the complete, valid records in a
+    # file, starting at its current position
+    offset = file.tell()
+    while end is None or offset < end:
+        header = file.read(_RECORD.size)
+        if len(header) < _RECORD.size:
+            return
+        size, checksum, sequence, kind = _RECORD.unpack(header)
+        payload = file.read(size)
+        if (
+            len(payload) < size
+            or crc32(header[8:] + payload) & 0xffffffff != checksum
+        ):
+            return
+        offset += _RECORD.size + size
+        yield _decode(sequence, kind, payload), offset
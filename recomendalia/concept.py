@@ -4,6 +4,7 @@ u"""Module for the `Concept` class.
 .. moduleauthor:: Martí Congost <marti.congost@whads.com>
 """
 from recomendalia.relation import Relation
+from recomendalia.registry import Registry
 
 
 class Concept(object):
@@ -17,14 +18,36 @@ class Concept(object):
           `Rating` class.
         - They can be related to other concepts, forming a graph. See the
           the `relations` and `referrers` properties, and the `Relation` class.
+          Related concepts can be looked up by relation type (see
+          `related_by` and `referred_by`), or through multiple steps (see
+          `related`).
+
+    Each concept belongs to a `Registry`, which assigns it a dense integer
+    `id`.
     """
-    name = None
+    __slots__ = (
+        "name",
+        "id",
+        "registry",
+        "_ratings",
+        "_relations",
+        "_referrers",
+        "_related_by",
+        "_referred_by",
+        "__weakref__"
+    )
 
-    def __init__(self, name, **relations):
+    def __init__(self, name, registry = None, **relations):
+        if registry is None:
+            registry = Registry.default
         self.name = name
-        self._ratings = {}
+        self.registry = registry
+        self.id = registry.add_concept(self)
+        self._ratings = registry.ratings.concept_ratings(self)
         self._relations = []
         self._referrers = []
+        self._related_by = {}
+        self._referred_by = {}
 
         for relation_type, target in relations.iteritems():
             if isinstance(target, Concept):
@@ -41,10 +64,23 @@ class Concept(object):
         """The ratings given to this concept by the users of the website.
 
         The property is expressed as a mapping of `Rating` objects, indexed by
-        `User`.
+        `User`. The mapping is a read only view over the `RatingStore` that
+        holds the ratings (see `recomendalia.ratingstore`).
         """
         return self._ratings
 
+    @property
+    def rating_stats(self):
+        """Aggregates of the scores given to this concept.
+
+        The property is expressed as a `recomendalia.ratingstore.RatingStats`
+        object, with the number of ratings, the sum of their scores, the sum
+        of their squares and a histogram of scores. Aggregates are maintained
+        as ratings are added or replaced, so reading them doesn't iterate over
+        the ratings.
+        """
+        return self.registry.ratings.concept_stats(self.id)
+
     @property
     def relations(self):
         """The list of concepts that this concept is related to.
@@ -63,3 +99,88 @@ class Concept(object):
         """
         return self._referrers
 
+
+    def related_by(self, relation_type):
+        """Obtain the concepts that this concept is related to through
+        relations of the given type.
+
+        :return: A tuple of `Concept` objects, in the order the relations were
+            created.
+        """
+        type_id = Relation.find_type_id(relation_type)
+        return tuple(self._related_by.get(type_id, ()))
+
+    def referred_by(self, relation_type):
+        """Obtain the concepts that refer to this concept through relations of
+        the given type.
+
+        :return: A tuple of `Concept` objects, in the order the relations were
+            created.
+        """
+        type_id = Relation.find_type_id(relation_type)
+        return tuple(self._referred_by.get(type_id, ()))
+
+    def related(self, type_path, max_depth = 1):
+        """Obtain the concepts reachable from this concept by following a
+        path of relation types.
+
+        For example, ``concept.related(("created_by", "creator_of"))`` gives
+        the other works of the creators of a concept, ``concept.related(
+        ("contained_by", "contains"))`` gives its siblings in the topic
+        hierarchy, and ``concept.related("contained_by", None)`` gives all
+        of its ancestors.
+
+        Results are memoized by the concept's `Registry`, until a new
+        relation is added.
+
+        :param type_path: A relation type, or a sequence of relation types to
+            follow in order.
+        :param max_depth: The maximum number of times the complete path is
+            followed, collecting the concepts reached after each repetition.
+            None follows the path until no new concepts are found.
+        :return: A tuple of `Concept` objects, excluding this concept, ordered
+            by the number of repetitions needed to reach them.
+        """
+        if isinstance(type_path, basestring):
+            type_path = (type_path,)
+        else:
+            type_path = tuple(type_path)
+
+        cache = self.registry.traversal_cache
+        key = (self, type_path, max_depth)
+        result = cache.get(key)
+        if result is None:
+            result = cache[key] = self._traverse(type_path, max_depth)
+        return result
+
+    def _traverse(self, type_path, max_depth):
+        type_ids = [Relation.find_type_id(step) for step in type_path]
+        if None in type_ids:
+            return ()
+
+        found = []
+        visited = set([self])
+        frontier = [self]
+        depth = 0
+
+        while frontier and (max_depth is None or depth < max_depth):
+            for type_id in type_ids:
+                step = []
+                seen = set()
+                for concept in frontier:
+                    for target in concept._related_by.get(type_id, ()):
+                        if target not in seen:
+                            seen.add(target)
+                            step.append(target)
+                frontier = step
+
+            frontier = [
+                concept
+                for concept in frontier
+                if concept not in visited
+            ]
+            visited.update(frontier)
+            found.extend(frontier)
+            depth += 1
+
+        return tuple(found)
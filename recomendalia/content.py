@@ -0,0 +1,146 @@
+#-*- coding: utf-8 -*-
+u"""Content-based concept suggestions.
+
+Instead of comparing the ratings of different users, the `ContentRecommender`
+class follows the relations between concepts: a user that liked a concept is
+likely to be interested in other works by the same creator, in the creator
+itself, or in other concepts filed under the same topic. Each of those
+connections is expressed as a path of relation types, traversed through
+`Concept.related` (which memoizes its results until relations change).
+"""
+from collections import defaultdict
+from heapq import nlargest
+from operator import itemgetter
+
+
+class ContentRecommender(object):
+    """A concept recommender based on the relations between concepts.
+
+    Instances can be passed to `User.suggest_concepts`::
+
+        user.suggest_concepts(recommender = ContentRecommender())
+
+    The concepts rated by the user with a score of at least `min_score` act as
+    seeds. Each concept reached from a seed through one of the `paths` gets
+    the weight of the path multiplied by the score of the seed, and the
+    contributions of all seeds are added up.
+
+    Besides the seeds that led to them, suggestions list the relations along
+    the paths from those seeds (see `ConceptSuggestion.relations`).
+    """
+    PATHS = (
+        # Other works by the same creator
+        (("created_by", "creator_of"), 1.0),
+        # The works of a creator
+        (("creator_of",), 0.75),
+        # The creator of a work
+        (("created_by",), 0.5),
+        # Other concepts under the same topic
+        (("contained_by", "contains"), 0.25)
+    )
+
+    def __init__(self, paths = None, min_score = 3):
+        """Create a new recommender.
+
+        :param paths: A sequence of (type path, weight) tuples, where each
+            type path is a sequence of relation types as accepted by
+            `Concept.related`. Defaults to `PATHS`.
+        :param min_score: The minimum score of the ratings used as seeds.
+        """
+        self.paths = self.PATHS if paths is None else paths
+        self.min_score = min_score
+
+    def cache_tag(self, user):
+        """Obtain the version of the data that the suggestions for a user
+        depend on, besides the user's own ratings, for `SuggestionCache`.
+
+        Suggestions only depend on the relations between concepts, which can
+        only be added.
+        """
+        return len(user.registry.relations)
+
+    def suggest_concepts(self, user, count = 8):
+        """Suggest concepts to a user.
+
+        :return: A list of (concept, score, contributors, relations) tuples,
+            ordered by decreasing score. Contributors are the seed concepts
+            that led to each suggestion, ordered by decreasing contribution.
+            Relations are the `Relation` objects along the paths from each
+            seed to the suggested concept, given as a callable, so that they
+            are only looked up when accessed.
+        """
+        rated = user._ratings
+        min_score = self.min_score
+        scores = defaultdict(float)
+        contributions = defaultdict(dict)
+
+        for seed, score in rated.iterscores():
+            if score < min_score:
+                continue
+            for type_path, weight in self.paths:
+                for concept in seed.related(type_path):
+                    if concept in rated:
+                        continue
+                    value = weight * score
+                    scores[concept] += value
+                    seeds = contributions[concept]
+                    seeds[seed] = seeds.get(seed, 0.0) + value
+
+        suggestions = []
+        for concept, score in nlargest(
+            count,
+            scores.iteritems(),
+            key = itemgetter(1)
+        ):
+            seeds = [
+                seed
+                for seed, value in sorted(
+                    contributions[concept].iteritems(),
+                    key = lambda item: -item[1]
+                )
+            ]
+            suggestions.append((
+                concept,
+                score,
+                seeds,
+                _Relations(concept, seeds, self.paths)
+            ))
+        return suggestions
+
+
+class _Relations(object):
+    # Lists the relations along the paths from the seeds of a suggestion to
+    # the suggested concept, when called
+
+    def __init__(self, concept, seeds, paths):
+        self.concept = concept
+        self.seeds = seeds
+        self.paths = paths
+
+    def __call__(self):
+        relations = []
+        seen = set()
+        for seed in self.seeds:
+            for type_path, weight in self.paths:
+                if isinstance(type_path, basestring):
+                    type_path = (type_path,)
+                path = _path(seed, self.concept, tuple(type_path))
+                for relation in path or ():
+                    if relation not in seen:
+                        seen.add(relation)
+                        relations.append(relation)
+        return relations
+
+
+def _path(source, target, type_path):
+    # The relations along a path of relation types from one concept to
+    # another, or None if the path doesn't lead to the target
+    if not type_path:
+        return [] if source is target else None
+    relation_type = type_path[0]
+    for relation in source._relations:
+        if relation.relation_type == relation_type:
+            rest = _path(relation.target, target, type_path[1:])
+            if rest is not None:
+                return [relation] + rest
+    return None
@@ -0,0 +1,355 @@
+#-*- coding: utf-8 -*-
+u"""Concept suggestions through matrix factorization.
+
+The `train_als` function factorizes the matrix of scores given by users to
+concepts into two sets of embeddings (one vector per user and one per
+concept), through alternating least squares (ALS): the predicted score of a
+concept for a user is the average score plus the dot product of their
+embeddings. Training is meant to run as a batch job (see `main`); the
+resulting `Embeddings` can be saved to a file and loaded by the serving
+processes.
+
+Serving scores every concept with a single matrix-vector product, and selects
+the best ones with a partial sort, so the cost of a request doesn't depend on
+the number of ratings in the data set.
+
+This module requires NumPy.
+"""
+import time
+from argparse import ArgumentParser
+import numpy as np
+from recomendalia.registry import Registry
+from recomendalia.rating import Rating
+from recomendalia.similarity import top_scores
+
+#: The maximum number of floats allocated at once to accumulate the normal
+#: equations of a block of rows, or the outer products of a chunk of
+#: ratings. Bounds the memory used by training.
+SOLVE_BUDGET = 1 << 22
+
+
+class Embeddings(object):
+    """User and concept embeddings, produced by `train_als`.
+
+    Instances can be passed to `User.suggest_concepts`::
+
+        user.suggest_concepts(recommender = embeddings)
+
+    Users and concepts are identified by their id in the `Registry` that the
+    embeddings were trained on. Users and concepts created after training
+    have no embedding: the former get no suggestions, and the latter are
+    never suggested.
+
+    :ivar user_factors: A matrix with one row for each user.
+    :ivar concept_factors: A matrix with one row for each concept.
+    :ivar mean: The average score of the training ratings.
+    """
+
+    def __init__(self, user_factors, concept_factors, mean):
+        self.user_factors = user_factors
+        self.concept_factors = concept_factors
+        self.mean = mean
+
+    def __repr__(self):
+        return "%s(%d users, %d concepts, rank %d)" % (
+            self.__class__.__name__,
+            len(self.user_factors),
+            len(self.concept_factors),
+            self.rank
+        )
+
+    @property
+    def rank(self):
+        """The number of dimensions of the embeddings."""
+        return self.concept_factors.shape[1]
+
+    def save(self, path):
+        """Save the embeddings to a NumPy ``.npz`` file."""
+        np.savez(
+            path,
+            user_factors = self.user_factors,
+            concept_factors = self.concept_factors,
+            mean = np.array(self.mean)
+        )
+
+    def predict(self, user_id):
+        """Predict the score that a user would give to every concept.
+
+        :param user_id: The id of the user.
+        :return: An array with the predicted score of each concept, indexed by
+            concept id.
+        """
+        predictions = self.concept_factors.dot(self.user_factors[user_id])
+        predictions += self.mean
+        np.clip(
+            predictions,
+            Rating.MIN_SCORE,
+            Rating.MAX_SCORE,
+            out = predictions
+        )
+        return predictions
+
+    def cache_tag(self, user):
+        """Obtain the version of the data that the suggestions for a user
+        depend on, besides the user's own ratings, for `SuggestionCache`.
+
+        Embeddings don't change once trained, so the tag is constant.
+        """
+        return None
+
+    def suggest_concepts(self, user, count = 8):
+        """Suggest the concepts with the highest predicted score for a user,
+        excluding the ones the user already rated.
+
+        :return: A list of (concept, predicted score, contributors) tuples,
+            ordered by decreasing predicted score. Embeddings don't explain
+            their predictions, so contributors are always empty.
+        """
+        if user.id >= len(self.user_factors):
+            return []
+
+        predictions = self.predict(user.id)
+        rated = [
+            concept.id
+            for concept in user._ratings
+            if concept.id < len(predictions)
+        ]
+        predictions[rated] = np.nan
+
+        concepts = user.registry.concepts
+        return [
+            (concepts[j], float(predictions[j]), [])
+            for j in top_scores(predictions, count).tolist()
+        ]
+
+
+def load_embeddings(path):
+    """Load embeddings saved by `Embeddings.save`."""
+    data = np.load(path)
+    return Embeddings(
+        data["user_factors"],
+        data["concept_factors"],
+        float(data["mean"])
+    )
+
+
+def train_als(registry = None, **kwargs):
+    """Factorize the scores of a registry through alternating least squares.
+
+    :param registry: The `Registry` holding the ratings. Defaults to
+        `Registry.default`.
+    :param kwargs: Parameters for `factorize`.
+    :return: An `Embeddings` object.
+    """
+    if registry is None:
+        registry = Registry.default
+
+    store = registry.ratings
+    return factorize(
+        np.frombuffer(store.user_ids, dtype = np.uint32),
+        np.frombuffer(store.concept_ids, dtype = np.uint32),
+        np.frombuffer(store.scores, dtype = np.uint8),
+        len(registry.users),
+        len(registry.concepts),
+        **kwargs
+    )
+
+
+def factorize(user_ids,
+    concept_ids,
+    scores,
+    user_count,
+    concept_count,
+    rank = 32,
+    regularization = 0.1,
+    iterations = 10,
+    seed = None,
+    progress = None
+):
+    """Factorize a score matrix, given as columns of ratings, through
+    alternating least squares.
+
+    Each iteration solves the regularized least squares problem of every user
+    (with the concept embeddings fixed), and then of every concept (with the
+    user embeddings fixed). The regularization of each row is scaled by its
+    number of ratings.
+
+    :param user_ids: An array with the user id of each rating.
+    :param concept_ids: An array with the concept id of each rating.
+    :param scores: An array with the score of each rating.
+    :param user_count: The number of users.
+    :param concept_count: The number of concepts.
+    :param rank: The number of dimensions of the embeddings.
+    :param regularization: The regularization factor.
+    :param iterations: The number of iterations.
+    :param seed: A seed for the random initialization of the embeddings.
+    :param progress: A callable, invoked after each iteration with the
+        iteration number and the root mean squared error on the training
+        ratings (see `rmse`).
+    :return: An `Embeddings` object.
+    """
+    users = np.asarray(user_ids, dtype = np.int64)
+    concepts = np.asarray(concept_ids, dtype = np.int64)
+    scores = np.asarray(scores, dtype = np.float64)
+    mean = scores.mean() if len(scores) else 0.0
+    residuals = scores - mean
+
+    by_user = _csr(users, concepts, residuals, user_count)
+    by_concept = _csr(concepts, users, residuals, concept_count)
+
+    rng = np.random.RandomState(seed)
+    embeddings = Embeddings(
+        np.zeros((user_count, rank)),
+        rng.normal(scale = 0.1, size = (concept_count, rank)),
+        mean
+    )
+
+    for iteration in xrange(iterations):
+        embeddings.user_factors = _solve(
+            embeddings.concept_factors,
+            by_user,
+            regularization
+        )
+        embeddings.concept_factors = _solve(
+            embeddings.user_factors,
+            by_concept,
+            regularization
+        )
+        if progress is not None:
+            progress(iteration + 1, rmse(embeddings, users, concepts, scores))
+
+    return embeddings
+
+
+def rmse(embeddings, user_ids, concept_ids, scores, block_size = 65536):
+    """Compute the root mean squared error of the predictions of a set of
+    embeddings.
+
+    :param user_ids: An array with the user of each rating.
+    :param concept_ids: An array with the concept of each rating.
+    :param scores: An array with the actual score of each rating.
+    :param block_size: The number of ratings to evaluate at once.
+    """
+    if not len(scores):
+        return 0.0
+
+    total = 0.0
+    for start in xrange(0, len(scores), block_size):
+        stop = start + block_size
+        predictions = (
+            embeddings.user_factors[user_ids[start:stop]]
+            * embeddings.concept_factors[concept_ids[start:stop]]
+        ).sum(axis = 1) + embeddings.mean
+        np.clip(
+            predictions,
+            Rating.MIN_SCORE,
+            Rating.MAX_SCORE,
+            out = predictions
+        )
+        total += ((predictions - scores[start:stop]) ** 2).sum()
+
+    return float(np.sqrt(total / len(scores)))
+
+
+def _csr(keys, columns, values, size):
+    # Group ratings by the given key column
+    order = np.argsort(keys, kind = "mergesort")
+    indptr = np.zeros(size + 1, dtype = np.int64)
+    np.cumsum(np.bincount(keys, minlength = size), out = indptr[1:])
+    return indptr, columns[order], values[order]
+
+
+def _solve(fixed, matrix, regularization):
+    # Solve the least squares problem of every row of a CSR score matrix,
+    # given the embeddings of its columns
+    indptr, columns, values = matrix
+    size = len(indptr) - 1
+    rank = fixed.shape[1]
+    counts = np.diff(indptr)
+    result = np.zeros((size, rank))
+    identity = np.eye(rank)
+
+    # Both the normal equations of a block of rows and the outer products of
+    # a chunk of ratings take at most SOLVE_BUDGET floats, regardless of the
+    # number of ratings in each row
+    step = max(SOLVE_BUDGET // (rank * rank), 1)
+
+    for start in xrange(0, size, step):
+        stop = min(start + step, size)
+        a = (
+            regularization
+            * np.maximum(counts[start:stop], 1)[:, np.newaxis, np.newaxis]
+            * identity
+        )
+        b = np.zeros((stop - start, rank))
+
+        # Add up the outer products of the ratings of each row, in chunks;
+        # reduceat sums the segments of consecutive ratings of the same row
+        for low in xrange(indptr[start], indptr[stop], step):
+            high = min(low + step, indptr[stop])
+            factors = fixed[columns[low:high]]
+            rows = np.searchsorted(
+                indptr,
+                np.arange(low, high),
+                side = "right"
+            ) - 1 - start
+            first = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            a[rows[first]] += np.add.reduceat(
+                factors[:, :, np.newaxis] * factors[:, np.newaxis, :],
+                first,
+                axis = 0
+            )
+            b[rows[first]] += np.add.reduceat(
+                factors * values[low:high, np.newaxis],
+                first,
+                axis = 0
+            )
+
+        result[start:stop] = np.linalg.solve(a, b[:, :, np.newaxis])[:, :, 0]
+
+    return result
+
+
+def main(argv = None):
+    parser = ArgumentParser(
+        description = "Train concept embeddings from a snapshot"
+    )
+    parser.add_argument("snapshot",
+        help = "the snapshot file to read ratings from")
+    parser.add_argument("output",
+        help = "the .npz file to write the embeddings to")
+    parser.add_argument("--rank", type = int, default = 32)
+    parser.add_argument("--regularization", type = float, default = 0.1)
+    parser.add_argument("--iterations", type = int, default = 10)
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args(argv)
+
+    from recomendalia.snapshot import load_snapshot
+    snapshot = load_snapshot(args.snapshot)
+
+    def progress(iteration, error):
+        print "Iteration %d: RMSE %.4f (%.1fs)" % (
+            iteration,
+            error,
+            time.time() - start
+        )
+
+    start = time.time()
+    embeddings = factorize(
+        snapshot.rating_users,
+        snapshot.rating_concepts,
+        snapshot.rating_scores,
+        snapshot.user_count,
+        snapshot.concept_count,
+        rank = args.rank,
+        regularization = args.regularization,
+        iterations = args.iterations,
+        seed = args.seed,
+        progress = progress
+    )
+    embeddings.save(args.output)
+    print "Saved %r to %s" % (embeddings, args.output)
+
+
+if __name__ == "__main__":
+    main()
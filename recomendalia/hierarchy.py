@@ -0,0 +1,230 @@
+#-*- coding: utf-8 -*-
+u"""Module for the `Hierarchy` class.
+"""
+from recomendalia.relation import Relation
+
+
+class Hierarchy(object):
+    """A precomputed index of the topic hierarchy formed by the **contains**
+    and **contained_by** relations between concepts.
+
+    The index numbers concepts in the order of a depth first traversal of the
+    hierarchy (see the `order` property), and stores the ancestors and
+    descendants of each concept as bitsets over those positions. This makes
+    ancestor checks constant time operations and allows enumerating the
+    concepts under a category as contiguous ranges of positions: when the
+    hierarchy is a tree, the descendants of a concept always form a single
+    range.
+
+    Concepts may belong to more than one category, but the hierarchy is
+    assumed to be acyclic.
+
+    The index discovers concepts by following relations from the concepts it
+    is given, and can be kept up to date by attaching it (see `attach`). New
+    relations mark the index as stale, and it is rebuilt on the next query.
+    """
+    PARENT_RELATION = "contained_by"
+    CHILD_RELATION = "contains"
+
+    def __init__(self, concepts = ()):
+        self._concepts = set()
+        self._stale = True
+        self.add(concepts)
+
+    def add(self, concepts):
+        """Include the given concepts, and those related to them, in the
+        index.
+        """
+        pending = list(concepts)
+        while pending:
+            concept = pending.pop()
+            if concept not in self._concepts:
+                self._concepts.add(concept)
+                pending.extend(self._children(concept))
+                pending.extend(self._parents(concept))
+                self._stale = True
+
+    def attach(self):
+        """Start updating the index with every new relation."""
+        if self.relation_added not in Relation.listeners:
+            Relation.listeners.append(self.relation_added)
+
+    def detach(self):
+        """Stop updating the index with new relations."""
+        if self.relation_added in Relation.listeners:
+            Relation.listeners.remove(self.relation_added)
+
+    def relation_added(self, relation):
+        """Take a new relation into account."""
+        if relation.relation_type in (
+            self.PARENT_RELATION,
+            self.CHILD_RELATION
+        ):
+            self._stale = True
+            self.add((relation.source, relation.target))
+
+    def _parents(self, concept):
+        return concept.related_by(self.PARENT_RELATION)
+
+    def _children(self, concept):
+        return concept.related_by(self.CHILD_RELATION)
+
+    def _build(self):
+        roots = [
+            concept
+            for concept in self._concepts
+            if not self._parents(concept)
+        ]
+        roots.sort(key = lambda concept: concept.name)
+
+        # Number concepts in preorder, and collect them in postorder
+        order = []
+        position = {}
+        postorder = []
+
+        for root in roots:
+            stack = [(root, iter(self._children(root)))]
+            position[root] = len(order)
+            order.append(root)
+            while stack:
+                concept, children = stack[-1]
+                for child in children:
+                    if child not in position:
+                        position[child] = len(order)
+                        order.append(child)
+                        stack.append((child, iter(self._children(child))))
+                        break
+                else:
+                    stack.pop()
+                    postorder.append(concept)
+
+        # Children are always completed before their parents
+        descendants = {}
+        for concept in postorder:
+            bits = 1 << position[concept]
+            for child in self._children(concept):
+                bits |= descendants[child]
+            descendants[concept] = bits
+
+        # Parents are always visited before their children
+        ancestors = {}
+        for concept in reversed(postorder):
+            bits = 1 << position[concept]
+            for parent in self._parents(concept):
+                bits |= ancestors[parent]
+            ancestors[concept] = bits
+
+        self._order = order
+        self._position = position
+        self._descendants = descendants
+        self._ancestors = ancestors
+        self._ranges = dict(
+            (concept, _bit_ranges(bits))
+            for concept, bits in descendants.iteritems()
+        )
+        self._stale = False
+
+    def _refresh(self):
+        if self._stale:
+            self._build()
+
+    @property
+    def order(self):
+        """The indexed concepts, in the order of a depth first traversal of
+        the hierarchy.
+
+        The property is expressed as a list of `Concept` objects.
+        """
+        self._refresh()
+        return self._order
+
+    def position(self, concept):
+        """Return the position of a concept in the `order` list."""
+        self._refresh()
+        return self._position[concept]
+
+    def is_under(self, concept, category, strict = True):
+        """Indicate if a concept is contained by a category, either directly
+        or through other categories.
+
+        :param strict: If False, a concept is also considered to be under
+            itself.
+        """
+        self._refresh()
+        if concept is category:
+            return not strict
+        position = self._position.get(concept)
+        ranges = self._ranges.get(category)
+        if position is None or ranges is None:
+            return False
+        if len(ranges) == 1:
+            start, stop = ranges[0]
+            return start <= position < stop
+        return bool(self._descendants[category] >> position & 1)
+
+    def ranges(self, category):
+        """Obtain the positions of the concepts under a category, itself
+        included.
+
+        :return: A list of (start, stop) tuples, giving contiguous ranges of
+            positions in the `order` list.
+        """
+        self._refresh()
+        return self._ranges[category]
+
+    def descendants(self, category):
+        """Obtain all the concepts under a category.
+
+        :return: A list of `Concept` objects, in the order of the `order`
+            property.
+        """
+        self._refresh()
+        order = self._order
+        descendants = [
+            concept
+            for start, stop in self._ranges[category]
+            for concept in order[start:stop]
+        ]
+        descendants.remove(category)
+        return descendants
+
+    def leaves(self, category):
+        """Obtain the concepts under a category that contain no other
+        concepts.
+        """
+        return [
+            concept
+            for concept in self.descendants(category)
+            if not self._children(concept)
+        ]
+
+    def ancestors(self, concept):
+        """Obtain all the categories that contain a concept.
+
+        :return: A list of `Concept` objects, in the order of the `order`
+            property.
+        """
+        self._refresh()
+        order = self._order
+        return [
+            order[position]
+            for start, stop in _bit_ranges(
+                self._ancestors[concept] & ~(1 << self._position[concept])
+            )
+            for position in xrange(start, stop)
+        ]
+
+
+def _bit_ranges(bits):
+    # Convert a bitset into a list of (start, stop) ranges of set bits
+    ranges = []
+    offset = 0
+    while bits:
+        zeros = (bits & -bits).bit_length() - 1
+        bits >>= zeros
+        offset += zeros
+        ones = (~bits & (bits + 1)).bit_length() - 1
+        ranges.append((offset, offset + ones))
+        bits >>= ones
+        offset += ones
+    return ranges
@@ -0,0 +1,397 @@
+#-*- coding: utf-8 -*-
+u"""Stage level instrumentation of the suggestion methods.
+
+`User.suggest_friends` and `User.suggest_concepts` are split into stages
+(counting candidates, ranking them, scoring concepts...). When a `Recorder`
+is installed, a sample of the calls to those methods is traced: the time
+spent in each stage and the size of the intermediate results are added to
+histograms, and the `SuggestionCache` reports its hits and misses for each
+method::
+
+    recorder = Recorder(sample_rate = 0.01, profile_threshold = 0.1)
+    recorder.install()
+    ...
+    print recorder.prometheus()
+
+Calls that are not sampled only pay for a random number, and when no recorder
+is installed (the default) the instrumented methods only check the module's
+`recorder` variable.
+
+Sampled calls can also be run under `cProfile`, keeping the profiles of the
+slowest calls over a threshold (see `Recorder.slow_calls`). Profiling slows
+down the sampled calls considerably, so it should be combined with a low
+sample rate.
+"""
+import os
+import threading
+from cProfile import Profile
+from heapq import heappush, heappushpop
+from random import Random
+from timeit import default_timer
+
+#: The installed `Recorder`, or None if instrumentation is disabled.
+recorder = None
+
+
+class LatencyHistogram(object):
+    """A thread safe histogram of latencies, with fixed buckets.
+
+    :ivar buckets: The upper bounds of the buckets, in seconds, in ascending
+        order. Latencies above the last bound are counted in an additional,
+        unbounded bucket.
+    """
+    BUCKETS = (
+        0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+        5.0, 10.0
+    )
+
+    def __init__(self, buckets = None):
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """Add a latency to the histogram."""
+        position = 0
+        for bound in self.buckets:
+            if seconds <= bound:
+                break
+            position += 1
+        with self._lock:
+            self._counts[position] += 1
+            self._sum += seconds
+
+    def snapshot(self):
+        """Obtain the current state of the histogram.
+
+        :return: A dictionary with the total number of observations
+            (``count``), their sum in seconds (``sum``) and a list of
+            [upper bound, cumulative count] pairs (``buckets``). The last
+            bucket has no upper bound (None).
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+
+        buckets = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (None,), counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+
+        return {"count": cumulative, "sum": total, "buckets": buckets}
+
+
+class Trace(object):
+    """The measurements taken during a sampled call.
+
+    Instrumented methods call `stage` at the end of each of their stages, and
+    `size` to record the size of intermediate results. Traces are context
+    managers: leaving the ``with`` block hands the measurements to the
+    `Recorder`.
+    """
+    __slots__ = (
+        "recorder",
+        "operation",
+        "stages",
+        "sizes",
+        "profiler",
+        "_start",
+        "_last"
+    )
+
+    def __init__(self, recorder, operation, profiler = None):
+        self.recorder = recorder
+        self.operation = operation
+        self.stages = []
+        self.sizes = []
+        self.profiler = profiler
+
+    def __enter__(self):
+        if self.profiler is not None:
+            self.profiler.enable()
+        self._start = self._last = default_timer()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        duration = default_timer() - self._start
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.recorder._record(self, duration, type is not None)
+
+    def stage(self, name):
+        """Attribute the time elapsed since the previous stage (or since the
+        start of the call) to the given stage.
+        """
+        now = default_timer()
+        self.stages.append((name, now - self._last))
+        self._last = now
+
+    def size(self, name, value):
+        """Record the size of an intermediate result."""
+        self.sizes.append((name, value))
+
+
+class Recorder(object):
+    """Collects the measurements of the instrumented suggestion methods.
+
+    Measurements are grouped by operation ("suggest_friends",
+    "suggest_concepts"). For each of them, the recorder keeps:
+
+        - The number of calls, sampled calls and failed sampled calls.
+        - A latency histogram for each stage, and for the whole call (as the
+          "total" stage).
+        - A histogram for each recorded size, such as the number of
+          candidates.
+        - The number of `SuggestionCache` hits and misses.
+
+    All the methods of the recorder are thread safe.
+    """
+    SIZE_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+    def __init__(self,
+        sample_rate = 0.01,
+        profile_threshold = None,
+        max_profiles = 10,
+        seed = None
+    ):
+        """Create a new recorder.
+
+        :param sample_rate: The fraction of calls that are traced.
+        :param profile_threshold: If given, sampled calls are run under
+            `cProfile`, and the profiles of those lasting at least this many
+            seconds are kept.
+        :param max_profiles: The maximum number of profiles kept. When there
+            are more slow calls, the profiles of the slowest ones are kept.
+        :param seed: A seed for the random sampling of calls.
+        """
+        self.sample_rate = sample_rate
+        self.profile_threshold = profile_threshold
+        self.max_profiles = max_profiles
+        self._random = Random(seed).random
+        self._lock = threading.Lock()
+        self._operations = {}
+        self._slow_calls = []
+        self._sequence = 0
+
+    def install(self):
+        """Start instrumenting the suggestion methods with this recorder."""
+        global recorder
+        recorder = self
+
+    def uninstall(self):
+        """Stop instrumenting the suggestion methods, if this recorder is the
+        installed one.
+        """
+        global recorder
+        if recorder is self:
+            recorder = None
+
+    def reset(self):
+        """Discard all the measurements taken so far."""
+        with self._lock:
+            self._operations = {}
+            self._slow_calls = []
+
+    def sample(self, operation):
+        """Count a call to an operation, and decide whether to trace it.
+
+        :return: A new `Trace`, or None if the call is not sampled.
+        """
+        stats = self._stats(operation)
+        with self._lock:
+            stats["calls"] += 1
+
+        if self.sample_rate < 1 and self._random() >= self.sample_rate:
+            return None
+
+        profiler = None
+        if self.profile_threshold is not None:
+            profiler = Profile()
+        return Trace(self, operation, profiler)
+
+    def cache_lookup(self, operation, hit):
+        """Count a `SuggestionCache` lookup for an operation."""
+        stats = self._stats(operation)
+        with self._lock:
+            stats["cache_hits" if hit else "cache_misses"] += 1
+
+    def stats(self):
+        """Obtain the measurements taken so far.
+
+        :return: A dictionary mapping each operation to a dictionary with its
+            ``calls``, ``sampled``, ``errors``, ``cache_hits`` and
+            ``cache_misses`` counts, and with ``stages`` and ``sizes``
+            dictionaries mapping names to histogram snapshots (see
+            `LatencyHistogram.snapshot`).
+        """
+        with self._lock:
+            operations = self._operations.items()
+            result = {}
+            for operation, stats in operations:
+                result[operation] = dict(
+                    (key, value)
+                    for key, value in stats.iteritems()
+                    if not isinstance(value, dict)
+                )
+
+        for operation, stats in operations:
+            for key in ("stages", "sizes"):
+                result[operation][key] = dict(
+                    (name, histogram.snapshot())
+                    for name, histogram in stats[key].items()
+                )
+
+        return result
+
+    def prometheus(self, prefix = "recomendalia"):
+        """Export the measurements in the Prometheus text format.
+
+        :param prefix: A prefix for the name of every metric.
+        :return: A string.
+        """
+        stats = self.stats()
+        lines = []
+
+        for key, help in (
+            ("calls", "Calls to the instrumented methods."),
+            ("sampled", "Traced calls to the instrumented methods."),
+            ("errors", "Traced calls that raised an exception."),
+            ("cache_hits", "Suggestion cache hits."),
+            ("cache_misses", "Suggestion cache misses.")
+        ):
+            name = "%s_%s_total" % (prefix, key)
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s counter" % name)
+            for operation in sorted(stats):
+                lines.append('%s{operation="%s"} %d' % (
+                    name,
+                    operation,
+                    stats[operation][key]
+                ))
+
+        for key, label, help in (
+            ("stages", "stage", "Time spent in each stage, in seconds."),
+            ("sizes", "name", "Size of intermediate results.")
+        ):
+            name = "%s_%s" % (
+                prefix,
+                "stage_seconds" if key == "stages" else "result_size"
+            )
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s histogram" % name)
+            for operation in sorted(stats):
+                histograms = stats[operation][key]
+                for item in sorted(histograms):
+                    labels = 'operation="%s",%s="%s"' % (
+                        operation,
+                        label,
+                        item
+                    )
+                    _histogram_lines(lines, name, labels, histograms[item])
+
+        lines.append("")
+        return "\n".join(lines)
+
+    def slow_calls(self):
+        """Obtain the profiles of the slowest sampled calls.
+
+        Profiles are only taken if the recorder was created with a
+        `profile_threshold`.
+
+        :return: A list of (operation, duration, profile) tuples, ordered by
+            decreasing duration. Profiles are `cProfile.Profile` objects,
+            which can be inspected with the `pstats` module.
+        """
+        with self._lock:
+            calls = sorted(self._slow_calls, reverse = True)
+        return [
+            (operation, duration, profile)
+            for duration, sequence, operation, profile in calls
+        ]
+
+    def dump_profiles(self, directory):
+        """Write the profiles of the slowest sampled calls to a directory, in
+        the format read by `pstats`.
+
+        :return: The list of paths written, ordered by decreasing duration of
+            their calls.
+        """
+        paths = []
+        for position, (operation, duration, profile) in enumerate(
+            self.slow_calls()
+        ):
+            path = os.path.join(
+                directory,
+                "%s-%d-%dms.prof" % (operation, position, duration * 1000)
+            )
+            profile.dump_stats(path)
+            paths.append(path)
+        return paths
+
+    def _stats(self, operation):
+        stats = self._operations.get(operation)
+        if stats is None:
+            with self._lock:
+                stats = self._operations.setdefault(operation, {
+                    "calls": 0,
+                    "sampled": 0,
+                    "errors": 0,
+                    "cache_hits": 0,
+                    "cache_misses": 0,
+                    "stages": {},
+                    "sizes": {}
+                })
+        return stats
+
+    def _record(self, trace, duration, failed):
+        stats = self._stats(trace.operation)
+
+        with self._lock:
+            stats["sampled"] += 1
+            if failed:
+                stats["errors"] += 1
+            stages = stats["stages"]
+            sizes = stats["sizes"]
+            for name in [name for name, value in trace.stages] + ["total"]:
+                if name not in stages:
+                    stages[name] = LatencyHistogram()
+            for name, value in trace.sizes:
+                if name not in sizes:
+                    sizes[name] = LatencyHistogram(self.SIZE_BUCKETS)
+
+        for name, seconds in trace.stages:
+            stages[name].observe(seconds)
+        stages["total"].observe(duration)
+        for name, value in trace.sizes:
+            sizes[name].observe(value)
+
+        if (
+            trace.profiler is not None
+            and duration >= self.profile_threshold
+        ):
+            with self._lock:
+                self._sequence += 1
+                entry = (
+                    duration,
+                    self._sequence,
+                    trace.operation,
+                    trace.profiler
+                )
+                if len(self._slow_calls) < self.max_profiles:
+                    heappush(self._slow_calls, entry)
+                elif self.max_profiles:
+                    heappushpop(self._slow_calls, entry)
+
+
+def _histogram_lines(lines, name, labels, snapshot):
+    for bound, count in snapshot["buckets"]:
+        lines.append('%s_bucket{%s,le="%s"} %d' % (
+            name,
+            labels,
+            "+Inf" if bound is None else repr(bound),
+            count
+        ))
+    lines.append("%s_sum{%s} %r" % (name, labels, snapshot["sum"]))
+    lines.append("%s_count{%s} %d" % (name, labels, snapshot["count"]))
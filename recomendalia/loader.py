@@ -0,0 +1,402 @@
+#-*- coding: utf-8 -*-
+u"""Streaming bulk loading of friendships, ratings and relations.
+
+The `BulkLoader` class reads large JSON lines or CSV files in fixed size
+chunks, so memory use is bounded by the chunk size (plus the data set being
+built). Each chunk is validated as a whole, deduplicated, and added to the
+data set in bulk:
+
+    - Friendships are added to the friend sets of both users directly.
+    - Ratings are merged into the `RatingStore` of the registry, without
+      creating `Rating` objects.
+    - Relations are created with their complements, skipping the ones that
+      already exist.
+
+Users and concepts are referred to by name, and created on demand.
+
+Input rows have the following fields (CSV files must have a header row with
+these column names; extra fields are ignored):
+
+    friendships:
+        ``user``, ``friend``
+    ratings:
+        ``user``, ``concept``, ``score``
+    relations:
+        ``source``, ``relation_type``, ``target``
+
+This module requires NumPy.
+"""
+import csv
+import json
+import time
+import numpy as np
+from recomendalia.registry import Registry
+from recomendalia.user import User
+from recomendalia.concept import Concept
+from recomendalia.rating import Rating
+from recomendalia.relation import Relation
+
+FIELDS = {
+    "friendships": ("user", "friend"),
+    "ratings": ("user", "concept", "score"),
+    "relations": ("source", "relation_type", "target")
+}
+
+
+class BulkLoader(object):
+    """Loads data from JSON lines or CSV files into a `Registry`.
+
+    Bulk loading doesn't notify `User.listeners` or `Rating.listeners`, so
+    indexes attached to those should be rebuilt after loading. It does
+    increase the `User.version` of the affected users, so cached suggestions
+    are never served stale.
+    """
+    CHUNK_SIZE = 10000
+    MAX_ERRORS = 100
+
+    def __init__(self,
+        registry = None,
+        chunk_size = None,
+        relation_types = None,
+        strict = False,
+        progress = None
+    ):
+        """Create a new loader.
+
+        :param registry: The `Registry` to load data into. Defaults to
+            `Registry.default`.
+        :param chunk_size: The number of rows to read and process at once.
+            Defaults to `CHUNK_SIZE`.
+        :param relation_types: The accepted relation types. Defaults to the
+            relation types that have a complement (see
+            `Relation.complementary_type`).
+        :param strict: If True, invalid rows raise a `ValueError`. Otherwise,
+            they are skipped and counted (see `LoadStats`).
+        :param progress: A callable, invoked with a `LoadStats` object after
+            each processed chunk.
+        """
+        self.registry = registry or Registry.default
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.relation_types = (
+            None if relation_types is None else frozenset(relation_types)
+        )
+        self.strict = strict
+        self.progress = progress
+        self._users = None
+        self._concepts = None
+        self._relations = None
+
+    def load_friendships(self, source, format = None):
+        """Load friendships from a file.
+
+        :param source: A file path, or an open file object.
+        :param format: Either "jsonl" or "csv". If not given, it is inferred
+            from the file name, defaulting to JSON lines.
+        :return: A `LoadStats` object.
+        """
+        return self._load(source, format, "friendships")
+
+    def load_ratings(self, source, format = None):
+        """Load ratings from a file.
+
+        Ratings for concepts that a user already rated replace the previous
+        ones. See `load_friendships` for the parameters.
+        """
+        return self._load(source, format, "ratings")
+
+    def load_relations(self, source, format = None):
+        """Load relations between concepts from a file.
+
+        See `load_friendships` for the parameters.
+        """
+        return self._load(source, format, "relations")
+
+    def _load(self, source, format, kind):
+        stats = LoadStats(kind)
+        process = getattr(self, "_process_" + kind)
+        fields = FIELDS[kind]
+
+        for chunk in _read_chunks(source, format, fields, self.chunk_size):
+            rows = []
+            for line, row in chunk:
+                if row is None or any(value is None for value in row):
+                    self._reject(stats, line, "missing fields")
+                else:
+                    rows.append((line, row))
+            stats.rows += len(chunk)
+            if rows:
+                process(rows, stats)
+            stats.seconds = time.time() - stats.started
+            if self.progress is not None:
+                self.progress(stats)
+
+        return stats
+
+    def _reject(self, stats, line, message):
+        if self.strict:
+            raise ValueError("Line %d: %s" % (line, message))
+        stats.rejected += 1
+        if len(stats.errors) < self.MAX_ERRORS:
+            stats.errors.append((line, message))
+
+    def _user(self, name):
+        if self._users is None:
+            self._users = dict(
+                (user.name, user) for user in self.registry.users
+            )
+        user = self._users.get(name)
+        if user is None:
+            user = self._users[name] = User(name, self.registry)
+        return user
+
+    def _concept(self, name):
+        if self._concepts is None:
+            self._concepts = dict(
+                (concept.name, concept) for concept in self.registry.concepts
+            )
+        concept = self._concepts.get(name)
+        if concept is None:
+            concept = self._concepts[name] = Concept(name, self.registry)
+        return concept
+
+    def _process_friendships(self, rows, stats):
+        users = []
+        for line, (name, friend_name) in rows:
+            if name == friend_name:
+                self._reject(stats, line, "users can't befriend themselves")
+            else:
+                users.append((self._user(name), self._user(friend_name)))
+        if not users:
+            return
+
+        # Deduplicate the chunk
+        a = np.array([user.id for user, friend in users], dtype = np.int64)
+        b = np.array([friend.id for user, friend in users], dtype = np.int64)
+        size = len(self.registry.users)
+        keys, first = np.unique(
+            np.minimum(a, b) * size + np.maximum(a, b),
+            return_index = True
+        )
+        stats.duplicates += len(users) - len(keys)
+
+        changed = set()
+        for i in first.tolist():
+            user, friend = users[i]
+            if friend in user._friends:
+                stats.duplicates += 1
+            else:
+                user._friends.add(friend)
+                friend._friends.add(user)
+                changed.add(user)
+                changed.add(friend)
+                stats.loaded += 1
+
+        # Invalidate suggestions for the affected users, as User.befriend does
+        for user in changed:
+            user._version += 1
+            for friend in user._friends:
+                friend._version += 1
+
+    def _process_ratings(self, rows, stats):
+        scores = np.array(
+            [_to_float(score) for line, (user, concept, score) in rows]
+        )
+        with np.errstate(invalid = "ignore"):
+            valid = (
+                (scores >= Rating.MIN_SCORE)
+                & (scores <= Rating.MAX_SCORE)
+                & (scores == np.floor(scores))
+            )
+        for i in np.flatnonzero(~valid).tolist():
+            line, (user, concept, score) = rows[i]
+            self._reject(stats, line, "%r is not a valid score" % score)
+
+        users = []
+        user_ids = []
+        concept_ids = []
+        for i in np.flatnonzero(valid).tolist():
+            user_name, concept_name = rows[i][1][:2]
+            user = self._user(user_name)
+            users.append(user)
+            user_ids.append(user.id)
+            concept_ids.append(self._concept(concept_name).id)
+        if not users:
+            return
+
+        # Deduplicate the chunk; the last score given by a user to a concept
+        # wins
+        user_ids = np.array(user_ids, dtype = np.int64)
+        concept_ids = np.array(concept_ids, dtype = np.int64)
+        scores = scores[valid].astype(np.uint8)
+        keys = user_ids * len(self.registry.concepts) + concept_ids
+        reversed_keys = keys[::-1]
+        keys, last = np.unique(reversed_keys, return_index = True)
+        last = len(reversed_keys) - 1 - last
+        stats.duplicates += len(reversed_keys) - len(keys)
+
+        added = self.registry.ratings.merge(
+            user_ids[last].tolist(),
+            concept_ids[last].tolist(),
+            scores[last].tolist()
+        )
+        stats.loaded += added
+        stats.updated += len(last) - added
+
+        for i in last.tolist():
+            users[i]._version += 1
+
+    def _process_relations(self, rows, stats):
+        if self._relations is None:
+            self._relations = set(
+                (relation.source, relation.relation_type, relation.target)
+                for relation in self.registry.relations
+            )
+        existing = self._relations
+
+        for line, (source, relation_type, target) in rows:
+            if self.relation_types is None:
+                valid = Relation.complementary_type(relation_type) is not None
+            else:
+                valid = relation_type in self.relation_types
+            if not valid:
+                self._reject(
+                    stats,
+                    line,
+                    "%r is not a valid relation type" % relation_type
+                )
+                continue
+
+            source = self._concept(source)
+            target = self._concept(target)
+            if (source, relation_type, target) in existing:
+                stats.duplicates += 1
+                continue
+
+            Relation(source, relation_type, target)
+            existing.add((source, relation_type, target))
+            complement = Relation.complementary_type(relation_type)
+            if complement:
+                existing.add((target, complement, source))
+            stats.loaded += 1
+
+
+class LoadStats(object):
+    """Statistics on a bulk load operation.
+
+    :ivar kind: The kind of data loaded ("friendships", "ratings" or
+        "relations").
+    :ivar rows: The number of rows read.
+    :ivar loaded: The number of new friendships, ratings or relations.
+    :ivar updated: The number of ratings that replaced a previous score.
+    :ivar duplicates: The number of rows repeating an existing friendship or
+        relation, or a rating given in the same chunk.
+    :ivar rejected: The number of invalid rows.
+    :ivar errors: A list of (line number, message) tuples describing the
+        first invalid rows.
+    :ivar seconds: The time spent loading.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.rows = 0
+        self.loaded = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.errors = []
+        self.started = time.time()
+        self.seconds = 0.0
+
+    def __repr__(self):
+        return (
+            "%s(%s: %d rows, %d loaded, %d updated, %d duplicates, "
+            "%d rejected, %.0f rows/s)" % (
+                self.__class__.__name__,
+                self.kind,
+                self.rows,
+                self.loaded,
+                self.updated,
+                self.duplicates,
+                self.rejected,
+                self.rows_per_second
+            )
+        )
+
+    @property
+    def rows_per_second(self):
+        """The average number of rows processed per second."""
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _read_chunks(source, format, fields, chunk_size):
+    # Yield lists of (line number, row) tuples, where each row is a tuple with
+    # the values of the given fields (or None, if the row can't be parsed)
+    if isinstance(source, basestring):
+        if format is None:
+            format = "csv" if source.lower().endswith(".csv") else "jsonl"
+        with open(source, "rb") as file:
+            for chunk in _read_chunks(file, format, fields, chunk_size):
+                yield chunk
+        return
+
+    if format is None:
+        format = "csv" if getattr(source, "name", "").lower().endswith(
+            ".csv"
+        ) else "jsonl"
+
+    if format == "csv":
+        rows = _read_csv(source, fields)
+    elif format == "jsonl":
+        rows = _read_jsonl(source, fields)
+    else:
+        raise ValueError("Unknown format: %r" % format)
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _read_jsonl(file, fields):
+    for line, text in enumerate(file, 1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+            yield line, tuple(record.get(field) for field in fields)
+        except (ValueError, AttributeError):
+            yield line, None
+
+
+def _read_csv(file, fields):
+    reader = csv.reader(file)
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [name.strip() for name in header]
+    missing = [field for field in fields if field not in header]
+    if missing:
+        raise ValueError("Missing CSV columns: %s" % ", ".join(missing))
+    positions = [header.index(field) for field in fields]
+    width = max(positions) + 1
+
+    for line, values in enumerate(reader, 2):
+        if not values:
+            continue
+        if len(values) < width:
+            yield line, None
+        else:
+            yield line, tuple(
+                values[position].decode("utf-8") for position in positions
+            )
@@ -0,0 +1,219 @@
+#-*- coding: utf-8 -*-
+u"""Approximate friend suggestions through MinHash signatures and locality
+sensitive hashing (LSH).
+
+The exact friend-of-friend expansion (see `recomendalia.network`) costs the
+sum of the degrees of a user's friends, which grows very large for users
+connected to hubs. The `MinHashIndex` class instead keeps a MinHash signature
+of the friend set of every user, split into bands that are stored in hash
+tables. Users whose friend sets overlap a lot (high Jaccard similarity) are
+likely to share at least one band, so candidates are retrieved with a few
+dictionary lookups, and only a bounded number of them is scored.
+
+The trade-off between recall and latency is controlled by the `bands` and
+`rows` parameters (more bands with fewer rows find more candidates, with
+lower similarity) and by `max_candidates`. The
+``recomendalia.benchmarks.approximate`` script measures it against the exact
+suggestions. Note that Jaccard similarity penalizes candidates with many more
+friends than the user, so in graphs without clustering (such as the ones built
+by `recomendalia.sampledata`) recall is modest unless bands have a single
+row.
+
+This module requires NumPy.
+"""
+from heapq import nlargest
+from itertools import islice
+from operator import itemgetter
+import numpy as np
+
+# A Mersenne prime, for the universal hash functions
+_PRIME = (1 << 31) - 1
+
+
+class MinHashIndex(object):
+    """An index of MinHash signatures of the friend sets of users.
+
+    The index can be passed to `User.suggest_friends`, as an approximate
+    alternative to `recomendalia.network.MutualFriendIndex`::
+
+        index = MinHashIndex.from_users(users)
+        index.attach()
+        user.suggest_friends(index = index)
+
+    Candidates are the users that share at least one band with the given user
+    (excluding its current friends). They are ranked by their exact number of
+    friends in common, so suggestions never overstate their rank, but
+    candidates that don't share a band are missed.
+    """
+
+    def __init__(self, bands = 32, rows = 1, max_candidates = 256, seed = 0):
+        """Create an empty index.
+
+        :param bands: The number of bands each signature is split into.
+        :param rows: The number of hash values in each band. Signatures have
+            ``bands * rows`` values. Two users with a Jaccard similarity *s*
+            share at least one band with a probability of ``1 - (1 -
+            s ** rows) ** bands``.
+        :param max_candidates: The maximum number of candidates scored for
+            each query, bounding its cost.
+        :param seed: The seed used to draw the hash functions.
+        """
+        self.bands = bands
+        self.rows = rows
+        self.max_candidates = max_candidates
+        rng = np.random.RandomState(seed)
+        size = bands * rows
+        self._a = rng.randint(1, _PRIME, size = size).astype(np.int64)
+        self._b = rng.randint(0, _PRIME, size = size).astype(np.int64)
+        self._signatures = {}
+        self._buckets = [{} for band in xrange(bands)]
+
+    def __len__(self):
+        return len(self._signatures)
+
+    @classmethod
+    def from_users(cls, users, **kwargs):
+        """Create an index containing the friend sets of the given users.
+
+        Keyword arguments are passed to the constructor.
+        """
+        index = cls(**kwargs)
+        for user in users:
+            index.update_user(user)
+        return index
+
+    def attach(self):
+        """Start updating the index with every change in friendships."""
+        from recomendalia.user import User
+        if self.update not in User.listeners:
+            User.listeners.append(self.update)
+
+    def detach(self):
+        """Stop updating the index with changes in friendships."""
+        from recomendalia.user import User
+        if self.update in User.listeners:
+            User.listeners.remove(self.update)
+
+    def update(self, a, b, befriended):
+        """Update the index after a friendship is established or ended.
+
+        :param a: One of the users involved in the friendship.
+        :param b: The other user involved in the friendship.
+        :param befriended: True if the friendship was established, False if it
+            was ended.
+        """
+        for user, friend in ((a, b), (b, a)):
+            signature = self._signatures.get(user)
+            if befriended and signature is not None:
+                # Adding an element can only lower the minimum hashes
+                self._store(
+                    user,
+                    np.minimum(signature, self._hashes([friend.id])[0])
+                )
+            else:
+                self.update_user(user)
+
+    def update_user(self, user):
+        """Recompute the signature of a user from its current friends."""
+        friends = user._friends
+        if friends:
+            self._store(
+                user,
+                self._hashes([friend.id for friend in friends]).min(axis = 0)
+            )
+        else:
+            self._remove(user)
+
+    def signature(self, user):
+        """Return the MinHash signature of a user, or None if it has no
+        friends.
+        """
+        return self._signatures.get(user)
+
+    def similarity(self, a, b):
+        """Estimate the Jaccard similarity between the friend sets of two
+        users.
+        """
+        sa = self._signatures.get(a)
+        sb = self._signatures.get(b)
+        if sa is None or sb is None:
+            return 0.0
+        return float(np.count_nonzero(sa == sb)) / len(sa)
+
+    def candidates(self, user):
+        """Obtain the users that share at least one band with the given user.
+
+        At most `max_candidates` users are returned, giving priority to the
+        ones sharing more bands, and at most `max_candidates` members of each
+        band are inspected. The user and its current friends are excluded.
+        """
+        signature = self._signatures.get(user)
+        if signature is None:
+            return []
+
+        friends = user._friends
+        hits = {}
+        get = hits.get
+        limit = self.max_candidates
+        for band, key in enumerate(self._band_keys(signature)):
+            for other in islice(self._buckets[band].get(key, ()), limit):
+                if other is not user and other not in friends:
+                    hits[other] = get(other, 0) + 1
+
+        if len(hits) <= limit:
+            return list(hits)
+        return [
+            other
+            for other, count in nlargest(
+                limit,
+                hits.iteritems(),
+                key = itemgetter(1)
+            )
+        ]
+
+    def top_candidates(self, user, count, min_friends_in_common = 1):
+        """Select the users with the most friends in common with the given
+        user, among its LSH candidates.
+
+        :return: A list of (candidate, friends in common) tuples, ordered by
+            decreasing number of friends in common, like
+            `recomendalia.network.top_candidates`.
+        """
+        friends = user._friends
+        scored = []
+        for candidate in self.candidates(user):
+            common = len(friends & candidate._friends)
+            if common >= min_friends_in_common:
+                scored.append((candidate, common))
+        return nlargest(count, scored, key = itemgetter(1))
+
+    def _hashes(self, ids):
+        # A matrix with the hash values of each id, one row per id
+        ids = np.asarray(ids, dtype = np.int64)[:, np.newaxis]
+        return (ids * self._a + self._b) % _PRIME
+
+    def _band_keys(self, signature):
+        data = signature.astype(np.uint32).tobytes()
+        size = self.rows * 4
+        return [
+            data[band * size:(band + 1) * size]
+            for band in xrange(self.bands)
+        ]
+
+    def _store(self, user, signature):
+        previous = self._signatures.get(user)
+        if previous is not None and np.array_equal(previous, signature):
+            return
+        self._remove(user)
+        self._signatures[user] = signature
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(key, set()).add(user)
+
+    def _remove(self, user):
+        signature = self._signatures.pop(user, None)
+        if signature is not None:
+            for bucket, key in zip(self._buckets, self._band_keys(signature)):
+                members = bucket[key]
+                members.discard(user)
+                if not members:
+                    del bucket[key]
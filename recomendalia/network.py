@@ -0,0 +1,178 @@
+#-*- coding: utf-8 -*-
+u"""Friend-of-friend scoring functions, used by `User.suggest_friends`.
+
+All the state used by the scoring functions is created for each call, so the
+cost of a suggestion request only depends on the neighbourhood of the user
+being served, not on how many requests came before it. Alternatively, the
+`MutualFriendIndex` class maintains the counts as friendships change.
+"""
+from heapq import nlargest
+from operator import itemgetter
+
+
+def mutual_friend_counts(user):
+    """Count the friends that the given user has in common with each of the
+    friends of its friends.
+
+    The network is traversed in a single pass. Users that are already friends
+    of the given user, and the user itself, are never counted.
+
+    :param user: The `User` to count candidates for.
+    :return: A dictionary mapping candidate `User` objects to the number of
+        friends they share with the given user.
+    """
+    friends = user._friends
+    counts = {}
+    get = counts.get
+
+    for friend in friends:
+        for candidate in friend._friends:
+            if candidate is not user and candidate not in friends:
+                counts[candidate] = get(candidate, 0) + 1
+
+    return counts
+
+
+def top_candidates(counts, count, min_friends_in_common = 1):
+    """Select the candidates with the most friends in common.
+
+    :param counts: A mapping of candidates to their number of friends in
+        common, as returned by `mutual_friend_counts`.
+    :param count: The maximum number of candidates to select.
+    :param min_friends_in_common: Candidates with less friends in common than
+        this are discarded.
+    :return: A list of (candidate, friends in common) tuples, ordered by
+        decreasing number of friends in common.
+    """
+    return nlargest(
+        count,
+        (
+            item
+            for item in counts.iteritems()
+            if item[1] >= min_friends_in_common
+        ),
+        key = itemgetter(1)
+    )
+
+
+class MutualFriendIndex(object):
+    """An incrementally maintained index of the number of friends in common
+    between users.
+
+    The index keeps, for each user, a counter of the users it shares friends
+    with. When a friendship between two users A and B is established or ended,
+    only the affected pairs are updated: the friends of B gain or lose A as a
+    friend in common, and vice versa. The cost of a change is thus
+    proportional to the number of friends of A and B.
+
+    The best candidates of each user are cached (see `TOP_SIZE`) until their
+    counts change, so most calls to `top_candidates` are plain lookups.
+
+    An index only sees the friendships that change while it is attached (see
+    the `attach` method). To index friendships that already exist, use the
+    `from_users` constructor::
+
+        index = MutualFriendIndex.from_users(users)
+        index.attach()
+
+    The index can then be passed to `User.suggest_friends`.
+    """
+    TOP_SIZE = 32
+
+    def __init__(self):
+        self._counts = {}
+        self._top = {}
+
+    @classmethod
+    def from_users(cls, users):
+        """Create an index containing the friendships of the given users."""
+        index = cls()
+        counts = index._counts
+
+        for user in users:
+            user_counts = counts.setdefault(user, {})
+            get = user_counts.get
+            for friend in user._friends:
+                for other in friend._friends:
+                    if other is not user:
+                        user_counts[other] = get(other, 0) + 1
+
+        return index
+
+    def attach(self):
+        """Start updating the index with every change in friendships."""
+        from recomendalia.user import User
+        if self.update not in User.listeners:
+            User.listeners.append(self.update)
+
+    def detach(self):
+        """Stop updating the index with changes in friendships."""
+        from recomendalia.user import User
+        if self.update in User.listeners:
+            User.listeners.remove(self.update)
+
+    def update(self, a, b, befriended):
+        """Update the index after a friendship is established or ended.
+
+        :param a: One of the users involved in the friendship.
+        :param b: The other user involved in the friendship.
+        :param befriended: True if the friendship was established, False if it
+            was ended.
+        """
+        delta = 1 if befriended else -1
+        counts = self._counts
+        top = self._top
+
+        for user, friend in ((a, b), (b, a)):
+            user_counts = counts.setdefault(user, {})
+            top.pop(user, None)
+            for other in friend._friends:
+                if other is user:
+                    continue
+                other_counts = counts.setdefault(other, {})
+                count = user_counts.get(other, 0) + delta
+                if count:
+                    user_counts[other] = count
+                    other_counts[user] = count
+                else:
+                    del user_counts[other]
+                    del other_counts[user]
+                top.pop(other, None)
+
+    def friends_in_common(self, a, b):
+        """Return the number of friends that two users have in common."""
+        return self._counts.get(a, {}).get(b, 0)
+
+    def top_candidates(self, user, count, min_friends_in_common = 1):
+        """Select the users with the most friends in common with the given
+        user, excluding its current friends.
+
+        :return: A list of (candidate, friends in common) tuples, ordered by
+            decreasing number of friends in common, like the
+            `top_candidates` function.
+        """
+        if count > self.TOP_SIZE:
+            return top_candidates(
+                self._candidates(user),
+                count,
+                min_friends_in_common
+            )
+
+        best = self._top.get(user)
+        if best is None:
+            best = top_candidates(self._candidates(user), self.TOP_SIZE)
+            self._top[user] = best
+
+        return [
+            item
+            for item in best[:count]
+            if item[1] >= min_friends_in_common
+        ]
+
+    def _candidates(self, user):
+        friends = user._friends
+        return dict(
+            item
+            for item in self._counts.get(user, {}).iteritems()
+            if item[0] not in friends
+        )
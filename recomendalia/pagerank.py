@@ -0,0 +1,193 @@
+#-*- coding: utf-8 -*-
+u"""Concept suggestions through personalized PageRank.
+
+Users and concepts form a single graph, with three kinds of edges:
+
+    - Friendships, between users.
+    - Ratings, between a user and a concept, in both directions, weighted by
+      the score of the rating (ratings with a score of 0 are not followed).
+    - Relations, from a concept to another, weighted by their relation type.
+
+The personalized PageRank of a user is the probability of reaching each node
+of the graph through a random walk that starts at the user, follows edges
+with a probability proportional to their weight, and jumps back to the user
+with a probability `alpha` at each step. The concepts with the highest
+probability that the user hasn't rated yet are suggested.
+
+Probabilities are approximated with the push algorithm: residual probability
+is propagated from the user outwards, and only through nodes whose residual
+exceeds a threshold proportional to their degree (`epsilon`). The total work
+per query is thus bounded by ``1 / (alpha * epsilon)`` edge traversals,
+regardless of the size of the graph.
+"""
+from collections import deque
+from functools import partial
+from heapq import nlargest
+from operator import itemgetter
+from recomendalia.user import User
+from recomendalia.relation import Relation
+
+
+class PersonalizedPageRank(object):
+    """A concept recommender based on personalized PageRank.
+
+    Instances can be passed to `User.suggest_concepts`::
+
+        user.suggest_concepts(recommender = PersonalizedPageRank())
+
+    The recommender keeps no state between queries, so it always reflects the
+    current friendships, ratings and relations.
+    """
+    RELATION_WEIGHTS = {
+        "created_by": 1.0,
+        "creator_of": 1.0,
+        "contains": 0.5,
+        "contained_by": 0.5
+    }
+
+    def __init__(self,
+        alpha = 0.15,
+        epsilon = 1e-5,
+        friend_weight = 2.0,
+        rating_weight = 1.0,
+        relation_weights = None,
+        default_relation_weight = 0.25,
+        max_pushes = 100000
+    ):
+        """Create a new recommender.
+
+        :param alpha: The probability of jumping back to the user at each
+            step of the walk.
+        :param epsilon: The residual threshold, relative to the degree of
+            each node. Lower values give more precise results, at a higher
+            cost.
+        :param friend_weight: The weight of each friendship edge.
+        :param rating_weight: The weight of rating edges, per score point.
+        :param relation_weights: A dictionary mapping relation types to the
+            weight of their edges. Defaults to `RELATION_WEIGHTS`.
+        :param default_relation_weight: The weight of relations whose type is
+            not in `relation_weights`.
+        :param max_pushes: The maximum number of pushes per query, as an
+            additional bound on its cost.
+        """
+        self.alpha = alpha
+        self.epsilon = epsilon
+        self.friend_weight = friend_weight
+        self.rating_weight = rating_weight
+        self.relation_weights = (
+            self.RELATION_WEIGHTS
+            if relation_weights is None
+            else relation_weights
+        )
+        self.default_relation_weight = default_relation_weight
+        self.max_pushes = max_pushes
+
+    def rank(self, user):
+        """Approximate the personalized PageRank of a user.
+
+        :param user: The `User` that random walks start from.
+        :return: A dictionary mapping `User` and `Concept` objects to their
+            estimated probability. Nodes that weren't reached are omitted.
+        """
+        alpha = self.alpha
+        epsilon = self.epsilon
+        estimates = {}
+        residuals = {user: 1.0}
+        queue = deque([user])
+        queued = set([user])
+        pushes = 0
+
+        while queue and pushes < self.max_pushes:
+            node = queue.popleft()
+            queued.discard(node)
+            residual = residuals.pop(node, 0.0)
+            estimates[node] = estimates.get(node, 0.0) + alpha * residual
+            pushes += 1
+
+            edges = self._edges(node)
+            total = sum(weight for target, weight in edges)
+            if not total:
+                # Dead ends jump back to the user
+                edges = [(user, 1.0)]
+                total = 1.0
+
+            spread = (1 - alpha) * residual / total
+            for target, weight in edges:
+                value = residuals.get(target, 0.0) + spread * weight
+                residuals[target] = value
+                if target in queued:
+                    continue
+                if value >= epsilon * _degree(target):
+                    queued.add(target)
+                    queue.append(target)
+
+        return estimates
+
+    def suggest_concepts(self, user, count = 8):
+        """Suggest concepts to a user.
+
+        :return: A list of (concept, probability, contributors) tuples,
+            ordered by decreasing probability. Contributors are the concepts
+            rated by the user that the suggested concept is directly related
+            to, ordered by decreasing score; they are given as callables, so
+            that they are only computed when accessed (see
+            `ConceptSuggestion.contributors`).
+        """
+        rated = user._ratings
+        scored = [
+            item
+            for item in self.rank(user).iteritems()
+            if not isinstance(item[0], User) and item[0] not in rated
+        ]
+
+        def contributors(concept):
+            related = set(
+                relation.target for relation in concept._relations
+            )
+            related.update(
+                relation.source for relation in concept._referrers
+            )
+            return sorted(
+                (other for other in related if other in rated),
+                key = lambda other: -rated[other].score
+            )
+
+        # Contributors are only computed when they are accessed
+        return [
+            (concept, probability, partial(contributors, concept))
+            for concept, probability in nlargest(
+                count,
+                scored,
+                key = itemgetter(1)
+            )
+        ]
+
+    def _edges(self, node):
+        if isinstance(node, User):
+            edges = [
+                (friend, self.friend_weight)
+                for friend in node._friends
+            ]
+        else:
+            relation_weights = self.relation_weights
+            default = self.default_relation_weight
+            type_names = Relation.type_names
+            edges = []
+            for type_id, targets in node._related_by.iteritems():
+                weight = relation_weights.get(type_names[type_id], default)
+                edges.extend((target, weight) for target in targets)
+
+        rating_weight = self.rating_weight
+        edges.extend(
+            (other, score * rating_weight)
+            for other, score in node._ratings.iterscores()
+            if score
+        )
+        return edges
+
+
+def _degree(node):
+    # The number of edges of a node, used to scale the push threshold
+    if isinstance(node, User):
+        return len(node._friends) + len(node._ratings) or 1
+    return len(node._relations) + len(node._ratings) or 1
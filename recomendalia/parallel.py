@@ -0,0 +1,445 @@
+#-*- coding: utf-8 -*-
+u"""Batch recommendation across multiple processes.
+
+The `ParallelRecommender` class exports the friendship graph and the ratings
+of a `Registry` into flat arrays, stored as ``.npy`` files in shared memory
+(``/dev/shm``, when available). A pool of worker processes memory maps those
+files, so all the workers share a single copy of the arrays, and neither the
+arrays nor the object graph are ever pickled. The range of user ids is split
+into shards, which are scored in parallel; workers only send back the ids and
+scores of the selected suggestions, which are then turned into suggestion
+objects by the parent process.
+
+Friend suggestions are computed through the same sparse products as
+`recomendalia.batch`, and concept suggestions through the same item-based
+collaborative filtering as `recomendalia.similarity`.
+
+This module requires NumPy.
+"""
+import os
+import shutil
+import tempfile
+from functools import partial
+from multiprocessing import Pool, cpu_count
+import numpy as np
+from recomendalia.registry import Registry
+from recomendalia.user import User, FriendSuggestion, ConceptSuggestion
+from recomendalia.batch import (
+    EXPANSION_BUDGET,
+    friendship_matrix,
+    mutual_friend_counts,
+    top_mutual_friends,
+    _row_blocks
+)
+from recomendalia.similarity import predict_scores, top_scores
+
+#: The number of shards assigned to each worker process, on average. Using
+#: several shards per process balances the load between workers.
+SHARDS_PER_PROCESS = 4
+
+SHARED_MEMORY_DIRECTORY = "/dev/shm"
+
+# The arrays mapped by a worker process
+_arrays = None
+
+
+class ParallelRecommender(object):
+    """Computes suggestions for every user of a registry, using a pool of
+    worker processes.
+
+    The recommender works on a copy of the data taken when it is created:
+    later changes to friendships or ratings are not taken into account. The
+    arrays and the worker processes are released by calling `close` (or by
+    using the recommender as a context manager)::
+
+        with ParallelRecommender(registry) as recommender:
+            friends = recommender.suggest_friends_for_all()
+            concepts = recommender.suggest_concepts_for_all()
+    """
+
+    def __init__(self, registry = None, processes = None, directory = None):
+        """Export the data of a registry and start the worker processes.
+
+        :param registry: The `Registry` to compute suggestions for. Defaults
+            to `Registry.default`.
+        :param processes: The number of worker processes. Defaults to the
+            number of CPUs.
+        :param directory: The directory to store the exported arrays in.
+            Defaults to a new temporary directory, in shared memory if the
+            system supports it. It is removed when the recommender is
+            closed.
+        """
+        self.registry = registry or Registry.default
+        self.processes = processes or cpu_count()
+
+        if directory is None:
+            directory = tempfile.mkdtemp(
+                prefix = "recomendalia-",
+                dir = (
+                    SHARED_MEMORY_DIRECTORY
+                    if os.path.isdir(SHARED_MEMORY_DIRECTORY)
+                    else None
+                )
+            )
+        self.directory = directory
+        self._pool = None
+
+        try:
+            self._degrees, self._rating_counts = export_arrays(
+                self.registry,
+                directory
+            )
+            self._pool = Pool(
+                self.processes,
+                _init_worker,
+                (directory,)
+            )
+        except:
+            shutil.rmtree(directory, ignore_errors = True)
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop the worker processes and remove the exported arrays."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+            shutil.rmtree(self.directory, ignore_errors = True)
+
+    def suggest_friends_for_all(self, count = 8, min_friends_in_common = 2):
+        """Suggest potential friends for every user.
+
+        :param count: The maximum number of suggestions to produce for each
+            user.
+        :param min_friends_in_common: Candidates sharing less friends than
+            this with a user are not suggested.
+        :return: A dictionary mapping each `User` to a list of
+            `FriendSuggestion` objects, like
+            `recomendalia.batch.suggest_friends_for_all`.
+        """
+        users = self.registry.users
+        suggestions = dict((user, []) for user in users)
+        tasks = [
+            (start, stop, count, min_friends_in_common)
+            for start, stop in self._shards(self._degrees)
+        ]
+
+        for rows, columns, counts in self._pool.imap_unordered(
+            _suggest_friends,
+            tasks
+        ):
+            for row, column, rank in zip(
+                rows.tolist(),
+                columns.tolist(),
+                counts.tolist()
+            ):
+                user = users[row]
+                candidate = users[column]
+                suggestions[user].append(
+                    FriendSuggestion(
+                        candidate,
+                        rank,
+                        partial(user.get_friends_in_common, candidate)
+                    )
+                )
+
+        return suggestions
+
+    def suggest_concepts_for_all(self, count = 8, adjusted = True):
+        """Suggest concepts to every user.
+
+        Users with less than `User.COLD_START_RATINGS` ratings get popular
+        concepts instead, from `Registry.popularity`, like
+        `User.suggest_concepts` does. Those are computed by the parent
+        process, from the current state of the registry.
+
+        :param count: The maximum number of suggestions to produce for each
+            user.
+        :param adjusted: If True, use the adjusted cosine similarity (see
+            `recomendalia.similarity.suggest_concepts`).
+        :return: A dictionary mapping each `User` to a list of
+            `ConceptSuggestion` objects, ordered by decreasing predicted
+            score.
+        """
+        users = self.registry.users
+        concepts = self.registry.concepts
+        suggestions = dict((user, []) for user in users)
+        tasks = [
+            (start, stop, count, adjusted)
+            for start, stop in self._shards(self._rating_counts)
+        ]
+
+        for shard in self._pool.imap_unordered(_suggest_concepts, tasks):
+            for user_id, user_suggestions in shard:
+                suggestions[users[user_id]] = [
+                    ConceptSuggestion(
+                        concepts[concept_id],
+                        score,
+                        [concepts[i] for i in contributors]
+                    )
+                    for concept_id, score, contributors in user_suggestions
+                ]
+
+        popularity = self.registry.popularity
+        for user_id in np.flatnonzero(
+            self._rating_counts < User.COLD_START_RATINGS
+        ).tolist():
+            user = users[user_id]
+            suggestions[user] = [
+                ConceptSuggestion(concept, score, contributors)
+                for concept, score, contributors
+                in popularity.suggest_concepts(user, count)
+            ]
+
+        return suggestions
+
+    def _shards(self, cost):
+        # Split the range of user ids into contiguous shards of similar cost
+        cost = cost + 1
+        budget = max(
+            cost.sum() // (self.processes * SHARDS_PER_PROCESS),
+            1
+        )
+        return list(_row_blocks(cost, budget))
+
+
+def export_arrays(registry, directory):
+    """Export the friendships and ratings of a registry as ``.npy`` files.
+
+    The following arrays are written:
+
+        friend_indptr, friend_indices:
+            The friendship matrix, in CSR format, indexed by user id (see
+            `recomendalia.batch.friendship_matrix`).
+
+        user_indptr, user_concepts, user_scores:
+            The ratings, in CSR format, by user id. The concepts rated by
+            each user are sorted by id.
+
+        concept_indptr, concept_users, concept_scores:
+            The ratings, in CSR format, by concept id.
+
+        means:
+            The average score given by each user (0 for users without
+            ratings).
+
+        norms, adjusted_norms:
+            The norm of the scores received by each concept, raw and centered
+            on the average score of each user.
+
+    :return: A tuple with two arrays, holding the number of friend-of-friend
+        paths and the number of ratings of each user.
+    """
+    user_count = len(registry.users)
+    concept_count = len(registry.concepts)
+    store = registry.ratings
+    store.compact()
+
+    friend_indptr, friend_indices = friendship_matrix(registry.users)
+    degrees = np.diff(friend_indptr)
+    paths = np.bincount(
+        np.repeat(np.arange(user_count), degrees),
+        weights = degrees[friend_indices],
+        minlength = user_count
+    ).astype(np.int64)
+
+    rating_users = np.frombuffer(store.user_ids, dtype = np.uint32)
+    rating_concepts = np.frombuffer(store.concept_ids, dtype = np.uint32)
+    scores = np.frombuffer(store.scores, dtype = np.uint8)
+
+    rating_counts = np.bincount(rating_users, minlength = user_count)
+    means = np.zeros(user_count)
+    np.divide(
+        np.bincount(rating_users, weights = scores, minlength = user_count),
+        rating_counts,
+        out = means,
+        where = rating_counts > 0
+    )
+    adjusted = scores - means[rating_users]
+
+    arrays = {
+        "friend_indptr": friend_indptr,
+        "friend_indices": friend_indices,
+        "means": means,
+        "norms": np.sqrt(np.bincount(
+            rating_concepts,
+            weights = scores.astype(np.float64) ** 2,
+            minlength = concept_count
+        )),
+        "adjusted_norms": np.sqrt(np.bincount(
+            rating_concepts,
+            weights = adjusted ** 2,
+            minlength = concept_count
+        ))
+    }
+
+    for prefix, keys, values, size in (
+        ("user", rating_users, rating_concepts, user_count),
+        ("concept", rating_concepts, rating_users, concept_count)
+    ):
+        order = np.argsort(
+            keys.astype(np.int64) * max(user_count, concept_count) + values,
+            kind = "mergesort"
+        )
+        indptr = np.zeros(size + 1, dtype = np.int64)
+        np.cumsum(np.bincount(keys, minlength = size), out = indptr[1:])
+        arrays[prefix + "_indptr"] = indptr
+        arrays[prefix + ("_concepts" if prefix == "user" else "_users")] = \
+            values[order].astype(np.int64)
+        arrays[prefix + "_scores"] = scores[order]
+
+    for name, array in arrays.iteritems():
+        np.save(os.path.join(directory, name + ".npy"), array)
+
+    return paths, rating_counts
+
+
+def load_arrays(directory):
+    """Memory map the arrays written by `export_arrays`.
+
+    :return: A dictionary mapping array names to read only arrays.
+    """
+    return dict(
+        (
+            name[:-len(".npy")],
+            np.load(os.path.join(directory, name), mmap_mode = "r")
+        )
+        for name in os.listdir(directory)
+        if name.endswith(".npy")
+    )
+
+
+def _init_worker(directory):
+    global _arrays
+    _arrays = load_arrays(directory)
+
+
+def _suggest_friends(task):
+    start, stop, count, min_friends_in_common = task
+    indptr = _arrays["friend_indptr"]
+    indices = _arrays["friend_indices"]
+    degrees = np.diff(indptr[start:stop + 1])
+    cost = np.bincount(
+        np.repeat(np.arange(stop - start), degrees),
+        weights = np.diff(indptr)[indices[indptr[start]:indptr[stop]]],
+        minlength = stop - start
+    )
+
+    results = []
+    for block_start, block_stop in _row_blocks(cost, EXPANSION_BUDGET):
+        results.append(top_mutual_friends(
+            *mutual_friend_counts(
+                indptr,
+                indices,
+                start + block_start,
+                start + block_stop
+            ),
+            count = count,
+            min_friends_in_common = min_friends_in_common
+        ))
+
+    return tuple(np.concatenate(arrays) for arrays in zip(*results))
+
+
+def _suggest_concepts(task):
+    start, stop, count, adjusted = task
+    return [
+        (user_id, _suggest_user_concepts(user_id, count, adjusted))
+        for user_id in xrange(start, stop)
+    ]
+
+
+def _suggest_user_concepts(user_id, count, adjusted):
+    # The same computation as recomendalia.similarity.suggest_concepts, over
+    # the CSR rating arrays
+    user_indptr = _arrays["user_indptr"]
+    user_concepts = _arrays["user_concepts"]
+    user_scores = _arrays["user_scores"]
+    concept_indptr = _arrays["concept_indptr"]
+    means = _arrays["means"]
+    norms = _arrays["adjusted_norms" if adjusted else "norms"]
+
+    start = user_indptr[user_id]
+    stop = user_indptr[user_id + 1]
+    if start == stop:
+        return []
+
+    rated = user_concepts[start:stop]
+    own_scores = _centered(user_scores[start:stop], user_id, adjusted)
+    mean = means[user_id] if adjusted else 0.0
+
+    # Expand the users that rated the user's concepts...
+    positions, rated_columns = _expand(concept_indptr, rated)
+    raters = _arrays["concept_users"][positions]
+    rater_scores = _centered(
+        _arrays["concept_scores"][positions],
+        raters,
+        adjusted
+    )
+
+    # ...then every rating given by those users
+    positions, rater_rows = _expand(user_indptr, raters)
+    candidates = user_concepts[positions]
+    products = rater_scores[rater_rows] * _centered(
+        user_scores[positions],
+        raters[rater_rows],
+        adjusted
+    )
+
+    # Sum the products for each (candidate, rated concept) pair, to obtain
+    # the dot products between their score vectors
+    keys, inverse = np.unique(
+        candidates * len(rated) + rated_columns[rater_rows],
+        return_inverse = True
+    )
+    dots = np.bincount(inverse, weights = products)
+    columns = keys % len(rated)
+    concepts, rows = np.unique(keys // len(rated), return_inverse = True)
+
+    denominators = norms[concepts[rows]] * norms[rated[columns]]
+    similarities = np.zeros((len(concepts), len(rated)))
+    similarities[rows, columns] = np.divide(
+        dots,
+        denominators,
+        out = np.zeros_like(dots),
+        where = denominators > 0
+    )
+
+    predictions, weights = predict_scores(similarities, own_scores, mean)
+    predictions[np.searchsorted(concepts, rated)] = np.nan
+
+    suggestions = []
+    for j in top_scores(predictions, count):
+        order = np.argsort(-weights[j], kind = "mergesort")
+        suggestions.append((
+            int(concepts[j]),
+            float(predictions[j]),
+            [int(rated[k]) for k in order if weights[j, k] > 0]
+        ))
+
+    return suggestions
+
+
+def _centered(scores, user_ids, adjusted):
+    if adjusted:
+        return scores - _arrays["means"][user_ids]
+    return scores.astype(np.float64)
+
+
+def _expand(indptr, keys):
+    # Obtain the positions of the entries in the CSR rows of the given keys,
+    # and the position of the key that each entry comes from
+    starts = indptr[keys]
+    lengths = indptr[keys + 1] - starts
+    total = lengths.sum()
+    positions = (
+        np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        + np.arange(total, dtype = np.int64)
+    )
+    return positions, np.repeat(np.arange(len(keys)), lengths)
@@ -0,0 +1,218 @@
+#-*- coding: utf-8 -*-
+u"""Popularity rankings of concepts, used for cold start suggestions.
+
+Collaborative filtering has nothing to go on for users who rated few or no
+concepts. For them, `User.suggest_concepts` falls back to the concepts that
+are best rated overall, or within the categories of the concepts the user
+did rate. Rankings are computed from the rating aggregates kept by the
+`RatingStore` (see `Concept.rating_stats`), so building them doesn't iterate
+over individual ratings, and they are precomputed, so serving them is a
+lookup.
+"""
+from heapq import nlargest
+from operator import itemgetter
+from time import time
+from recomendalia.registry import Registry
+
+
+class PopularityRanking(object):
+    """Precomputed rankings of the most popular concepts, overall and within
+    each category.
+
+    Categories are the concepts that contain others, through **contains**
+    relations; the ranking of a category includes all of its descendants.
+
+    Concepts are ranked by the Bayesian average of their scores (see
+    `RatingStats.bayesian_average`), which shrinks the average of concepts
+    with few ratings towards the average of all scores, or by their number of
+    ratings. Concepts without ratings are never ranked.
+
+    Rankings are rebuilt on the first query after ratings or relations
+    change, but no more often than every `max_age` seconds; call `refresh` to
+    rebuild them immediately.
+
+    Instances can be passed to `User.suggest_concepts`, and the one held by
+    each registry (see `Registry.popularity`) is used for users with few
+    ratings.
+    """
+
+    def __init__(self,
+        registry = None,
+        size = 100,
+        prior_weight = 10,
+        by_count = False,
+        max_age = 60
+    ):
+        """Create a new ranking.
+
+        :param registry: The `Registry` holding the concepts and ratings.
+            Defaults to `Registry.default`.
+        :param size: The number of concepts kept in each ranking.
+        :param prior_weight: The number of ratings that the average of all
+            scores is worth, when computing Bayesian averages.
+        :param by_count: If True, rank concepts by their number of ratings
+            instead of by their Bayesian average.
+        :param max_age: The minimum time between rebuilds, in seconds.
+        """
+        if registry is None:
+            registry = Registry.default
+        self.registry = registry
+        self.size = size
+        self.prior_weight = prior_weight
+        self.by_count = by_count
+        self.max_age = max_age
+        self._versions = None
+        self._built = None
+        self._scores = []
+        self._global = []
+        self._categories = {}
+
+    def refresh(self):
+        """Rebuild the rankings from the current rating aggregates."""
+        registry = self.registry
+        store = registry.ratings
+        versions = (store.version, len(registry.relations))
+        prior_mean = store.stats().mean
+
+        scores = []
+        for concept in registry.concepts:
+            stats = store.concept_stats(concept.id)
+            if not stats.count:
+                scores.append(None)
+            elif self.by_count:
+                scores.append(stats.count)
+            else:
+                scores.append(
+                    stats.bayesian_average(prior_mean, self.prior_weight)
+                )
+
+        self._scores = scores
+        self._global = self._rank(registry.concepts)
+        self._categories = dict(
+            (concept, self._rank(concept.related("contains", None)))
+            for concept in registry.concepts
+            if concept.related_by("contains")
+        )
+        self._versions = versions
+        self._built = time()
+
+    def top(self, category = None, count = None):
+        """Obtain the most popular concepts.
+
+        :param category: If given, only concepts contained by this concept
+            (directly or indirectly) are considered.
+        :param count: The maximum number of concepts to return. Defaults to
+            the `size` of the ranking.
+        :return: A list of (concept, score) tuples, ordered by decreasing
+            score.
+        """
+        self._update()
+        if category is None:
+            ranking = self._global
+        else:
+            ranking = self._categories.get(category, [])
+        return ranking[:count]
+
+    def score(self, concept):
+        """Return the popularity score of a concept, or None if it has no
+        ratings.
+        """
+        self._update()
+        scores = self._scores
+        return scores[concept.id] if concept.id < len(scores) else None
+
+    @property
+    def version(self):
+        """The version of the ratings and relations that the rankings were
+        built from.
+
+        The rankings are brought up to date first, as any query would (see
+        `max_age`), so the value identifies the rankings that queries use.
+        """
+        self._update()
+        return self._versions
+
+    def cache_tag(self, user):
+        """Obtain the version of the data that the suggestions for a user
+        depend on, besides the user's own ratings, for `SuggestionCache`.
+
+        Suggestions only depend on the rankings, which can lag behind the
+        ratings and relations (see `version`).
+        """
+        return self.version
+
+    def suggest_concepts(self, user, count = 8):
+        """Suggest popular concepts to a user.
+
+        Concepts in the categories of the concepts that the user rated come
+        first, followed by the most popular concepts overall. Concepts the
+        user already rated are excluded.
+
+        :return: A list of (concept, score, contributors) tuples. For concepts
+            suggested because of their category, contributors are the rated
+            concepts in the same category, ordered by decreasing score.
+        """
+        self._update()
+        rated = user._ratings
+
+        contributors = {}
+        for concept, score in rated.iterscores():
+            for category in concept.related("contained_by", None):
+                for candidate, popularity in self._categories.get(
+                    category,
+                    ()
+                ):
+                    if candidate not in rated:
+                        contributors.setdefault(candidate, {})[concept] = \
+                            score
+
+        suggestions = [
+            (
+                candidate,
+                self._scores[candidate.id],
+                [
+                    concept
+                    for concept, score in sorted(
+                        seeds.iteritems(),
+                        key = lambda item: -item[1]
+                    )
+                ]
+            )
+            for candidate, seeds in nlargest(
+                count,
+                contributors.iteritems(),
+                key = lambda item: self._scores[item[0].id]
+            )
+        ]
+
+        for candidate, popularity in self._global:
+            if len(suggestions) >= count:
+                break
+            if candidate not in rated and candidate not in contributors:
+                suggestions.append((candidate, popularity, []))
+
+        return suggestions
+
+    def _update(self):
+        # Rebuild the rankings if they are stale and old enough
+        registry = self.registry
+        if self._versions is None or (
+            self._versions != (
+                registry.ratings.version,
+                len(registry.relations)
+            )
+            and time() - self._built >= self.max_age
+        ):
+            self.refresh()
+
+    def _rank(self, concepts):
+        scores = self._scores
+        return nlargest(
+            self.size,
+            (
+                (concept, scores[concept.id])
+                for concept in concepts
+                if scores[concept.id] is not None
+            ),
+            key = itemgetter(1)
+        )
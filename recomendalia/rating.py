@@ -15,27 +15,66 @@ class Rating(object):
         - The `score` given by the user to the concept.
 
     Ratings are automatically added to the `User.ratings` and `Concept.ratings`
-    properties as soon as they are instantiated.
+    properties as soon as they are instantiated. Those properties are views
+    over the `RatingStore` of the users' `Registry`, which keeps the score of
+    each rating in a compact, columnar form: accessing them creates new
+    `Rating` objects on demand.
     
     All the properties of this class are read only.
+
+    Other objects can keep track of new ratings by adding a callable to the
+    `listeners` list. Each listener is called with the new rating and the
+    rating it replaces (or None, if the user hadn't rated the concept yet),
+    after the rating has been added to the `User.ratings` and
+    `Concept.ratings` properties.
     """
     MIN_SCORE = 0
     MAX_SCORE = 5
 
+    listeners = []
+
+    __slots__ = ("__user", "__concept", "__score")
+
     def __init__(self, user, concept, score):
 
-        if not (self.MIN_SCORE <= score <= self.MAX_SCORE):
+        if not (self.MIN_SCORE <= score <= self.MAX_SCORE) \
+        or score != int(score):
             raise ValueError(
-                "%r is not a valid score. Expected a value between %d and %d"
-                % (score, self.MIN_SCORE, self.MAX_SCORE)
+                "%r is not a valid score. Expected an integer between %d and "
+                "%d" % (score, self.MIN_SCORE, self.MAX_SCORE)
+            )
+
+        score = int(score)
+
+        if concept.registry is not user.registry:
+            raise ValueError(
+                "Can't rate %r: %r belongs to a different registry"
+                % (concept, user)
             )
 
         self.__user = user
         self.__concept = concept
         self.__score = score
 
-        user._ratings[concept] = self
-        concept._ratings[user] = self
+        previous_score = user.registry.ratings.set(user.id, concept.id, score)
+        user._version += 1
+
+        if self.listeners:
+            previous = (
+                None if previous_score is None
+                else self._view(user, concept, previous_score)
+            )
+            for listener in self.listeners:
+                listener(self, previous)
+
+    @classmethod
+    def _view(cls, user, concept, score):
+        # Create a rating object for data that is already in a rating store
+        rating = cls.__new__(cls)
+        rating.__user = user
+        rating.__concept = concept
+        rating.__score = score
+        return rating
 
     def __repr__(self):
         return "%s(%r, %r, %r)" % (
@@ -0,0 +1,675 @@
+#-*- coding: utf-8 -*-
+u"""Module for the `RatingStore` class.
+"""
+from array import array
+from collections import Mapping
+from recomendalia.rating import Rating
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class RatingStore(object):
+    """A columnar store for the ratings given by users to concepts.
+
+    Ratings are kept as rows of three parallel columns: `user_ids` and
+    `concept_ids` (unsigned 32 bit integers) and `scores` (unsigned 8 bit
+    integers). Users and concepts are identified by the dense integer ids
+    assigned to them by the `Registry` that the store belongs to.
+
+    Rows are located through two offset indexes, one sorted by user and the
+    other sorted by concept, in the manner of a compressed sparse row matrix.
+    New rows are held in a small pending index until the store is compacted,
+    which happens automatically once enough new rows have been added (see
+    `COMPACTION_RATIO` and `MIN_PENDING_ROWS`), or on demand by calling
+    `compact`. Compaction is considerably faster when NumPy is installed.
+
+    The `User.ratings` and `Concept.ratings` properties are mapping views over
+    the store. `Rating` objects are created on demand whenever those views are
+    accessed.
+
+    The store also keeps running aggregates of the scores given to each
+    concept (count, sum, sum of squares and a histogram of scores), updated
+    in constant time as scores are set or replaced. See `concept_stats` and
+    `stats`.
+
+    The `version` attribute of the store is increased every time a score is
+    set. Each concept also has its own version (see `concept_version`).
+    """
+    COMPACTION_RATIO = 8
+    MIN_PENDING_ROWS = 4096
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._users = registry.users
+        self._concepts = registry.concepts
+        self.user_ids = array("I")
+        self.concept_ids = array("I")
+        self.scores = array("B")
+        self._by_user = _RowIndex(self.user_ids, self.concept_ids)
+        self._by_concept = _RowIndex(self.concept_ids, self.user_ids)
+        self._pending = 0
+        self.version = 0
+        self._levels = Rating.MAX_SCORE - Rating.MIN_SCORE + 1
+        self._counts = array("I")
+        self._sums = array("L")
+        self._squares = array("L")
+        self._histograms = array("I")
+        self._versions = array("L")
+        self._total = [0, 0, 0]
+        self._histogram = array("I", [0] * self._levels)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def user_ratings(self, user):
+        """Obtain a `UserRatings` view over the ratings of a user."""
+        return UserRatings(self, user, user.id)
+
+    def concept_ratings(self, concept):
+        """Obtain a `ConceptRatings` view over the ratings of a concept."""
+        return ConceptRatings(self, concept, concept.id)
+
+    def find(self, user_id, concept_id):
+        """Return the row holding the rating of a concept by a user, or None
+        if the user hasn't rated the concept.
+        """
+        return self._by_user.find(user_id, concept_id)
+
+    def score(self, user_id, concept_id):
+        """Return the score given by a user to a concept, or None if the user
+        hasn't rated the concept.
+        """
+        row = self._by_user.find(user_id, concept_id)
+        return None if row is None else self.scores[row]
+
+    def concept_stats(self, concept_id):
+        """Obtain the aggregates of the scores given to a concept.
+
+        :return: A `RatingStats` object.
+        """
+        if concept_id >= len(self._counts):
+            return RatingStats(0, 0, 0, (0,) * self._levels)
+        levels = self._levels
+        start = concept_id * levels
+        return RatingStats(
+            self._counts[concept_id],
+            self._sums[concept_id],
+            self._squares[concept_id],
+            tuple(self._histograms[start:start + levels])
+        )
+
+    def stats(self):
+        """Obtain the aggregates of all the scores in the store.
+
+        :return: A `RatingStats` object.
+        """
+        count, total, squares = self._total
+        return RatingStats(count, total, squares, tuple(self._histogram))
+
+    def concept_version(self, concept_id):
+        """Obtain the version of a concept.
+
+        The version of a concept is increased whenever a user sets a score,
+        on that concept or on any other concept, if the user has rated the
+        concept. It therefore changes whenever the score vector of the
+        concept, or its co-ratings with other concepts, change.
+        """
+        if concept_id >= len(self._versions):
+            return 0
+        return self._versions[concept_id]
+
+    def concepts_version(self, concept_ids):
+        """Obtain a value that changes whenever the version of any of the
+        given concepts changes (see `concept_version`).
+        """
+        versions = self._versions
+        size = len(versions)
+        return sum(
+            versions[concept_id]
+            for concept_id in concept_ids
+            if concept_id < size
+        )
+
+    def user_rows(self, user_ids):
+        """Obtain the rows holding the ratings given by several users.
+
+        :param user_ids: An iterable sequence of user ids.
+        :return: An array of row numbers, grouped by user, in the order of
+            `user_ids`. The number of rows of each user is the length of its
+            `User.ratings`.
+        """
+        return self._by_user.collect(user_ids)
+
+    def concept_rows(self, concept_ids):
+        """Obtain the rows holding the ratings given to several concepts.
+
+        :param concept_ids: An iterable sequence of concept ids.
+        :return: An array of row numbers, grouped by concept, in the order of
+            `concept_ids`.
+        """
+        return self._by_concept.collect(concept_ids)
+
+    def set(self, user_id, concept_id, score):
+        """Set the score given by a user to a concept.
+
+        :return: The score that the user previously gave to the concept, or
+            None if this is the first time the user rates it.
+        """
+        row = self._by_user.find(user_id, concept_id)
+        self.version += 1
+
+        if row is not None:
+            previous = self.scores[row]
+            self.scores[row] = score
+            self._aggregate(concept_id, score, previous)
+        else:
+            previous = None
+            self._aggregate(concept_id, score, None)
+            self._append(user_id, concept_id, score)
+            self._pending += 1
+            self._auto_compact()
+
+        versions = self._versions
+        concept_ids = self.concept_ids
+        for row in self._by_user.rows(user_id):
+            versions[concept_ids[row]] += 1
+
+        return previous
+
+    def merge(self, user_ids, concept_ids, scores):
+        """Set many scores at once.
+
+        Like calling `set` for each score, but the store is compacted at most
+        once. Scores given to concepts that a user already rated replace the
+        previous ones, and if the same user and concept appear more than
+        once, the last score wins. Unlike creating `Rating` objects, this
+        doesn't validate the scores, notify `Rating.listeners` or increase
+        `User.version`.
+
+        :return: The number of new ratings added to the store.
+        """
+        find = self._by_user.find
+        store_scores = self.scores
+        touched = set()
+        added = 0
+
+        for user_id, concept_id, score in zip(user_ids, concept_ids, scores):
+            touched.add(user_id)
+            row = find(user_id, concept_id)
+            if row is None:
+                self._aggregate(concept_id, score, None)
+                self._append(user_id, concept_id, score)
+                added += 1
+            else:
+                self._aggregate(concept_id, score, store_scores[row])
+                store_scores[row] = score
+
+        self.version += 1
+        self._pending += added
+        self._auto_compact()
+        self._touch(touched)
+        return added
+
+    def _append(self, user_id, concept_id, score):
+        row = len(self.scores)
+        self.user_ids.append(user_id)
+        self.concept_ids.append(concept_id)
+        self.scores.append(score)
+        self._by_user.add(user_id, concept_id, row)
+        self._by_concept.add(concept_id, user_id, row)
+
+    def _reserve(self, concept_id):
+        # Grow the aggregate columns to hold the given concept id
+        size = len(self._counts)
+        if concept_id >= size:
+            grow = max(concept_id + 1, len(self._concepts), size * 2) - size
+            self._counts.extend(array("I", [0]) * grow)
+            self._sums.extend(array("L", [0]) * grow)
+            self._squares.extend(array("L", [0]) * grow)
+            self._histograms.extend(array("I", [0]) * (grow * self._levels))
+            self._versions.extend(array("L", [0]) * grow)
+
+    def _aggregate(self, concept_id, score, previous):
+        # Update the aggregates of a concept with a new or replaced score
+        self._reserve(concept_id)
+        base = concept_id * self._levels - Rating.MIN_SCORE
+        total = self._total
+        histogram = self._histogram
+
+        if previous is None:
+            self._counts[concept_id] += 1
+            total[0] += 1
+        else:
+            self._sums[concept_id] -= previous
+            self._squares[concept_id] -= previous * previous
+            self._histograms[base + previous] -= 1
+            total[1] -= previous
+            total[2] -= previous * previous
+            histogram[previous - Rating.MIN_SCORE] -= 1
+
+        self._sums[concept_id] += score
+        self._squares[concept_id] += score * score
+        self._histograms[base + score] += 1
+        total[1] += score
+        total[2] += score * score
+        histogram[score - Rating.MIN_SCORE] += 1
+
+    def _aggregate_rows(self, start):
+        # Add the scores in the given rows (all of them new) to the aggregates
+        concept_ids = self.concept_ids[start:]
+        scores = self.scores[start:]
+        if not scores:
+            return
+
+        self._reserve(max(concept_ids))
+
+        if np is None:
+            for concept_id, score in zip(concept_ids, scores):
+                self._aggregate(concept_id, score, None)
+            return
+
+        size = len(self._counts)
+        levels = self._levels
+        concepts = np.frombuffer(concept_ids, dtype = np.uint32)
+        values = np.frombuffer(scores, dtype = np.uint8).astype(np.int64)
+        bins = concepts.astype(np.int64) * levels + values - Rating.MIN_SCORE
+
+        for column, weights in (
+            (self._counts, None),
+            (self._sums, values),
+            (self._squares, values * values)
+        ):
+            dtype = "u%d" % column.itemsize
+            column_array = np.frombuffer(column, dtype = dtype)
+            column_array += np.bincount(
+                concepts,
+                weights,
+                minlength = size
+            ).astype(dtype)
+
+        histograms = np.frombuffer(self._histograms, dtype = np.uint32)
+        histograms += np.bincount(
+            bins,
+            minlength = size * levels
+        ).astype(np.uint32)
+
+        histogram = np.frombuffer(self._histogram, dtype = np.uint32)
+        histogram += np.bincount(
+            values - Rating.MIN_SCORE,
+            minlength = levels
+        ).astype(np.uint32)
+
+        total = self._total
+        total[0] += len(values)
+        total[1] += int(values.sum())
+        total[2] += int((values * values).sum())
+
+    def _auto_compact(self):
+        if self._pending >= max(
+            self.MIN_PENDING_ROWS,
+            len(self.scores) // self.COMPACTION_RATIO
+        ):
+            self.compact()
+
+    def extend(self, user_ids, concept_ids, scores):
+        """Add ratings in bulk.
+
+        The store is compacted once all the new rows have been added. Unlike
+        creating `Rating` objects, this doesn't validate the scores, nor
+        notifies `Rating.listeners` or increases `User.version`.
+
+        :param user_ids: An iterable sequence of user ids.
+        :param concept_ids: An iterable sequence of concept ids, of the same
+            length as `user_ids`.
+        :param scores: An iterable sequence of scores, of the same length as
+            `user_ids`.
+        :raise ValueError: If the sequences are not of the same length. The
+            caller is responsible for ensuring that the new ratings don't
+            repeat a user and concept pair, either among themselves or with
+            the ratings already in the store.
+        """
+        size = len(self.scores)
+        self.user_ids.extend(user_ids)
+        self.concept_ids.extend(concept_ids)
+        self.scores.extend(scores)
+        added = len(self.scores) - size
+
+        if len(self.user_ids) != len(self.scores) \
+        or len(self.concept_ids) != len(self.scores):
+            del self.user_ids[size:]
+            del self.concept_ids[size:]
+            del self.scores[size:]
+            raise ValueError("Rating columns must be of the same length")
+
+        self._aggregate_rows(size)
+
+        self.version += 1
+        self._pending += added
+        self.compact()
+        self._touch(set(self.user_ids[size:]))
+
+    def _touch(self, user_ids):
+        # Increase the version of the concepts rated by the given users
+        rows = self._by_user.collect(user_ids)
+        if not rows:
+            return
+
+        versions = self._versions
+        concept_ids = self.concept_ids
+
+        if np is None:
+            for concept_id in set(concept_ids[row] for row in rows):
+                versions[concept_id] += 1
+            return
+
+        concepts = np.frombuffer(concept_ids, dtype = np.uint32)[
+            np.frombuffer(rows, dtype = np.uint32)
+        ]
+        versions_array = np.frombuffer(
+            versions,
+            dtype = "u%d" % versions.itemsize
+        )
+        versions_array[np.unique(concepts)] += 1
+
+    def compact(self):
+        """Merge all the pending rows into the offset indexes."""
+        if self._pending:
+            self._by_user.rebuild(len(self._users), len(self._concepts))
+            self._by_concept.rebuild(len(self._concepts), len(self._users))
+            self._pending = 0
+
+
+class RatingStats(object):
+    """Aggregates of a set of scores, as kept by a `RatingStore`.
+
+    :ivar count: The number of scores.
+    :ivar total: The sum of the scores.
+    :ivar squares: The sum of the squares of the scores.
+    :ivar histogram: A tuple with the number of times each score was given,
+        from `Rating.MIN_SCORE` to `Rating.MAX_SCORE`.
+    """
+    __slots__ = ("count", "total", "squares", "histogram")
+
+    def __init__(self, count, total, squares, histogram):
+        self.count = count
+        self.total = total
+        self.squares = squares
+        self.histogram = histogram
+
+    def __repr__(self):
+        return "%s(count = %d, mean = %.3f)" % (
+            self.__class__.__name__,
+            self.count,
+            self.mean
+        )
+
+    @property
+    def mean(self):
+        """The average score, or 0 if there are no scores."""
+        return float(self.total) / self.count if self.count else 0.0
+
+    @property
+    def variance(self):
+        """The variance of the scores, or 0 if there are no scores."""
+        if not self.count:
+            return 0.0
+        mean = self.mean
+        return max(float(self.squares) / self.count - mean * mean, 0.0)
+
+    def bayesian_average(self, prior_mean, prior_weight):
+        """Compute the average score, shrunk towards a prior.
+
+        Concepts with few ratings get an average close to `prior_mean`, and
+        the average of concepts with many ratings approaches their actual
+        mean.
+
+        :param prior_mean: The average assumed in the absence of ratings
+            (usually, the average of all scores).
+        :param prior_weight: The number of ratings that the prior is worth.
+        """
+        return (
+            (prior_mean * prior_weight + self.total)
+            / float(prior_weight + self.count)
+            if prior_weight + self.count else prior_mean
+        )
+
+
+class _RowIndex(object):
+    # An index of the rows of the store, grouped by the values of one of its
+    # id columns (the "key" column) and sorted by the values of the other
+
+    def __init__(self, keys, values):
+        self._keys = keys
+        self._values = values
+        self._offsets = array("L", [0])
+        self._rows = array("I")
+        self._pending = {}
+
+    def find(self, key, value):
+        if key + 1 < len(self._offsets):
+            rows = self._rows
+            values = self._values
+            start = self._offsets[key]
+            stop = self._offsets[key + 1]
+            while start < stop:
+                middle = (start + stop) // 2
+                row = rows[middle]
+                found = values[row]
+                if found < value:
+                    start = middle + 1
+                elif found > value:
+                    stop = middle
+                else:
+                    return row
+
+        pending = self._pending.get(key)
+        return None if pending is None else pending.get(value)
+
+    def add(self, key, value, row):
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = {value: row}
+        else:
+            pending[value] = row
+
+    def count(self, key):
+        count = 0
+        if key + 1 < len(self._offsets):
+            count = self._offsets[key + 1] - self._offsets[key]
+        pending = self._pending.get(key)
+        if pending is not None:
+            count += len(pending)
+        return count
+
+    def rows(self, key):
+        if key + 1 < len(self._offsets):
+            for row in self._rows[self._offsets[key]:self._offsets[key + 1]]:
+                yield row
+        pending = self._pending.get(key)
+        if pending is not None:
+            for row in pending.values():
+                yield row
+
+    def collect(self, keys):
+        offsets = self._offsets
+        index_rows = self._rows
+        pending = self._pending
+        size = len(offsets) - 1
+        rows = array("I")
+        for key in keys:
+            if key < size:
+                rows.extend(index_rows[offsets[key]:offsets[key + 1]])
+            if key in pending:
+                rows.extend(pending[key].values())
+        return rows
+
+    def rebuild(self, key_count, value_count):
+        if np is not None and len(self._keys):
+            self._rebuild_vectorized(key_count)
+            return
+
+        # Two stable counting sorts (by value, then by key) order the rows
+        # without materializing them in Python lists
+        rows = xrange(len(self._keys))
+        rows = _counting_sort(rows, self._values, value_count)[0]
+        self._rows, self._offsets = \
+            _counting_sort(rows, self._keys, key_count)
+        self._pending = {}
+
+    def _rebuild_vectorized(self, key_count):
+        keys = np.frombuffer(self._keys, dtype = np.uint32)
+        values = np.frombuffer(self._values, dtype = np.uint32)
+
+        # Sorting a single combined key is much faster than a lexsort
+        combined = keys.astype(np.uint64) << 32
+        combined |= values
+        rows = np.argsort(combined).astype(np.uint32)
+        del combined
+        offsets = np.zeros(
+            key_count + 1,
+            dtype = "u%d" % self._offsets.itemsize
+        )
+        np.cumsum(np.bincount(keys, minlength = key_count), out = offsets[1:])
+
+        self._rows = array("I")
+        self._rows.fromstring(rows.tostring())
+        self._offsets = array("L")
+        self._offsets.fromstring(offsets.tostring())
+        self._pending = {}
+
+
+def _counting_sort(rows, column, size):
+    # Stable sort of row numbers by their value in the given column, which
+    # must be in the [0, size) range. Returns the sorted rows and the offset
+    # of each value in them.
+    offsets = array("L", [0]) * (size + 1)
+    for row in rows:
+        offsets[column[row] + 1] += 1
+    for value in xrange(size):
+        offsets[value + 1] += offsets[value]
+
+    positions = array("L", offsets)
+    result = array("I", [0]) * len(rows)
+    for row in rows:
+        value = column[row]
+        result[positions[value]] = row
+        positions[value] += 1
+
+    return result, offsets
+
+
+class _RatingsView(Mapping):
+    # Base class for the UserRatings and ConceptRatings views
+
+    def __init__(self, store, owner, owner_id):
+        self._store = store
+        self._owner = owner
+        self._id = owner_id
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, dict(self.iteritems()))
+
+    @property
+    def store(self):
+        """The `RatingStore` that the view reads from."""
+        return self._store
+
+    def __getitem__(self, key):
+        row = self._find(key)
+        if row is None:
+            raise KeyError(key)
+        return self._rating(key, self._store.scores[row])
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __len__(self):
+        return self._index.count(self._id)
+
+    def __iter__(self):
+        entities = self._entities
+        columns = self._columns
+        for row in self._index.rows(self._id):
+            yield entities[columns[row]]
+
+    def iteritems(self):
+        entities = self._entities
+        columns = self._columns
+        scores = self._store.scores
+        for row in self._index.rows(self._id):
+            key = entities[columns[row]]
+            yield key, self._rating(key, scores[row])
+
+    def itervalues(self):
+        for key, rating in self.iteritems():
+            yield rating
+
+    def iterscores(self):
+        """Iterate over (key, score) tuples, without creating `Rating`
+        objects.
+        """
+        entities = self._entities
+        columns = self._columns
+        scores = self._store.scores
+        for row in self._index.rows(self._id):
+            yield entities[columns[row]], scores[row]
+
+    def _find(self, key):
+        try:
+            view = key._ratings
+        except AttributeError:
+            return None
+        if view._store is not self._store or view.__class__ is self.__class__:
+            return None
+        return self._locate(view._id)
+
+
+class UserRatings(_RatingsView):
+    """A mapping view over the ratings given by a user, indexed by the rated
+    `Concept`.
+    """
+
+    @property
+    def _index(self):
+        return self._store._by_user
+
+    @property
+    def _entities(self):
+        return self._store._concepts
+
+    @property
+    def _columns(self):
+        return self._store.concept_ids
+
+    def _locate(self, concept_id):
+        return self._store._by_user.find(self._id, concept_id)
+
+    def _rating(self, concept, score):
+        return Rating._view(self._owner, concept, score)
+
+
+class ConceptRatings(_RatingsView):
+    """A mapping view over the ratings given to a concept, indexed by the
+    `User` that gave them.
+    """
+
+    @property
+    def _index(self):
+        return self._store._by_concept
+
+    @property
+    def _entities(self):
+        return self._store._users
+
+    @property
+    def _columns(self):
+        return self._store.user_ids
+
+    def _locate(self, user_id):
+        return self._store._by_user.find(user_id, self._id)
+
+    def _rating(self, user, score):
+        return Rating._view(user, self._owner, score)
@@ -0,0 +1,101 @@
+#-*- coding: utf-8 -*-
+u"""Module for the `Registry` class.
+"""
+from recomendalia.ratingstore import RatingStore
+
+
+class Registry(object):
+    """A data set of users, concepts, relations and ratings.
+
+    Every `User`, `Concept` and `Relation` is added to a registry as soon as it
+    is instantiated, and the registry assigns it a dense integer `id`: users,
+    concepts and relations are numbered separately, starting from 0, in
+    order of creation. Ids can therefore be used to index arrays holding data
+    for each user, concept or relation, and the `users`, `concepts` and
+    `relations` lists map ids back to their objects.
+
+    The registry also holds the `RatingStore` for the ratings given by its
+    users to its concepts (see the `ratings` property), and memoizes the
+    results of `Concept.related` in its `traversal_cache`, which is cleared
+    every time a relation is added. Users can only rate concepts, and
+    concepts can only be related to concepts, belonging to the same registry.
+
+    Unless told otherwise, new objects are added to the `Registry.default`
+    registry. To start a new, independent data set, either assign a new
+    registry to `Registry.default` or pass one explicitly to the `User` and
+    `Concept` constructors.
+
+    Other objects can keep track of new users and concepts by adding a
+    callable to the `listeners` list. Each listener is called with the
+    registry and every new `User` or `Concept`, as soon as it has been
+    assigned its id (and before its constructor returns).
+    """
+    default = None
+    listeners = []
+
+    def __init__(self):
+        self.users = []
+        self.concepts = []
+        self.relations = []
+        self.ratings = RatingStore(self)
+        self.traversal_cache = {}
+        self._popularity = None
+
+    def __repr__(self):
+        return "%s(%d users, %d concepts, %d relations, %d ratings)" % (
+            self.__class__.__name__,
+            len(self.users),
+            len(self.concepts),
+            len(self.relations),
+            len(self.ratings)
+        )
+
+    @property
+    def popularity(self):
+        """The `recomendalia.popularity.PopularityRanking` of the registry's
+        concepts, used by `User.suggest_concepts` for users with few ratings.
+
+        The ranking is created with its default parameters on first access.
+        """
+        if self._popularity is None:
+            from recomendalia.popularity import PopularityRanking
+            self._popularity = PopularityRanking(self)
+        return self._popularity
+
+    def add_user(self, user):
+        """Add a user to the registry.
+
+        :return: The id assigned to the user.
+        """
+        user_id = len(self.users)
+        self.users.append(user)
+        user.id = user_id
+        for listener in self.listeners:
+            listener(self, user)
+        return user_id
+
+    def add_concept(self, concept):
+        """Add a concept to the registry.
+
+        :return: The id assigned to the concept.
+        """
+        concept_id = len(self.concepts)
+        self.concepts.append(concept)
+        concept.id = concept_id
+        for listener in self.listeners:
+            listener(self, concept)
+        return concept_id
+
+    def add_relation(self, relation):
+        """Add a relation to the registry.
+
+        :return: The id assigned to the relation.
+        """
+        relation_id = len(self.relations)
+        self.relations.append(relation)
+        if self.traversal_cache:
+            self.traversal_cache.clear()
+        return relation_id
+
+
+Registry.default = Registry()
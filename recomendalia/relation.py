@@ -33,8 +33,28 @@ class Relation(object):
     Because the **created_by** and **creator_of** relation types are
     complementary, declaring one end of the relation implicitly declares its
     complementary version.
+
+    Relations are added to the `Registry` of their concepts, which assigns
+    each of them a dense integer `id`.
+
+    Relation types are interned: each distinct type is assigned a small
+    integer id (see `type_id` and `type_names`), and concepts index their
+    relations by type id (see `Concept.related_by` and `Concept.referred_by`).
+
+    Other objects can keep track of new relations by adding a callable to the
+    `listeners` list. Each listener is called with every new relation
+    (including complementary relations), after it has been added to the
+    `Concept.relations` and `Concept.referrers` properties.
     """
+    listeners = []
+
+    #: The interned relation types, indexed by type id.
+    type_names = []
+
+    __slots__ = ("__source", "__type_id", "__target", "id")
+
     __complementary_relations = {}
+    __type_ids = {}
 
     for a, b in (
         ("created_by", "creator_of"),
@@ -49,12 +69,25 @@ class Relation(object):
         target,
         _is_complementary = False
     ):
+        if target.registry is not source.registry:
+            raise ValueError(
+                "Can't relate %r to %r: they belong to different registries"
+                % (source, target)
+            )
+
+        type_id = self.get_type_id(relation_type)
         self.__source = source
-        self.__relation_type = relation_type
+        self.__type_id = type_id
         self.__target = target
+        self.id = source.registry.add_relation(self)
 
         source._relations.append(self)
         target._referrers.append(self)
+        source._related_by.setdefault(type_id, []).append(target)
+        target._referred_by.setdefault(type_id, []).append(source)
+
+        for listener in self.listeners:
+            listener(self)
 
         # Create the relation's complement, if it has one. Pass an internal
         # parameter to the constructor of the complementary relation, to
@@ -75,10 +108,35 @@ class Relation(object):
         return "%s(%r, %r, %r)" % (
             self.__class__.__name__,
             self.__source,
-            self.__relation_type,
+            self.relation_type,
             self.__target
         )
 
+    @classmethod
+    def get_type_id(cls, relation_type):
+        """Return the id of a relation type, assigning it a new one if the
+        type hasn't been used before.
+        """
+        type_id = cls.__type_ids.get(relation_type)
+        if type_id is None:
+            type_id = cls.__type_ids[relation_type] = len(cls.type_names)
+            cls.type_names.append(relation_type)
+        return type_id
+
+    @classmethod
+    def find_type_id(cls, relation_type):
+        """Return the id of a relation type, or None if no relation of that
+        type has been created yet.
+        """
+        return cls.__type_ids.get(relation_type)
+
+    @classmethod
+    def complementary_type(cls, relation_type):
+        """Return the relation type that complements the given one, or None if
+        it has no complement.
+        """
+        return cls.__complementary_relations.get(relation_type)
+
     @property
     def source(self):
         """Indicates the concept that the relation originates from.
@@ -125,5 +183,10 @@ class Relation(object):
                 that the source concept describes a topic of category which
                 the target concept is a part of.
         """
-        return self.__relation_type
+        return self.type_names[self.__type_id]
+
+    @property
+    def type_id(self):
+        """The interned id of the `relation_type` of the relation."""
+        return self.__type_id
 
@@ -1,19 +1,28 @@
 #-*- coding: utf-8 -*-
 u"""A module providing functions that generate sample data for the exercise.
 
+Data generation is vectorized with NumPy, so that large data sets (millions
+of users) can be produced quickly for benchmarking purposes.
+
 .. moduleauthor:: Martí Congost <marti.congost@whads.com>
 """
-from random import choice, randint
+from random import choice
+import gc
+import numpy as np
 from recomendalia.user import User, FriendSuggestion
 from recomendalia.concept import Concept
 from recomendalia.rating import Rating
 from recomendalia.relation import Relation
-import collections
+from recomendalia.registry import Registry
 
 def generate_sample_data(
         user_count = 500,
         ratings_per_user = (8, 9, 10, 10, 11, 11, 12, 12, 13, 14, 15),
-        friends_per_user = (5, 6, 7, 8, 8, 9, 9, 9, 10, 12, 15, 25)
+        friends_per_user = (5, 6, 7, 8, 8, 9, 9, 9, 10, 12, 15, 25),
+        seed = None,
+        registry = None,
+        extra_concepts = 0,
+        score_weights = None
     ):
     """Generates a list of fake users and concepts to use in the exercise.
 
@@ -21,27 +30,75 @@ def generate_sample_data(
     friendship relations between the created users, and generates ratings for
     the created concepts at random.
 
+    The number of ratings and friends of each user are drawn from the given
+    distributions. A distribution can be given as a sequence of values, which
+    are chosen uniformly at random, or as a callable taking a
+    `numpy.random.RandomState` and a number of values to draw, and returning
+    an array of integers (see `power_law`). Each user establishes friendships
+    with the drawn number of other users, chosen uniformly, so its final
+    number of friends also includes the friendships established by others.
+
+    Friendships and ratings are added in bulk: they don't notify
+    `User.listeners` or `Rating.listeners`, and don't change the version of
+    the created users. Build any indexes after generating the data.
+
+    :param user_count: The number of users to create.
+    :param ratings_per_user: The distribution of the number of concepts rated
+        by each user. Users never rate more concepts than there are.
+    :param friends_per_user: The distribution of the number of friendships
+        established by each user.
+    :param seed: A seed for the random number generator. The same seed and
+        parameters always produce the same data set.
+    :param registry: The `Registry` to add the created objects to. Defaults
+        to `Registry.default`.
+    :param extra_concepts: The number of synthetic concepts to create, in
+        addition to the fixed sample taxonomy. Synthetic concepts are added
+        to the existing categories, at random.
+    :param score_weights: The relative probabilities of each score, from
+        `Rating.MIN_SCORE` to `Rating.MAX_SCORE`. Defaults to uniform
+        probabilities.
     :return: A tuple with two lists: one of `User` objects, another of
         `Concept` objects.
     """
-    users = []
-    concepts = []
-
-    # Create users
-    user_names = set()
+    # Creating millions of objects triggers lots of useless garbage
+    # collections
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _generate_sample_data(
+            user_count,
+            ratings_per_user,
+            friends_per_user,
+            np.random.RandomState(seed),
+            registry or Registry.default,
+            extra_concepts,
+            score_weights
+        )
+    finally:
+        if gc_enabled:
+            gc.enable()
 
-    for i in xrange(user_count):
-        while True:
-            name = random_user_name()
-            if name not in user_names:
-                user_names.add(name)
-                break
 
-        users.append(User(name))
+def _generate_sample_data(
+        user_count,
+        ratings_per_user,
+        friends_per_user,
+        rng,
+        registry,
+        extra_concepts,
+        score_weights
+    ):
+    # Create users
+    users = [
+        User(name, registry)
+        for name in generate_user_names(user_count, rng)
+    ]
 
     # Create concepts
-    def define(*args, **kwargs):
-        concept = Concept(*args, **kwargs)
+    concepts = []
+
+    def define(name, **kwargs):
+        concept = Concept(name, registry, **kwargs)
         concepts.append(concept)
         return concept
 
@@ -136,27 +193,202 @@ def generate_sample_data(
         define(u"Cape Fear", created_by = scorsese)
     ])
 
-    for user in users:
-
-        # Establish friendships
-        for i in xrange(choice(friends_per_user)):
-            while True:
-                friend = choice(users)
-                if friend is not user and friend not in user.friends:
-                    user.befriend(friend)
-                    break
-
-        # Rate concepts
-        for i in xrange(choice(ratings_per_user)):
-            while True:
-                concept = choice(concepts)
-                if concept not in user.ratings:
-                    score = randint(Rating.MIN_SCORE, Rating.MAX_SCORE)
-                    Rating(user, concept, score)
-                    break
+    categories = [
+        concept
+        for concept in concepts
+        if any(
+            relation.relation_type == "contains"
+            for relation in concept.relations
+        )
+    ]
+    parents = rng.randint(len(categories), size = extra_concepts).tolist()
+    for i, parent in enumerate(parents):
+        category = categories[parent]
+        define(u"%s #%d" % (category.name, i + 1), contained_by = category)
+
+    # Establish friendships
+    add_friendships(users, *random_friendships(
+        user_count,
+        _draw(friends_per_user, user_count, rng),
+        rng
+    ))
+
+    # Rate concepts
+    user_rows, concept_columns = random_ratings(
+        user_count,
+        len(concepts),
+        _draw(ratings_per_user, user_count, rng),
+        rng
+    )
+    score_range = np.arange(Rating.MIN_SCORE, Rating.MAX_SCORE + 1)
+    if score_weights is not None:
+        score_weights = np.asarray(score_weights, dtype = float)
+        score_weights = score_weights / score_weights.sum()
+    scores = rng.choice(score_range, size = len(user_rows), p = score_weights)
+
+    user_ids = np.array([user.id for user in users], dtype = np.int64)
+    concept_ids = np.array(
+        [concept.id for concept in concepts],
+        dtype = np.int64
+    )
+    registry.ratings.extend(
+        user_ids[user_rows].tolist(),
+        concept_ids[concept_columns].tolist(),
+        scores.tolist()
+    )
 
     return users, concepts
 
+
+def power_law(exponent = 2.5, minimum = 1, maximum = None):
+    """Create a power law distribution, to use with `generate_sample_data`.
+
+    Produces a few very large values (hubs) and many small ones.
+
+    :param exponent: The exponent of the distribution, greater than 1. Lower
+        values produce heavier tails.
+    :param minimum: The smallest value that can be drawn.
+    :param maximum: If given, larger values are capped to this one.
+    :return: A callable taking a `numpy.random.RandomState` and a number of
+        values to draw, and returning an array of integers.
+    :raise ValueError: If `exponent` is not greater than 1.
+    """
+    if not exponent > 1:
+        raise ValueError(
+            "The exponent of a power law must be greater than 1, got %r"
+            % exponent
+        )
+
+    def draw(rng, size):
+        values = np.floor(
+            minimum * (1 - rng.random_sample(size)) ** (-1.0 / (exponent - 1))
+        ).astype(np.int64)
+        if maximum is not None:
+            np.minimum(values, maximum, out = values)
+        return values
+
+    return draw
+
+
+def _draw(distribution, size, rng):
+    if callable(distribution):
+        return np.asarray(distribution(rng, size), dtype = np.int64)
+    return rng.choice(np.asarray(distribution, dtype = np.int64), size = size)
+
+
+def random_friendships(user_count, friends, rng):
+    """Draw random friendships between users.
+
+    :param user_count: The number of users.
+    :param friends: An array with the number of friendships established by
+        each user.
+    :param rng: A `numpy.random.RandomState`.
+    :return: Two arrays with the positions of the users at each end of each
+        friendship. Friendships are unique, and never connect a user to
+        itself.
+    """
+    if user_count < 2:
+        return np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64)
+
+    friends = np.minimum(friends, user_count - 1)
+    sources = np.repeat(np.arange(user_count, dtype = np.int64), friends)
+    targets = rng.randint(user_count - 1, size = len(sources))
+    targets += targets >= sources
+
+    keys = np.unique(
+        np.minimum(sources, targets) * user_count
+        + np.maximum(sources, targets)
+    )
+    return keys // user_count, keys % user_count
+
+
+def random_ratings(user_count, concept_count, ratings, rng):
+    """Draw random pairs of users and rated concepts.
+
+    :param user_count: The number of users.
+    :param concept_count: The number of concepts.
+    :param ratings: An array with the number of concepts rated by each user.
+    :param rng: A `numpy.random.RandomState`.
+    :return: Two arrays with the positions of the user and the concept of
+        each rating, sorted by user and concept.
+    """
+    ratings = np.minimum(ratings, concept_count)
+    users = np.arange(user_count, dtype = np.int64)
+    keys = np.zeros(0, dtype = np.int64)
+    missing = ratings
+
+    # Draw concepts with replacement, then draw again for the users that got
+    # repeated concepts
+    while missing.any():
+        rows = np.repeat(users, missing)
+        columns = rng.randint(concept_count, size = len(rows))
+        keys = np.unique(
+            np.concatenate((keys, rows * concept_count + columns))
+        )
+        missing = ratings - np.bincount(
+            keys // concept_count,
+            minlength = user_count
+        )
+
+    return keys // concept_count, keys % concept_count
+
+
+def add_friendships(users, sources, targets):
+    """Establish friendships in bulk.
+
+    Unlike `User.befriend`, this doesn't notify `User.listeners` nor changes
+    the version of the users.
+
+    :param users: A sequence of `User` objects.
+    :param sources: The positions in `users` of one end of each friendship.
+    :param targets: The positions in `users` of the other end of each
+        friendship.
+    """
+    ends = np.concatenate((sources, targets))
+    others = np.concatenate((targets, sources))
+    order = np.argsort(ends)
+    others = others[order].tolist()
+    offsets = np.searchsorted(ends[order], np.arange(len(users) + 1)).tolist()
+    get_user = users.__getitem__
+
+    for i, user in enumerate(users):
+        start = offsets[i]
+        stop = offsets[i + 1]
+        if start < stop:
+            user._friends.update(map(get_user, others[start:stop]))
+
+
+def generate_user_names(count, rng = None):
+    """Generate unique user names.
+
+    Names are random combinations of the names in `USER_NAMES` and
+    `USER_SURNAMES`. Once all combinations have been used, they are repeated
+    with an increasing numeric suffix.
+
+    :param count: The number of names to generate.
+    :param rng: A `numpy.random.RandomState`.
+    :return: A list of names.
+    """
+    if rng is None:
+        rng = np.random.RandomState()
+
+    name_count = len(USER_NAMES)
+    combinations = name_count * len(USER_SURNAMES)
+    order = rng.permutation(combinations).tolist()
+    names = []
+
+    for i in xrange(count):
+        combination = order[i % combinations]
+        name = u"%s %s" % (
+            USER_NAMES[combination % name_count],
+            USER_SURNAMES[combination // name_count]
+        )
+        if i >= combinations:
+            name = u"%s %d" % (name, i // combinations + 1)
+        names.append(name)
+
+    return names
+
 # Random name generation
 USER_NAMES = [
     "James", "John", "Gerard", "Roger", "Tom", "Charles", "Peter", "Marc",
@@ -0,0 +1,445 @@
+#-*- coding: utf-8 -*-
+u"""An HTTP server exposing friend and concept suggestions as JSON.
+
+Endpoints:
+
+    ``GET /users/<id>/friends?count=8&min_friends_in_common=2``
+        Friend suggestions for the user with the given id, as a list of
+        objects with the ``user``, ``name``, ``rank`` and
+        ``friends_in_common`` keys.
+
+    ``GET /users/<id>/concepts?count=8``
+        Concept suggestions for the user with the given id, as a list of
+        objects with the ``concept``, ``name``, ``score`` and
+        ``contributors`` keys.
+
+    ``GET /metrics``
+        A latency histogram for each endpoint, and batching statistics.
+
+Requests are served by a thread each, but suggestions are computed by a
+`MicroBatcher` per endpoint: concurrent requests for the same user (and
+parameters) are coalesced into a single computation, and requests for
+different users that arrive within a short time window are scored together,
+through `recomendalia.batch.suggest_friends_for_users` and
+`recomendalia.similarity.suggest_concepts_for_users`. Users with less than
+`User.COLD_START_RATINGS` ratings get popular concepts instead, from
+`Registry.popularity`, like `User.suggest_concepts` does.
+
+Usage::
+
+    python -m recomendalia.server --port 8000 --users 10000
+
+This module requires NumPy.
+"""
+import json
+import re
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from urlparse import urlparse, parse_qs
+from recomendalia.registry import Registry
+from recomendalia.user import User
+from recomendalia.instrumentation import LatencyHistogram
+from recomendalia.batch import suggest_friends_for_users
+from recomendalia.similarity import suggest_concepts_for_users
+
+MAX_COUNT = 100
+
+
+class MicroBatcher(object):
+    """Coalesces and batches calls to a function from multiple threads.
+
+    Threads submit keys, and block until their result is available. The
+    first key submitted starts a time window; when it expires (or when
+    `max_batch_size` keys are waiting), a background thread computes all
+    the waiting keys with a single call to the batch function. Threads that
+    submit a key that is already waiting or being computed share its
+    result.
+    """
+
+    def __init__(self, compute, window = 0.005, max_batch_size = 64):
+        """Create a batcher and start its background thread.
+
+        :param compute: A callable taking a list of distinct keys and
+            returning a dictionary mapping each key to its result.
+        :param window: The time to wait for more keys before computing a
+            batch, in seconds.
+        :param max_batch_size: The maximum number of keys in a batch.
+        """
+        self.compute = compute
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.requests = 0
+        self.coalesced = 0
+        self.batches = 0
+        self._calls = {}
+        self._queue = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target = self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, key):
+        """Obtain the result for a key, waiting for its batch to complete.
+
+        :raise Exception: Any exception raised by the batch function.
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The batcher is closed")
+            self.requests += 1
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self._queue.append(key)
+                self._condition.notify()
+            else:
+                self.coalesced += 1
+
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def close(self):
+        """Stop the background thread, once the waiting keys are computed."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def stats(self):
+        """Obtain the batching statistics.
+
+        :return: A dictionary with the number of submitted keys
+            (``requests``), the number of them that were coalesced into
+            another request (``coalesced``), the number of batches computed,
+            and the average number of keys per batch.
+        """
+        with self._condition:
+            computed = self.requests - self.coalesced - len(self._queue)
+            return {
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "batches": self.batches,
+                "mean_batch_size": (
+                    float(computed) / self.batches if self.batches else 0.0
+                )
+            }
+
+    def _run(self):
+        condition = self._condition
+        while True:
+            with condition:
+                while not self._queue and not self._closed:
+                    condition.wait()
+                if not self._queue:
+                    return
+
+                # Wait for the window to expire, or for the batch to fill up
+                deadline = time.time() + self.window
+                while len(self._queue) < self.max_batch_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0 or self._closed:
+                        break
+                    condition.wait(remaining)
+
+                keys = self._queue[:self.max_batch_size]
+                del self._queue[:self.max_batch_size]
+                calls = [self._calls[key] for key in keys]
+                self.batches += 1
+
+            try:
+                results = self.compute(keys)
+                error = None
+            except Exception as error:
+                results = {}
+
+            with condition:
+                for key, call in zip(keys, calls):
+                    del self._calls[key]
+                    call.result = results.get(key)
+                    call.error = error
+                    call.done.set()
+
+
+class _Call(object):
+    # The pending result of a key submitted to a MicroBatcher
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RecommendationServer(ThreadingMixIn, HTTPServer):
+    """A threaded HTTP server for friend and concept suggestions.
+
+    The server only reads the data model; changes made to it by other
+    threads while the server runs are not synchronized.
+
+    :ivar histograms: A dictionary mapping endpoint names ("friends",
+        "concepts") to their `LatencyHistogram`.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self,
+        address = ("127.0.0.1", 8000),
+        registry = None,
+        adjusted = True,
+        batch_window = 0.005,
+        max_batch_size = 64,
+        verbose = False
+    ):
+        """Create a server, listening on the given address.
+
+        :param address: A (host, port) tuple. Use port 0 to listen on any
+            free port (see the `server_address` attribute).
+        :param registry: The `Registry` to serve suggestions for. Defaults
+            to `Registry.default`.
+        :param adjusted: Whether concept suggestions use the adjusted cosine
+            similarity (see `recomendalia.similarity.suggest_concepts`).
+        :param batch_window: The time window for batching requests, in
+            seconds.
+        :param max_batch_size: The maximum number of users scored in a
+            single batch.
+        :param verbose: If True, log each request to standard error.
+        """
+        HTTPServer.__init__(self, address, _RequestHandler)
+        self.registry = registry or Registry.default
+        self.adjusted = adjusted
+        self.verbose = verbose
+        self.histograms = {
+            "friends": LatencyHistogram(),
+            "concepts": LatencyHistogram()
+        }
+        self.batchers = {
+            "friends": MicroBatcher(
+                self._suggest_friends,
+                batch_window,
+                max_batch_size
+            ),
+            "concepts": MicroBatcher(
+                self._suggest_concepts,
+                batch_window,
+                max_batch_size
+            )
+        }
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        for batcher in self.batchers.itervalues():
+            batcher.close()
+
+    def metrics(self):
+        """Obtain the latency histograms and batching statistics of each
+        endpoint.
+        """
+        return dict(
+            (
+                endpoint,
+                {
+                    "latency": self.histograms[endpoint].snapshot(),
+                    "batching": self.batchers[endpoint].stats()
+                }
+            )
+            for endpoint in self.histograms
+        )
+
+    def _suggest_friends(self, keys):
+        # Keys are (user id, count, min friends in common) tuples
+        results = {}
+        for (count, min_friends_in_common), group in _group(keys).iteritems():
+            users = self.registry.users
+            suggestions = suggest_friends_for_users(
+                [users[user_id] for user_id in group],
+                count,
+                min_friends_in_common
+            )
+            for user_id in group:
+                results[(user_id, count, min_friends_in_common)] = [
+                    {
+                        "user": suggestion.user.id,
+                        "name": suggestion.user.name,
+                        "rank": suggestion.rank,
+                        "friends_in_common": [
+                            friend.id
+                            for friend in suggestion.friendsincommon
+                        ]
+                    }
+                    for suggestion in suggestions[users[user_id]]
+                ]
+        return results
+
+    def _suggest_concepts(self, keys):
+        # Keys are (user id, count) tuples
+        results = {}
+        for (count,), group in _group(keys).iteritems():
+            users = [self.registry.users[user_id] for user_id in group]
+
+            # Users with few ratings get popular concepts, as in
+            # User.suggest_concepts
+            cold = [
+                user
+                for user in users
+                if len(user._ratings) < User.COLD_START_RATINGS
+            ]
+            suggestions = suggest_concepts_for_users(
+                [
+                    user
+                    for user in users
+                    if len(user._ratings) >= User.COLD_START_RATINGS
+                ],
+                count,
+                self.adjusted
+            )
+            popularity = self.registry.popularity
+            for user in cold:
+                suggestions[user] = popularity.suggest_concepts(user, count)
+
+            for user_id in group:
+                results[(user_id, count)] = [
+                    {
+                        "concept": concept.id,
+                        "name": concept.name,
+                        "score": score,
+                        "contributors": [
+                            contributor.id
+                            for contributor in contributors
+                        ]
+                    }
+                    for concept, score, contributors
+                    in suggestions[self.registry.users[user_id]]
+                ]
+        return results
+
+
+def _group(keys):
+    # Group (user id, parameters...) keys by their parameters
+    groups = {}
+    for key in keys:
+        groups.setdefault(key[1:], []).append(key[0])
+    return groups
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+
+    _suggestions_path = re.compile(r"^/users/(\d+)/(friends|concepts)/?$")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+
+        if url.path == "/metrics":
+            self._respond(200, self.server.metrics())
+            return
+
+        match = self._suggestions_path.match(url.path)
+        if match is None:
+            self._respond(404, {"error": "Not found"})
+            return
+
+        start = time.time()
+        user_id = int(match.group(1))
+        endpoint = match.group(2)
+        if user_id >= len(self.server.registry.users):
+            self._respond(404, {"error": "Unknown user: %d" % user_id})
+            return
+
+        query = parse_qs(url.query)
+        try:
+            count = self._integer(query, "count", 8, 1, MAX_COUNT)
+            if endpoint == "friends":
+                key = (
+                    user_id,
+                    count,
+                    self._integer(query, "min_friends_in_common", 2, 1)
+                )
+            else:
+                key = (user_id, count)
+        except ValueError as error:
+            self._respond(400, {"error": str(error)})
+            return
+
+        try:
+            result = self.server.batchers[endpoint].submit(key)
+        except Exception as error:
+            self._respond(500, {"error": str(error)})
+            return
+
+        self._respond(200, result)
+        self.server.histograms[endpoint].observe(time.time() - start)
+
+    def _integer(self, query, name, default, minimum, maximum = None):
+        values = query.get(name)
+        if not values:
+            return default
+        try:
+            value = int(values[-1])
+        except ValueError:
+            raise ValueError("%s must be an integer" % name)
+        if value < minimum or (maximum is not None and value > maximum):
+            raise ValueError("%s is out of range" % name)
+        return value
+
+    def _respond(self, status, data):
+        body = json.dumps(data)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def main(argv = None):
+    parser = ArgumentParser(description = __doc__.split("\n")[0])
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8000)
+    parser.add_argument("--snapshot",
+        help = "serve the data set in this snapshot file")
+    parser.add_argument("--users", type = int, default = 1000,
+        help = "the number of users to generate, if no snapshot is given")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--batch-window", type = float, default = 0.005,
+        help = "the time window for batching requests, in seconds")
+    parser.add_argument("--max-batch-size", type = int, default = 64)
+    parser.add_argument("--verbose", action = "store_true")
+    args = parser.parse_args(argv)
+
+    if args.snapshot:
+        from recomendalia.snapshot import load_snapshot
+        registry = load_snapshot(args.snapshot).registry
+    else:
+        from recomendalia.sampledata import generate_sample_data
+        registry = Registry()
+        generate_sample_data(args.users, seed = args.seed, registry = registry)
+
+    server = RecommendationServer(
+        (args.host, args.port),
+        registry,
+        batch_window = args.batch_window,
+        max_batch_size = args.max_batch_size,
+        verbose = args.verbose
+    )
+    sys.stderr.write(
+        "Serving %r on http://%s:%d/\n"
+        % ((registry,) + server.server_address[:2])
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+#-*- coding: utf-8 -*-
+u"""Item-based collaborative filtering, used by `User.suggest_concepts`.
+
+Concepts are compared through the scores they received from the users that
+rated them: two concepts are similar when the same users rated them in a
+similar way. The interest of a user in a concept is predicted from the scores
+that the user gave to similar concepts.
+
+All computations are performed as batched array operations over a user×concept
+score matrix. The rows of the matrix are the users in the neighbourhood of
+the users being served, up to `MAX_NEIGHBOURS`, and the matrix is built from
+the columns of the `RatingStore`. This module requires NumPy.
+"""
+import numpy as np
+from recomendalia.rating import Rating
+
+#: The maximum number of users whose scores are used to compare concepts.
+#: Users that rated more of the concepts rated by the users being served are
+#: preferred.
+MAX_NEIGHBOURS = 5000
+
+
+def rating_matrix(users, concepts, adjusted = True):
+    """Build a dense score matrix for the given users and concepts.
+
+    :param users: A sequence of `User` objects, giving the rows of the matrix.
+    :param concepts: A sequence of `Concept` objects, giving its columns.
+        Ratings for concepts not in this sequence are ignored.
+    :param adjusted: If True, each score is centered on the average score
+        given by its user (taking all the user's ratings into account).
+    :return: A tuple with the score matrix, a boolean matrix of the same shape
+        flagging the rated entries, and an array with the average score of
+        each user.
+    """
+    matrix = np.zeros((len(users), len(concepts)))
+    rated = np.zeros((len(users), len(concepts)), dtype = bool)
+    means = np.zeros(len(users))
+    if not len(users):
+        return matrix, rated, means
+
+    store = users[0].registry.ratings
+    store_rows = np.array(
+        store.user_rows([user.id for user in users]),
+        dtype = np.int64
+    )
+    counts = np.array([len(user._ratings) for user in users])
+    rows = np.repeat(np.arange(len(users)), counts)
+    scores = np.frombuffer(store.scores, dtype = np.uint8)[store_rows]
+    np.divide(
+        np.bincount(rows, weights = scores, minlength = len(users)),
+        counts,
+        out = means,
+        where = counts > 0
+    )
+
+    column = np.full(len(store.registry.concepts), -1, dtype = np.int64)
+    column[[concept.id for concept in concepts]] = np.arange(len(concepts))
+    columns = column[
+        np.frombuffer(store.concept_ids, dtype = np.uint32)[store_rows]
+    ]
+    included = columns >= 0
+    rows = rows[included]
+    columns = columns[included]
+    matrix[rows, columns] = scores[included]
+    rated[rows, columns] = True
+
+    if adjusted:
+        matrix -= means[:, np.newaxis]
+        matrix[~rated] = 0
+
+    return matrix, rated, means
+
+
+def concept_similarities(matrix, columns = None):
+    """Compute the cosine similarity between the columns of a score matrix.
+
+    :param matrix: A user×concept score matrix, as produced by
+        `rating_matrix`.
+    :param columns: If given, only the similarities to these columns are
+        computed.
+    :return: A matrix with a row for each concept and a column for each of the
+        requested concepts.
+    """
+    target = matrix if columns is None else matrix[:, columns]
+    dots = matrix.T.dot(target)
+    norms = np.sqrt((matrix ** 2).sum(axis = 0))
+    target_norms = norms if columns is None else norms[columns]
+    denominator = np.outer(norms, target_norms)
+    return np.divide(
+        dots,
+        denominator,
+        out = np.zeros_like(dots),
+        where = denominator > 0
+    )
+
+
+def predict_scores(similarities, scores, mean = 0.0):
+    """Predict the score a user would give to each concept.
+
+    The prediction for a concept is the average of the scores that the user
+    gave to the concepts it is positively similar to, weighted by similarity.
+
+    :param similarities: A concept×rated concept similarity matrix, as
+        produced by `concept_similarities`.
+    :param scores: The scores given by the user to the rated concepts (centered
+        on `mean`, if the similarities were computed from adjusted scores).
+    :param mean: An offset added to all the predictions.
+    :return: A tuple with the predicted scores, and the similarity weights
+        used to compute them. Concepts without similar rated concepts get a
+        prediction of NaN.
+    """
+    weights = np.clip(similarities, 0, None)
+    total = weights.sum(axis = 1)
+    predictions = np.full(len(weights), np.nan)
+    np.divide(weights.dot(scores), total, out = predictions, where = total > 0)
+    predictions += mean
+    np.clip(predictions, Rating.MIN_SCORE, Rating.MAX_SCORE, out = predictions)
+    return predictions, weights
+
+
+def top_scores(scores, count):
+    """Obtain the positions of the highest values in an array of scores.
+
+    NaN values are never selected. Ties are broken by position, so the
+    result doesn't depend on the selection algorithm.
+
+    :return: An array with the positions of at most `count` values, ordered by
+        decreasing score (and by ascending position, for equal scores). It is
+        empty if `count` is 0 or negative.
+    """
+    if count <= 0:
+        return np.array([], dtype = np.int64)
+    candidates = np.flatnonzero(~np.isnan(scores))
+    if count < len(candidates):
+        values = scores[candidates]
+        threshold = -np.partition(-values, count - 1)[count - 1]
+        above = candidates[values > threshold]
+        tied = candidates[values == threshold][:count - len(above)]
+        candidates = np.sort(np.concatenate((above, tied)))
+    return candidates[np.argsort(-scores[candidates], kind = "mergesort")]
+
+
+def _neighbourhood(users, max_neighbours):
+    # The users and concepts used to compare the concepts rated by the given
+    # users to other concepts, as arrays of ids in ascending order: the given
+    # users, the users that share ratings with them (preferring those that
+    # share the most), and the concepts rated by any of them. If there's
+    # room left, the other users that rated those concepts are added too,
+    # which makes the similarities exact.
+    store = users[0].registry.ratings
+    user_column = np.frombuffer(store.user_ids, dtype = np.uint32)
+    concept_column = np.frombuffer(store.concept_ids, dtype = np.uint32)
+
+    def rated_by(user_ids):
+        rows = np.array(store.user_rows(user_ids.tolist()), dtype = np.int64)
+        return np.unique(concept_column[rows])
+
+    def raters_of(concept_ids):
+        rows = np.array(
+            store.concept_rows(concept_ids.tolist()),
+            dtype = np.int64
+        )
+        return np.unique(user_column[rows], return_counts = True)
+
+    requested = np.unique([user.id for user in users])
+    raters, shared = raters_of(rated_by(requested))
+    others = ~np.in1d(raters, requested)
+    raters = raters[others]
+    order = np.lexsort((raters, -shared[others]))
+    room = max(max_neighbours - len(requested), 0)
+    selected = np.concatenate((requested, raters[order[:room]]))
+    concepts = rated_by(selected)
+
+    room = max_neighbours - len(selected)
+    if room > 0:
+        raters = raters_of(concepts)[0]
+        raters = raters[~np.in1d(raters, selected)]
+        if len(raters) <= room:
+            selected = np.concatenate((selected, raters))
+
+    return np.sort(selected), concepts
+
+
+def suggest_concepts(user,
+    count = 8,
+    adjusted = True,
+    max_neighbours = MAX_NEIGHBOURS
+):
+    """Suggest concepts to a user, through item-based collaborative
+    filtering.
+
+    :param user: The `User` to produce suggestions for.
+    :param count: The maximum number of suggestions to produce.
+    :param adjusted: If True, use the adjusted cosine similarity (centering
+        scores on the average score of each user). Otherwise, use plain
+        cosine similarity on the raw scores.
+    :param max_neighbours: The maximum number of users whose scores are
+        used to compare concepts. Similarities are exact when the users that
+        rated the compared concepts fit within this limit; otherwise, they
+        are computed over the users that share the most ratings with `user`.
+    :return: A list of (concept, predicted score, contributors) tuples,
+        ordered by decreasing predicted score. Contributors are the concepts
+        rated by the user that the suggested concept is similar to, ordered by
+        decreasing similarity.
+    """
+    return suggest_concepts_for_users(
+        [user],
+        count,
+        adjusted,
+        max_neighbours
+    )[user]
+
+
+def suggest_concepts_for_users(users,
+    count = 8,
+    adjusted = True,
+    max_neighbours = MAX_NEIGHBOURS
+):
+    """Suggest concepts to several users at once.
+
+    The score matrix is built once for the combined neighbourhood of all the
+    users, and the similarities to the concepts they rated are computed in a
+    single product.
+
+    :param users: A sequence of `User` objects.
+    :param count: The maximum number of suggestions to produce for each user.
+    :param adjusted: See `suggest_concepts`.
+    :param max_neighbours: See `suggest_concepts`. The limit applies to the
+        combined neighbourhood of all the users.
+    :return: A dictionary mapping each of the given users to a list of
+        suggestions, as returned by `suggest_concepts`.
+    """
+    suggestions = dict((user, []) for user in users)
+    raters = sorted(
+        (user for user in suggestions if user._ratings),
+        key = lambda user: user.id
+    )
+    if not raters:
+        return suggestions
+
+    registry = raters[0].registry
+    user_ids, concept_ids = _neighbourhood(raters, max_neighbours)
+    all_users = [registry.users[user_id] for user_id in user_ids.tolist()]
+    concepts = [
+        registry.concepts[concept_id]
+        for concept_id in concept_ids.tolist()
+    ]
+    matrix, rated, means = rating_matrix(all_users, concepts, adjusted)
+
+    row_of = dict((user, i) for i, user in enumerate(all_users))
+    rows = [row_of[user] for user in raters]
+    columns = np.flatnonzero(rated[rows].any(axis = 0))
+    similarities = concept_similarities(matrix, columns)
+
+    for user, row in zip(raters, rows):
+        rated_columns = np.flatnonzero(rated[row])
+        predictions, weights = predict_scores(
+            similarities[:, np.searchsorted(columns, rated_columns)],
+            matrix[row, rated_columns],
+            means[row] if adjusted else 0.0
+        )
+        predictions[rated_columns] = np.nan
+
+        user_suggestions = suggestions[user]
+        for j in top_scores(predictions, count):
+            order = np.argsort(-weights[j], kind = "mergesort")
+            contributors = [
+                concepts[rated_columns[k]]
+                for k in order
+                if weights[j, k] > 0
+            ]
+            user_suggestions.append(
+                (concepts[j], float(predictions[j]), contributors)
+            )
+
+    return suggestions
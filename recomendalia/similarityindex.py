@@ -0,0 +1,192 @@
+#-*- coding: utf-8 -*-
+u"""Module for the `SimilarityIndex` class.
+"""
+from heapq import nlargest
+from math import sqrt
+from operator import itemgetter
+from recomendalia.rating import Rating
+
+
+class SimilarityIndex(object):
+    """An incrementally maintained index of the cosine similarity between
+    concepts.
+
+    For each pair of concepts rated by a common user, the index keeps the dot
+    product of their score vectors and the number of users that rated both.
+    It also keeps the squared norm of the score vector of each concept. These
+    statistics are updated as ratings are created: a new rating, or a rating
+    that replaces a previous one, costs O(n), where n is the number of
+    concepts rated by the rating's user.
+
+    An index only sees the ratings created while it is attached (see the
+    `attach` method). To index ratings that already exist, use the
+    `from_users` constructor::
+
+        index = SimilarityIndex.from_users(users)
+        index.attach()
+
+    The index can be passed to `User.suggest_concepts` to serve suggestions
+    without recomputing similarities from scratch.
+    """
+
+    def __init__(self):
+        self._dots = {}
+        self._counts = {}
+        self._norms = {}
+
+    @classmethod
+    def from_users(cls, users):
+        """Create an index containing the ratings of the given users."""
+        index = cls()
+        dots = index._dots
+        counts = index._counts
+        norms = index._norms
+
+        for user in users:
+            ratings = list(user._ratings.iterscores())
+            for a, a_score in ratings:
+                norms[a] = norms.get(a, 0) + a_score * a_score
+                a_dots = dots.setdefault(a, {})
+                a_counts = counts.setdefault(a, {})
+                for b, b_score in ratings:
+                    if b is not a:
+                        a_dots[b] = a_dots.get(b, 0) + a_score * b_score
+                        a_counts[b] = a_counts.get(b, 0) + 1
+
+        return index
+
+    def attach(self):
+        """Start updating the index with every new rating."""
+        if self.update not in Rating.listeners:
+            Rating.listeners.append(self.update)
+
+    def detach(self):
+        """Stop updating the index with new ratings."""
+        if self.update in Rating.listeners:
+            Rating.listeners.remove(self.update)
+
+    def update(self, rating, previous = None):
+        """Add a rating to the index.
+
+        :param rating: The new `Rating`.
+        :param previous: The `Rating` replaced by the new rating, if any.
+        """
+        concept = rating.concept
+        score = rating.score
+        old_score = previous.score if previous is not None else 0
+        delta = score - old_score
+
+        self._norms[concept] = (
+            self._norms.get(concept, 0) + score * score - old_score * old_score
+        )
+
+        dots = self._dots
+        counts = self._counts
+        concept_dots = dots.setdefault(concept, {})
+        concept_counts = counts.setdefault(concept, {})
+
+        for other, other_score in rating.user._ratings.iterscores():
+            if other is concept:
+                continue
+            product = delta * other_score
+            other_dots = dots.setdefault(other, {})
+            concept_dots[other] = concept_dots.get(other, 0) + product
+            other_dots[concept] = other_dots.get(concept, 0) + product
+            if previous is None:
+                other_counts = counts.setdefault(other, {})
+                concept_counts[other] = concept_counts.get(other, 0) + 1
+                other_counts[concept] = other_counts.get(concept, 0) + 1
+
+    def co_ratings(self, a, b):
+        """Return the number of users that rated both of the given concepts."""
+        return self._counts.get(a, {}).get(b, 0)
+
+    def similarity(self, a, b):
+        """Return the cosine similarity between two concepts."""
+        dot = self._dots.get(a, {}).get(b, 0)
+        norm = sqrt(self._norms.get(a, 0) * self._norms.get(b, 0))
+        return dot / norm if norm else 0.0
+
+    def similarities(self, concept):
+        """Iterate over the similarity of a concept to each of the concepts
+        rated by at least one of its raters.
+
+        :return: An iterable sequence of (concept, similarity) tuples, in no
+            particular order.
+        """
+        norm = self._norms.get(concept, 0)
+        if not norm:
+            return
+
+        norms = self._norms
+        for other, dot in self._dots.get(concept, {}).iteritems():
+            other_norm = norms[other]
+            if dot and other_norm:
+                yield other, dot / sqrt(norm * other_norm)
+
+    def neighbors(self, concept, count = 10):
+        """Obtain the concepts most similar to the given concept.
+
+        :param count: The maximum number of concepts to return.
+        :return: A list of (concept, similarity) tuples, ordered by decreasing
+            similarity.
+        """
+        return nlargest(count, self.similarities(concept), key = itemgetter(1))
+
+    def suggest_concepts(self, user, count = 8, neighbors = None):
+        """Suggest concepts to a user, using the similarities in the index.
+
+        The predicted score for a concept is the average of the scores that
+        the user gave to similar concepts, weighted by their similarity.
+
+        :param user: The `User` to produce suggestions for.
+        :param count: The maximum number of suggestions to produce.
+        :param neighbors: If given, only this many of the most similar
+            concepts to each rated concept are taken into account.
+        :return: A list of (concept, predicted score, contributors) tuples,
+            like `recomendalia.similarity.suggest_concepts`.
+        """
+        ratings = user._ratings
+        weighted = {}
+        weights = {}
+        contributions = {}
+
+        for rated, score in ratings.iterscores():
+            if neighbors is None:
+                similar = self.similarities(rated)
+            else:
+                similar = self.neighbors(rated, neighbors)
+            for concept, similarity in similar:
+                if similarity > 0 and concept not in ratings:
+                    weighted[concept] = (
+                        weighted.get(concept, 0) + similarity * score
+                    )
+                    weights[concept] = weights.get(concept, 0) + similarity
+                    contributions.setdefault(concept, []).append(
+                        (rated, similarity)
+                    )
+
+        suggestions = nlargest(
+            count,
+            (
+                (concept, weighted[concept] / weight)
+                for concept, weight in weights.iteritems()
+            ),
+            key = itemgetter(1)
+        )
+
+        return [
+            (
+                concept,
+                score,
+                [
+                    rated
+                    for rated, similarity in sorted(
+                        contributions[concept],
+                        key = itemgetter(1),
+                        reverse = True
+                    )
+                ]
+            )
+            for concept, score in suggestions
+        ]
@@ -0,0 +1,313 @@
+#-*- coding: utf-8 -*-
+u"""Binary snapshots of a whole data set.
+
+A snapshot stores the users, friendships, concepts, relations and ratings of a
+`Registry` in a single binary file, as flat arrays:
+
+    - User and concept names, as UTF-8 strings with an array of offsets.
+    - Friendships, as a compressed sparse row (CSR) adjacency matrix indexed
+      by user id.
+    - Ratings, as user id, concept id and score columns.
+    - Relations, as source id, target id and relation type columns, with a
+      table of relation type names.
+
+Snapshots are loaded by memory mapping the file, so loading is nearly
+instantaneous regardless of the size of the data set, and processes that load
+the same snapshot share the same memory pages. The arrays can be used
+directly by vectorized code; `User`, `Concept` and `Relation` objects are only
+created when the `Snapshot.registry` property is first accessed.
+
+The file starts with a fixed header (`MAGIC`, followed by the format version
+and the size of the section table as little endian 32 bit integers), followed
+by a JSON section table and the sections themselves, aligned to 8 bytes.
+
+Snapshots can record the sequence number of the last change they include,
+so that a `recomendalia.changelog.ChangeLog` can replay the changes made
+after them (see `ChangeLog.checkpoint`).
+
+This module requires NumPy.
+"""
+import json
+import os
+import struct
+import numpy as np
+from recomendalia.registry import Registry
+from recomendalia.user import User
+from recomendalia.concept import Concept
+from recomendalia.relation import Relation
+
+MAGIC = b"RCMDSNAP"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<8sII")
+_ALIGNMENT = 8
+
+_SECTIONS = (
+    ("user_name_offsets", "<u8"),
+    ("user_names", "u1"),
+    ("concept_name_offsets", "<u8"),
+    ("concept_names", "u1"),
+    ("friend_indptr", "<u8"),
+    ("friend_indices", "<u4"),
+    ("rating_users", "<u4"),
+    ("rating_concepts", "<u4"),
+    ("rating_scores", "u1"),
+    ("relation_sources", "<u4"),
+    ("relation_targets", "<u4"),
+    ("relation_types", "<u2"),
+    ("relation_type_name_offsets", "<u8"),
+    ("relation_type_names", "u1")
+)
+
+
+def save_snapshot(path, registry = None, sequence = 0):
+    """Write a snapshot of a data set to a file.
+
+    The file is written to a temporary path first, and then moved into place,
+    so readers never see a partially written snapshot.
+
+    :param path: The path of the file to write.
+    :param registry: The `Registry` to save. Defaults to `Registry.default`.
+    :param sequence: The sequence number of the last change in the data set's
+        `recomendalia.changelog.ChangeLog`, if it has one.
+    """
+    if registry is None:
+        registry = Registry.default
+
+    users = registry.users
+    relations = registry.relations
+    store = registry.ratings
+    store.compact()
+
+    friend_indptr = np.zeros(len(users) + 1, dtype = np.uint64)
+    friend_indices = []
+    for user in users:
+        friend_indices.extend(sorted(friend.id for friend in user._friends))
+        friend_indptr[user.id + 1] = len(friend_indices)
+
+    relation_type_ids = {}
+    relation_types = []
+    for relation in relations:
+        relation_types.append(relation_type_ids.setdefault(
+            relation.relation_type,
+            len(relation_type_ids)
+        ))
+    relation_type_names = sorted(
+        relation_type_ids,
+        key = relation_type_ids.__getitem__
+    )
+
+    arrays = {
+        "friend_indptr": friend_indptr,
+        "friend_indices": friend_indices,
+        "rating_users": np.frombuffer(store.user_ids, dtype = np.uint32),
+        "rating_concepts": np.frombuffer(store.concept_ids, dtype = np.uint32),
+        "rating_scores": np.frombuffer(store.scores, dtype = np.uint8),
+        "relation_sources": [relation.source.id for relation in relations],
+        "relation_targets": [relation.target.id for relation in relations],
+        "relation_types": relation_types
+    }
+    for prefix, names in (
+        ("user_name", [user.name for user in users]),
+        ("concept_name", [concept.name for concept in registry.concepts]),
+        ("relation_type_name", relation_type_names)
+    ):
+        arrays[prefix + "_offsets"], arrays[prefix + "s"] = \
+            _encode_strings(names)
+
+    # Lay out the sections
+    sections = []
+    offset = 0
+    for name, dtype in _SECTIONS:
+        array = np.ascontiguousarray(arrays[name], dtype = dtype)
+        offset = _align(offset)
+        sections.append({
+            "name": name,
+            "dtype": dtype,
+            "offset": offset,
+            "count": len(array)
+        })
+        arrays[name] = array
+        offset += array.nbytes
+
+    table = json.dumps({
+        "users": len(users),
+        "concepts": len(registry.concepts),
+        "relations": len(relations),
+        "ratings": len(store),
+        "sequence": sequence,
+        "sections": sections
+    }).encode("utf-8")
+    data_start = _align(_HEADER.size + len(table))
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(table)))
+        file.write(table)
+        for section in sections:
+            file.seek(data_start + section["offset"])
+            file.write(arrays[section["name"]].tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.rename(temp_path, path)
+
+
+def load_snapshot(path):
+    """Load a snapshot, by memory mapping its file.
+
+    :param path: The path of the snapshot file.
+    :return: A `Snapshot` object.
+    :raise ValueError: If the file is not a snapshot, or was written with an
+        unsupported format version.
+    """
+    return Snapshot(path)
+
+
+class Snapshot(object):
+    """A data set loaded from a snapshot file.
+
+    The arrays in the snapshot are available as read only, memory mapped
+    NumPy arrays:
+
+        friend_indptr, friend_indices:
+            The CSR adjacency matrix of friendships. The ids of the friends of
+            user *i* are ``friend_indices[friend_indptr[i]:friend_indptr[i +
+            1]]``, in ascending order.
+
+        rating_users, rating_concepts, rating_scores:
+            The columns of the ratings.
+
+        relation_sources, relation_targets, relation_types:
+            The columns of the relations. Relation types are given as
+            positions in the `relation_type_names` list.
+
+    User and concept names are decoded on demand (see `user_name` and
+    `concept_name`). The complete object graph is created the first time the
+    `registry` property is accessed.
+
+    The `sequence` attribute gives the sequence number of the last change
+    logged before the snapshot was saved (0 if it wasn't given).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as file:
+            header = file.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError("%r is not a snapshot file" % path)
+            magic, version, table_size = _HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError("%r is not a snapshot file" % path)
+            if version != FORMAT_VERSION:
+                raise ValueError(
+                    "%r uses snapshot format version %d; expected version %d"
+                    % (path, version, FORMAT_VERSION)
+                )
+            table = json.loads(file.read(table_size).decode("utf-8"))
+
+        data_start = _align(_HEADER.size + table_size)
+        self._data = data = np.memmap(path, dtype = np.uint8, mode = "r")
+
+        for section in table["sections"]:
+            start = data_start + section["offset"]
+            dtype = np.dtype(str(section["dtype"]))
+            stop = start + section["count"] * dtype.itemsize
+            setattr(self, section["name"], data[start:stop].view(dtype))
+
+        self.user_count = table["users"]
+        self.concept_count = table["concepts"]
+        self.relation_count = table["relations"]
+        self.rating_count = table["ratings"]
+        self.sequence = table.get("sequence", 0)
+        self.relation_type_names = [
+            self._string("relation_type_name", i)
+            for i in xrange(len(self.relation_type_name_offsets) - 1)
+        ]
+        self._registry = None
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.path)
+
+    def _string(self, prefix, i):
+        offsets = getattr(self, prefix + "_offsets")
+        data = getattr(self, prefix + "s")
+        return data[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8")
+
+    def user_name(self, user_id):
+        """Return the name of the user with the given id."""
+        return self._string("user_name", user_id)
+
+    def concept_name(self, concept_id):
+        """Return the name of the concept with the given id."""
+        return self._string("concept_name", concept_id)
+
+    @property
+    def registry(self):
+        """A new `Registry` containing the objects in the snapshot.
+
+        Objects are created the first time the property is accessed, and keep
+        the ids they had when the snapshot was saved. Friendships and ratings
+        are added in bulk, without notifying `User.listeners` or
+        `Rating.listeners`.
+        """
+        if self._registry is None:
+            self._registry = self._materialize()
+        return self._registry
+
+    def _materialize(self):
+        registry = Registry()
+
+        users = [
+            User(self.user_name(i), registry)
+            for i in xrange(self.user_count)
+        ]
+        concepts = [
+            Concept(self.concept_name(i), registry)
+            for i in xrange(self.concept_count)
+        ]
+
+        indptr = self.friend_indptr.tolist()
+        indices = self.friend_indices.tolist()
+        get_user = users.__getitem__
+        for i, user in enumerate(users):
+            friends = indices[indptr[i]:indptr[i + 1]]
+            if friends:
+                user._friends.update(map(get_user, friends))
+
+        # Relations are restored exactly as they were saved, including the
+        # complementary relations
+        type_names = self.relation_type_names
+        for source, target, relation_type in zip(
+            self.relation_sources.tolist(),
+            self.relation_targets.tolist(),
+            self.relation_types.tolist()
+        ):
+            Relation(
+                concepts[source],
+                type_names[relation_type],
+                concepts[target],
+                _is_complementary = True
+            )
+
+        registry.ratings.extend(
+            self.rating_users.tolist(),
+            self.rating_concepts.tolist(),
+            self.rating_scores.tolist()
+        )
+        return registry
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _encode_strings(strings):
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype = np.uint64)
+    np.cumsum(
+        np.array([len(item) for item in encoded], dtype = np.uint64),
+        out = offsets[1:]
+    )
+    return offsets, np.frombuffer(b"".join(encoded), dtype = np.uint8)
@@ -0,0 +1,285 @@
+#-*- coding: utf-8 -*-
+u"""Social filtering: suggesting the concepts that a user's friends loved.
+
+The interest of a user in a concept is the sum of the scores given to it by
+the user's friends, counting only the scores of at least `min_score`.
+Optionally, friends of friends contribute too, with their scores multiplied
+by a `decay` factor for each friend they have in common with the user.
+
+In matrix terms, suggestions are the rows of ``W * S``, where ``W`` is the
+weighted adjacency of the users (friendships, plus ``decay`` times the number
+of friend of friend paths) and ``S`` is the user×concept score matrix. The
+product is computed for a batch of users at once, by expanding the sparse
+rows of ``W`` into the rating rows of ``S`` and adding up the results by
+(user, concept) pair, in blocks bounded by `EXPANSION_BUDGET`.
+
+This module requires NumPy.
+"""
+import numpy as np
+from recomendalia.batch import (
+    friendship_matrix,
+    mutual_friend_counts,
+    _row_blocks
+)
+from recomendalia import network
+
+#: The maximum number of (user, friend, rating) paths expanded at once.
+#: Bounds the memory used by a batch.
+EXPANSION_BUDGET = 1 << 22
+
+
+class SocialRecommender(object):
+    """A concept recommender based on the ratings of the user's friends.
+
+    Instances can be passed to `User.suggest_concepts`::
+
+        user.suggest_concepts(recommender = SocialRecommender())
+
+    The contributors of each suggestion are the friends (and friends of
+    friends) who rated the suggested concept, as `User` objects.
+    """
+
+    def __init__(self, min_score = 4, decay = 0.0):
+        """Create a new recommender.
+
+        :param min_score: The minimum score for a rating to be taken into
+            account.
+        :param decay: The weight of each path from the user to a friend of a
+            friend. 0 ignores friends of friends.
+        """
+        self.min_score = min_score
+        self.decay = decay
+
+    def suggest_concepts(self, user, count = 8):
+        """Suggest the concepts that a user's friends loved.
+
+        :return: A list of (concept, score, contributors) tuples, ordered by
+            decreasing score, as returned by `suggest_concepts_for_users`.
+        """
+        return self.suggest_concepts_for_users([user], count)[user]
+
+    def suggest_concepts_for_users(self, users, count = 8):
+        """Suggest concepts to several users at once.
+
+        See `suggest_concepts_for_users`.
+        """
+        return suggest_concepts_for_users(
+            users,
+            count,
+            self.min_score,
+            self.decay
+        )
+
+
+def suggest_concepts_for_users(users,
+    count = 8,
+    min_score = 4,
+    decay = 0.0
+):
+    """Suggest the concepts that the friends of each user loved.
+
+    Only the friendships and ratings within reach of the given users are
+    exported, so the cost depends on the size of their networks. To produce
+    suggestions for every user, pass all the users in a `Registry`.
+
+    :param users: A sequence of `User` objects, belonging to the same
+        `Registry`.
+    :param count: The maximum number of suggestions for each user.
+    :param min_score: The minimum score for a rating to be taken into
+        account.
+    :param decay: The weight of each path from a user to a friend of a
+        friend. 0 ignores friends of friends.
+    :return: A dictionary mapping each of the given users to a list of
+        (concept, score, contributors) tuples, ordered by decreasing score.
+        Concepts the user already rated are excluded. Contributors are the
+        friends (and friends of friends) who gave the concept a score of at
+        least `min_score`, ordered by decreasing contribution, and are given
+        as a callable, so that they are only computed when accessed (see
+        `ConceptSuggestion.contributors`).
+    """
+    users = list(set(users))
+    suggestions = dict((user, []) for user in users)
+    if not users:
+        return suggestions
+
+    # The requested users take up the first rows of the matrices
+    neighbourhood = list(users)
+    included = set(users)
+    for user in users:
+        for friend in user._friends:
+            if friend not in included:
+                included.add(friend)
+                neighbourhood.append(friend)
+            if decay:
+                for candidate in friend._friends:
+                    if candidate not in included:
+                        included.add(candidate)
+                        neighbourhood.append(candidate)
+
+    registry = users[0].registry
+    store = registry.ratings
+    concept_count = len(registry.concepts)
+    indptr, indices = friendship_matrix(neighbourhood)
+    degrees = np.diff(indptr)
+
+    # The score matrix of the neighbourhood, as CSR arrays; all_rows also
+    # includes scores below min_score, to exclude concepts already rated
+    all_rows = np.array(
+        store.user_rows([user.id for user in neighbourhood]),
+        dtype = np.int64
+    )
+    rating_counts = np.array(
+        [len(user._ratings) for user in neighbourhood],
+        dtype = np.int64
+    )
+    rating_owners = np.repeat(np.arange(len(neighbourhood)), rating_counts)
+    rating_concepts = np.frombuffer(store.concept_ids, dtype = np.uint32)
+    rating_scores = np.frombuffer(store.scores, dtype = np.uint8)
+
+    loved = rating_scores[all_rows] >= min_score
+    score_owners = rating_owners[loved]
+    score_concepts = rating_concepts[all_rows[loved]].astype(np.int64)
+    score_values = rating_scores[all_rows[loved]].astype(np.float64)
+    score_counts = np.bincount(score_owners, minlength = len(neighbourhood))
+    score_indptr = np.zeros(len(neighbourhood) + 1, dtype = np.int64)
+    np.cumsum(score_counts, out = score_indptr[1:])
+
+    rated_keys = (
+        rating_owners[:rating_counts[:len(users)].sum()] * concept_count
+        + rating_concepts[all_rows[:rating_counts[:len(users)].sum()]]
+    )
+
+    # Estimate the number of paths expanded for each requested user
+    reach = np.bincount(
+        np.repeat(np.arange(len(neighbourhood)), degrees),
+        weights = score_counts[indices] + (degrees[indices] if decay else 0),
+        minlength = len(neighbourhood)
+    )
+    cost = reach[:len(users)]
+    if decay:
+        cost = cost + np.bincount(
+            np.repeat(np.arange(len(neighbourhood)), degrees),
+            weights = reach[indices],
+            minlength = len(neighbourhood)
+        )[:len(users)]
+
+    for start, stop in _row_blocks(cost, EXPANSION_BUDGET):
+        rows, columns, totals = _scores(
+            indptr,
+            indices,
+            start,
+            stop,
+            decay,
+            score_indptr,
+            score_concepts,
+            score_values,
+            rated_keys,
+            concept_count
+        )
+
+        # Select the top concepts of each user; lexsort is stable, so
+        # concepts stay in ascending order among ties
+        order = np.lexsort((-totals, rows))
+        rows = rows[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        selected = order[rank < count]
+
+        for row, concept_id, total in zip(
+            rows[rank < count].tolist(),
+            columns[selected].tolist(),
+            totals[selected].tolist()
+        ):
+            user = neighbourhood[row]
+            concept = registry.concepts[concept_id]
+            suggestions[user].append((
+                concept,
+                total,
+                _Contributors(user, concept, min_score, decay)
+            ))
+
+    return suggestions
+
+
+def _scores(indptr,
+    indices,
+    start,
+    stop,
+    decay,
+    score_indptr,
+    score_concepts,
+    score_values,
+    rated_keys,
+    concept_count
+):
+    # Compute the rows of W * S for a range of users, as (row, concept,
+    # score) arrays sorted by row and concept
+    degrees = np.diff(indptr)
+    edge_rows = np.repeat(
+        np.arange(start, stop, dtype = np.int64),
+        degrees[start:stop]
+    )
+    edge_columns = indices[indptr[start]:indptr[stop]]
+    edge_weights = np.ones(len(edge_rows))
+
+    if decay:
+        rows, columns, paths = mutual_friend_counts(
+            indptr,
+            indices,
+            start,
+            stop
+        )
+        edge_rows = np.concatenate((edge_rows, rows))
+        edge_columns = np.concatenate((edge_columns, columns))
+        edge_weights = np.concatenate((edge_weights, decay * paths))
+
+    # Expand each edge (row, neighbour) into the neighbour's scores
+    score_counts = np.diff(score_indptr)
+    lengths = score_counts[edge_columns]
+    total = lengths.sum()
+    offsets = (
+        np.repeat(
+            score_indptr[edge_columns] - (np.cumsum(lengths) - lengths),
+            lengths
+        )
+        + np.arange(total, dtype = np.int64)
+    )
+    keys = np.repeat(edge_rows, lengths) * concept_count \
+        + score_concepts[offsets]
+    values = np.repeat(edge_weights, lengths) * score_values[offsets]
+
+    # Discard the concepts that the users already rated
+    mask = ~np.in1d(keys, rated_keys)
+    keys, inverse = np.unique(keys[mask], return_inverse = True)
+    totals = np.bincount(inverse, weights = values[mask])
+
+    return keys // concept_count, keys % concept_count, totals
+
+
+class _Contributors(object):
+    # Lists the friends (and friends of friends) of a user who loved a
+    # concept, by decreasing contribution, when called
+
+    def __init__(self, user, concept, min_score, decay):
+        self.user = user
+        self.concept = concept
+        self.min_score = min_score
+        self.decay = decay
+
+    def __call__(self):
+        weights = dict((friend, 1.0) for friend in self.user._friends)
+        if self.decay:
+            for candidate, paths in network.mutual_friend_counts(
+                self.user
+            ).iteritems():
+                weights[candidate] = self.decay * paths
+
+        store = self.user.registry.ratings
+        concept_id = self.concept.id
+        contributions = []
+        for rater, weight in weights.iteritems():
+            score = store.score(rater.id, concept_id)
+            if score is not None and score >= self.min_score:
+                contributions.append((weight * score, rater.id, rater))
+
+        contributions.sort(key = lambda item: (-item[0], item[1]))
+        return [rater for contribution, rater_id, rater in contributions]
@@ -3,8 +3,10 @@ u"""Module for the `User` class.
 
 .. moduleauthor:: Martí Congost <marti.congost@whads.com>
 """
+from threading import Lock
 from recomendalia.rating import Rating
-import collections
+from recomendalia.registry import Registry
+from recomendalia import network, instrumentation
 
 class User(object):
     """A class representing an end user of the website.
@@ -18,56 +20,145 @@ class User(object):
 
         - They can rate concepts (see the `ratings` property and the `Rating`
           class).
+
+    Each user belongs to a `Registry`, which assigns it a dense integer `id`.
+
+    Other objects can keep track of changes to friendships by adding a
+    callable to the `listeners` list. Each listener is called with both users
+    and a boolean indicating whether the friendship was established (True) or
+    ended (False), after the `friends` property of both users has been
+    updated.
     """
-    name = None
+    listeners = []
+
+    #: Users with less ratings than this get popular concepts from
+    #: `Registry.popularity` as concept suggestions, unless a recommender is
+    #: given explicitly.
+    COLD_START_RATINGS = 3
 
-    network =[]
+    __slots__ = (
+        "name",
+        "id",
+        "registry",
+        "_friends",
+        "_ratings",
+        "_version",
+        "__weakref__"
+    )
 
-    def __init__(self, name):
+    def __init__(self, name, registry = None):
+        if registry is None:
+            registry = Registry.default
         self.name = name
+        self.registry = registry
+        self.id = registry.add_user(self)
         self._friends = set()
-        self._ratings = {}
+        self._ratings = registry.ratings.user_ratings(self)
+        self._version = 0
 
     def __repr__(self):
         return "%s(%r)" % (self.__class__.__name__, self.name)
 
-    def suggest_friends(self):
+    def suggest_friends(self,
+        count = 8,
+        min_friends_in_common = 2,
+        index = None
+    ):
         """Suggest potential friends for this user.
-        
-        :return: An iterable sequence of `FriendSuggestion` objects, ordered by
-            decreasing afinity.
+
+        Candidates are the friends of the user's friends, ranked by the number
+        of friends they have in common with the user.
+
+        A sample of the calls can be traced by installing a
+        `recomendalia.instrumentation.Recorder`.
+
+        :param count: The maximum number of suggestions to produce.
+        :param min_friends_in_common: Candidates sharing less friends than this
+            with the user are not suggested.
+        :param index: A `recomendalia.network.MutualFriendIndex` holding
+            precomputed counts of friends in common, or a
+            `recomendalia.minhash.MinHashIndex` for approximate suggestions,
+            or a `recomendalia.bitsets.FriendBitsets` to intersect friend
+            sets as bitsets. If not given, counts are computed by traversing
+            the user's network.
+        :return: A `SuggestionResults` sequence of `FriendSuggestion`
+            objects, ordered by decreasing afinity.
         """
-        suggestionlist=[]
-
-        # generate the users network
-        self.gen_network()
-        # remove already friends and self from network 
-        nonfriendnetwork=[x for x in self.network if x not in self.friends and x.name != self.name]
-        # determine the occurances of each non friend in the network
-        counter = collections.Counter(nonfriendnetwork)   
-        # get a lsit of the most commonly occuring 4 people
-        common = counter.most_common(8)
-        #remove suggesitons where no friends or only 1 in common exist. ie rank of less than 4. 4 is used as netowork rank is 2* friends in common
-        for x in common:
-            if x[1] < 4:
-                common.remove(x)
-        
-        # Iterate over the suggestions in the most common list and create FriendSugesiton Objects
-        for suggestion in common:
-            userobject = suggestion[0]
-            rank=(suggestion[1])/2 
-            friendsincommon=self.get_friends_in_common(userobject)
-            suggestionlist.append(FriendSuggestion(userobject,rank, friendsincommon ))
-        # Return the list of the suggestion objects
-        return suggestionlist
+        recorder = instrumentation.recorder
+        if recorder is not None:
+            trace = recorder.sample("suggest_friends")
+            if trace is not None:
+                with trace:
+                    return self._suggest_friends(
+                        count,
+                        min_friends_in_common,
+                        index,
+                        trace
+                    )
+
+        return self._suggest_friends(count, min_friends_in_common, index)
+
+    def _suggest_friends(self,
+        count,
+        min_friends_in_common,
+        index,
+        trace = None
+    ):
+        if index is not None:
+            common = index.top_candidates(self, count, min_friends_in_common)
+            if trace is not None:
+                trace.stage("index")
+        else:
+            counts = network.mutual_friend_counts(self)
+            if trace is not None:
+                trace.stage("counting")
+                trace.size(
+                    "network",
+                    sum(len(friend._friends) for friend in self._friends)
+                )
+                trace.size("candidates", len(counts))
+            common = network.top_candidates(
+                counts,
+                count,
+                min_friends_in_common
+            )
+            if trace is not None:
+                trace.stage("ranking")
+
+        # Friends in common are only listed when a suggestion's
+        # friendsincommon property is accessed. Indexes may provide their own
+        # way of listing them, through a list_friends_in_common method.
+        if hasattr(index, "list_friends_in_common"):
+            def in_common(userobject):
+                return index.list_friends_in_common(self, [userobject])[0]
+        else:
+            in_common = self.get_friends_in_common
+
+        def create_suggestion(item):
+            userobject, rank = item
+            return FriendSuggestion(
+                userobject,
+                rank,
+                lambda: in_common(userobject)
+            )
+
+        if trace is not None:
+            trace.size("suggestions", len(common))
+
+        return SuggestionResults(common, create_suggestion)
 
     def gen_network(self):
-        # Generate a network based on all friends of the users friends
-        for friend in self.friends:
-            for userfriend in friend.friends:
-                self.network.append(userfriend)
-        return self.network
-        
+        """Generate a network based on all the friends of the user's friends.
+
+        :return: A new list of `User` objects, with one entry for each
+            friendship between one of the user's friends and another user.
+        """
+        return [
+            userfriend
+            for friend in self.friends
+            for userfriend in friend.friends
+        ]
+
     def get_friends_in_common(self, suggested_person):
         #Get friends in common between the user and the suggested person
         friendincommonlist = [ x for x in self.friends if x in suggested_person.friends]
@@ -75,22 +166,113 @@ class User(object):
         
         return friendincommonlist
 
-    def suggest_concepts(self):
+    def suggest_concepts(self,
+        count = 8,
+        adjusted = True,
+        recommender = None
+    ):
         """Suggest concepts that this user may be interested in.
 
-        :return: An iterable sequence of `ConceptSuggestion` objects, ordered
-            by decreasing potential interest.
+        Concepts are scored through item-based collaborative filtering: the
+        interest of the user in a concept is predicted from the scores the
+        user gave to the concepts that other users rated in a similar way. See
+        the `recomendalia.similarity` module. Users with less than
+        `COLD_START_RATINGS` ratings get the most popular concepts instead,
+        from the categories of the concepts they rated first (see
+        `recomendalia.popularity`).
+
+        A sample of the calls can be traced by installing a
+        `recomendalia.instrumentation.Recorder`.
+
+        :param count: The maximum number of suggestions to produce.
+        :param adjusted: If True, concept similarities are computed on scores
+            centered on the average score of each user (adjusted cosine
+            similarity).
+        :param recommender: An object providing precomputed data to score
+            concepts, such as a `SimilarityIndex`. It must implement a
+            ``suggest_concepts(user, count)`` method, returning a list of
+            (concept, score, contributors) tuples. Contributors can be given
+            as a list, or as a callable returning the list, to defer their
+            computation until they are accessed (see
+            `ConceptSuggestion.contributors`). Tuples may have a fourth
+            element, with the relations that explain the suggestion (see
+            `ConceptSuggestion.relations`), also as a list or a callable. If
+            given, `adjusted` is ignored.
+        :return: A `SuggestionResults` sequence of `ConceptSuggestion`
+            objects, ordered by decreasing potential interest.
         """
-        raise TypeError("Not implemented yet")
+        recorder = instrumentation.recorder
+        if recorder is not None:
+            trace = recorder.sample("suggest_concepts")
+            if trace is not None:
+                with trace:
+                    return self._suggest_concepts(
+                        count,
+                        adjusted,
+                        recommender,
+                        trace
+                    )
+
+        return self._suggest_concepts(count, adjusted, recommender)
+
+    def _suggest_concepts(self, count, adjusted, recommender, trace = None):
+        if recommender is None \
+        and len(self._ratings) < self.COLD_START_RATINGS:
+            recommender = self.registry.popularity
+
+        if recommender is not None:
+            suggestions = recommender.suggest_concepts(self, count)
+        else:
+            from recomendalia import similarity
+            suggestions = similarity.suggest_concepts(self, count, adjusted)
+
+        if trace is not None:
+            trace.stage("scoring")
+            trace.size("rated", len(self._ratings))
+            trace.size("suggestions", len(suggestions))
+
+        return SuggestionResults(
+            suggestions,
+            lambda item: ConceptSuggestion(*item)
+        )
 
     def befriend(self, user):
         """Establish a friendship with another user.
 
         Friendship relationships are always reciprocal: if a user A is a friend
         of B, B is necessarily a friend a of A.
+
+        A new friendship changes the network of friends of both users and of
+        all their friends, so it increases the `version` of all of them.
         """
+        if user in self._friends:
+            return
+
         self._friends.add(user)
         user._friends.add(self)
+        self._friendship_changed(user, True)
+
+    def unfriend(self, user):
+        """End a friendship with another user.
+
+        Like `befriend`, this affects both users, and increases the `version`
+        of both users and all their friends.
+        """
+        if user not in self._friends:
+            return
+
+        self._friends.remove(user)
+        user._friends.remove(self)
+        self._friendship_changed(user, False)
+
+    def _friendship_changed(self, user, befriended):
+        for friend in (self, user):
+            friend._version += 1
+            for friend_of_friend in friend._friends:
+                friend_of_friend._version += 1
+
+        for listener in self.listeners:
+            listener(self, user, befriended)
 
     @property
     def friends(self):
@@ -105,10 +287,22 @@ class User(object):
         """The ratings given by this user.
 
         The property is expressed as a mapping of `Rating` objects, indexed by
-        the rated `Concept`.
+        the rated `Concept`. The mapping is a read only view over the
+        `RatingStore` that holds the ratings (see `recomendalia.ratingstore`).
         """
         return self._ratings
 
+    @property
+    def version(self):
+        """A counter that increases whenever the data that suggestions for the
+        user are based on changes.
+
+        The version increases when the user rates a concept, and when the user
+        or one of its friends establishes a new friendship. See
+        `recomendalia.cache.SuggestionCache`.
+        """
+        return self._version
+
 
 class FriendSuggestion(object):
     """A class used to provide information on a friend suggestion for a user.
@@ -123,6 +317,8 @@ class FriendSuggestion(object):
     user = None
 
     def __init__(self, userobject,rank,friendsincommon):
+        # friendsincommon can also be a callable, invoked the first time the
+        # property is accessed
         self.user=userobject
         self._rank=rank
         self._friendsincommon= friendsincommon
@@ -141,7 +337,9 @@ class FriendSuggestion(object):
     @property
     def friendsincommon(self):
         #list of friends in common that this suggestion has with the user
-        
+        #(computed on first access)
+        if callable(self._friendsincommon):
+            self._friendsincommon = self._friendsincommon()
         return self._friendsincommon
 
 
@@ -156,3 +354,134 @@ class ConceptSuggestion(object):
     concept could be a potential point of interest.
     """
 
+    concept = None
+
+    def __init__(self, concept, score, contributors, relations = None):
+        self.concept = concept
+        self._score = score
+        self._contributors = contributors
+        self._relations = relations
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.concept)
+
+    @property
+    def score(self):
+        """The potential interest of the user in the concept.
+
+        The property takes the form of a number, whose scale depends on the
+        recommender that produced the suggestion: collaborative filtering
+        (see `recomendalia.similarity`) and matrix factorization predict
+        scores on the rating scale (`Rating.MIN_SCORE` to `Rating.MAX_SCORE`),
+        while other recommenders give probabilities
+        (`PersonalizedPageRank`), weighted sums of scores
+        (`ContentRecommender`, `SocialRecommender`) or popularity scores
+        (`PopularityRanking`). Scores are only comparable between
+        suggestions produced by the same recommender.
+        """
+        return self._score
+
+    @property
+    def contributors(self):
+        """The concepts rated by the user that led to the suggestion.
+
+        The property is expressed as a list of `Concept` objects, ordered by
+        decreasing similarity to the suggested concept. Social recommenders
+        (see `recomendalia.social`) give the `User` objects whose ratings led
+        to the suggestion instead. Recommenders may defer its computation
+        until it is first accessed.
+        """
+        if callable(self._contributors):
+            self._contributors = self._contributors()
+        return self._contributors
+
+    @property
+    def relations(self):
+        """The relations connecting the suggested concept to its
+        contributors.
+
+        The property is expressed as a list of `Relation` objects.
+        Recommenders that follow paths of relations provide them (see
+        `recomendalia.content.ContentRecommender`). Otherwise, the property
+        lists the relations from the suggested concept directly to its
+        contributors, computed the first time it is accessed: it is empty if
+        none of them is directly related to the concept, and always empty
+        when contributors are users (see `recomendalia.social`).
+        """
+        if callable(self._relations):
+            self._relations = self._relations()
+        elif self._relations is None:
+            contributors = set(self.contributors)
+            self._relations = [
+                relation
+                for relation in self.concept._relations
+                if relation.target in contributors
+            ]
+        return self._relations
+
+
+class SuggestionResults(object):
+    """A lazily evaluated sequence of suggestions, in rank order.
+
+    This class is returned by `User.suggest_friends` and
+    `User.suggest_concepts`. Candidates are ranked when the results are
+    created, but suggestion objects are only created as they are accessed
+    (through iteration, indexing or `page`), and their explanations (such as
+    `FriendSuggestion.friendsincommon`) are computed on their first access.
+    Serving the first page of a long list of suggestions thus only costs what
+    is actually rendered.
+
+    Suggestion objects are created at most once, so results can be shared
+    between threads (see `recomendalia.cache.SuggestionCache`).
+    """
+
+    def __init__(self, items, create_suggestion):
+        """Create a new result sequence.
+
+        :param items: A sequence with the data for each suggestion, in rank
+            order.
+        :param create_suggestion: A callable that creates a suggestion object
+            from an item of `items`.
+        """
+        self._items = items
+        self._create_suggestion = create_suggestion
+        self._suggestions = [None] * len(items)
+        self._lock = Lock()
+
+    def __repr__(self):
+        return "%s(%d suggestions)" % (
+            self.__class__.__name__,
+            len(self._items)
+        )
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        for position in xrange(len(self._items)):
+            yield self[position]
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [
+                self[i]
+                for i in xrange(*position.indices(len(self._items)))
+            ]
+
+        suggestion = self._suggestions[position]
+        if suggestion is None:
+            with self._lock:
+                suggestion = self._suggestions[position]
+                if suggestion is None:
+                    suggestion = self._suggestions[position] = \
+                        self._create_suggestion(self._items[position])
+        return suggestion
+
+    def page(self, offset, limit):
+        """Obtain a page of suggestions.
+
+        :param offset: The position of the first suggestion in the page.
+        :param limit: The maximum number of suggestions in the page.
+        :return: A list of suggestion objects.
+        """
+        return self[offset:offset + limit]
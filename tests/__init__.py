@@ -0,0 +1,7 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia` package.
+
+Run them from the root of the repository with::
+
+    python -m unittest discover -s tests -t .
+"""
@@ -0,0 +1,65 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.batch` module."""
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.sampledata import generate_sample_data
+from recomendalia.batch import (
+    suggest_friends_for_all,
+    suggest_friends_for_users
+)
+
+
+class BatchSuggestionsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.users = generate_sample_data(
+            300,
+            seed = 4,
+            registry = self.registry
+        )[0]
+
+    def assert_same_suggestions(self, user, suggestions, **kwargs):
+        expected = user.suggest_friends(**kwargs)
+        self.assertEqual(
+            [suggestion.rank for suggestion in suggestions],
+            [suggestion.rank for suggestion in expected]
+        )
+        for suggestion in suggestions:
+            friends_in_common = user.get_friends_in_common(suggestion.user)
+            self.assertNotIn(suggestion.user, user.friends)
+            self.assertIsNot(suggestion.user, user)
+            self.assertEqual(suggestion.rank, len(friends_in_common))
+            self.assertEqual(
+                set(suggestion.friendsincommon),
+                set(friends_in_common)
+            )
+
+    def test_suggest_friends_for_all(self):
+        suggestions = suggest_friends_for_all(self.users)
+        self.assertEqual(set(suggestions), set(self.users))
+        for user in self.users:
+            self.assert_same_suggestions(user, suggestions[user])
+
+    def test_suggest_friends_for_users(self):
+        users = self.users[::7]
+        suggestions = suggest_friends_for_users(
+            users,
+            count = 5,
+            min_friends_in_common = 1
+        )
+        self.assertEqual(set(suggestions), set(users))
+        for user in users:
+            self.assert_same_suggestions(
+                user,
+                suggestions[user],
+                count = 5,
+                min_friends_in_common = 1
+            )
+
+    def test_no_users(self):
+        self.assertEqual(suggest_friends_for_users([]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.cache` module."""
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.user import User
+from recomendalia.concept import Concept
+from recomendalia.rating import Rating
+from recomendalia.relation import Relation
+from recomendalia.content import ContentRecommender
+from recomendalia.cache import SuggestionCache
+
+
+class ConceptSuggestionsCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.concepts = [
+            Concept(u"Concept %d" % i, self.registry)
+            for i in range(8)
+        ]
+        self.user = User(u"Laura", self.registry)
+        self.neighbour = User(u"Dale", self.registry)
+        self.stranger = User(u"Audrey", self.registry)
+        for concept, score in zip(self.concepts[:4], (5, 4, 2, 1)):
+            Rating(self.user, concept, score)
+            Rating(self.neighbour, concept, score)
+        Rating(self.neighbour, self.concepts[4], 5)
+        Rating(self.stranger, self.concepts[6], 3)
+        self.cache = SuggestionCache()
+
+    def assert_cached(self, *args, **kwargs):
+        misses = self.cache.misses
+        self.cache.suggest_concepts(self.user, *args, **kwargs)
+        self.assertEqual(self.cache.misses, misses)
+
+    def assert_recomputed(self, *args, **kwargs):
+        misses = self.cache.misses
+        result = self.cache.suggest_concepts(self.user, *args, **kwargs)
+        self.assertEqual(self.cache.misses, misses + 1)
+        self.assertEqual(
+            [suggestion.concept for suggestion in result],
+            [
+                suggestion.concept
+                for suggestion in self.user.suggest_concepts(*args, **kwargs)
+            ]
+        )
+
+    def test_unrelated_ratings_keep_entries(self):
+        self.cache.suggest_concepts(self.user)
+        Rating(self.stranger, self.concepts[7], 4)
+        self.assert_cached()
+
+    def test_ratings_on_rated_concepts_invalidate_entries(self):
+        self.cache.suggest_concepts(self.user)
+        Rating(self.stranger, self.concepts[0], 4)
+        self.assert_recomputed()
+
+    def test_ratings_by_co_raters_invalidate_entries(self):
+        self.cache.suggest_concepts(self.user)
+        Rating(self.neighbour, self.concepts[5], 5)
+        self.assert_recomputed()
+        self.assertIn(
+            self.concepts[5],
+            [
+                suggestion.concept
+                for suggestion in self.cache.suggest_concepts(self.user)
+            ]
+        )
+
+    def test_bulk_ratings_invalidate_entries(self):
+        self.cache.suggest_concepts(self.user)
+        self.registry.ratings.merge(
+            [self.neighbour.id],
+            [self.concepts[5].id],
+            [5]
+        )
+        self.assert_recomputed()
+
+    def test_relations_invalidate_recommender_entries(self):
+        recommender = ContentRecommender()
+        self.cache.suggest_concepts(self.user, recommender = recommender)
+        Rating(self.stranger, self.concepts[7], 4)
+        self.assert_cached(recommender = recommender)
+        Relation(self.concepts[6], "created_by", self.concepts[7])
+        Relation(self.concepts[0], "created_by", self.concepts[7])
+        self.assert_recomputed(recommender = recommender)
+
+    def test_cold_start_entries_follow_the_rankings(self):
+        newcomer = User(u"Newcomer", self.registry)
+        concepts = lambda suggestions: [
+            suggestion.concept
+            for suggestion in suggestions
+        ]
+        self.cache.suggest_concepts(newcomer)
+        for i in range(2):
+            Rating(self.stranger, self.concepts[7 - i], 5)
+            self.assertEqual(
+                concepts(self.cache.suggest_concepts(newcomer)),
+                concepts(newcomer.suggest_concepts())
+            )
+
+        self.registry.popularity.refresh()
+        self.assertEqual(
+            concepts(self.cache.suggest_concepts(newcomer)),
+            concepts(newcomer.suggest_concepts())
+        )
+        self.assertIn(
+            self.concepts[7],
+            concepts(self.cache.suggest_concepts(newcomer))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.changelog` module."""
+import os
+import shutil
+import tempfile
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.user import User
+from recomendalia.concept import Concept
+from recomendalia.rating import Rating
+from recomendalia.relation import Relation
+from recomendalia.snapshot import load_snapshot
+from recomendalia.changelog import ChangeLog, RATING
+from tests.test_snapshot import describe
+
+
+class ChangeLogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "data.log")
+        self.registry = Registry()
+        self.log = ChangeLog(self.path, self.registry)
+        self.log.attach()
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.directory)
+
+    def make_changes(self, prefix = u""):
+        registry = self.registry
+        users = [User(prefix + u"User %d" % i, registry) for i in range(4)]
+        concepts = [
+            Concept(prefix + u"Concept %d" % i, registry)
+            for i in range(3)
+        ]
+        Relation(concepts[0], "created_by", concepts[1])
+        Relation(concepts[2], "contained_by", concepts[1])
+        users[0].befriend(users[1])
+        users[1].befriend(users[2])
+        users[2].befriend(users[3])
+        users[1].unfriend(users[2])
+        Rating(users[0], concepts[0], 4)
+        Rating(users[1], concepts[2], 2)
+        Rating(users[0], concepts[0], 1)
+
+    def replayed(self, since = None, registry = None):
+        registry = registry or Registry()
+        log = ChangeLog(self.path, registry)
+        try:
+            log.replay(since = since)
+        finally:
+            log.close()
+        return registry
+
+    def test_round_trip(self):
+        self.make_changes()
+        self.log.close()
+        self.assertEqual(
+            describe(self.replayed()),
+            describe(self.registry)
+        )
+
+    def test_checkpoint(self):
+        self.make_changes()
+        snapshot_path = os.path.join(self.directory, "data.snap")
+        sequence = self.log.checkpoint(snapshot_path)
+        self.make_changes(u"New ")
+        self.log.close()
+
+        snapshot = load_snapshot(snapshot_path)
+        self.assertEqual(snapshot.sequence, sequence)
+        registry = self.replayed(snapshot.sequence, snapshot.registry)
+        self.assertEqual(describe(registry), describe(self.registry))
+
+    def test_torn_record(self):
+        self.make_changes()
+        sequence = self.log.sequence
+        self.log.close()
+        expected = describe(self.replayed())
+
+        # The last change is a rating; tear it, as if the process had
+        # stopped while writing it
+        with open(self.path, "r+b") as file:
+            file.truncate(os.path.getsize(self.path) - 3)
+
+        log = ChangeLog(self.path, Registry())
+        self.assertEqual(log.sequence, sequence - 1)
+        self.assertEqual(
+            [change.sequence for change in log.changes()],
+            range(1, sequence)
+        )
+        registry = log.registry
+        log.replay()
+
+        # New changes are appended after the last complete record
+        log.attach()
+        Rating(registry.users[0], registry.concepts[0], 5)
+        log.close()
+
+        log = ChangeLog(self.path, Registry())
+        changes = list(log.changes())
+        log.close()
+        self.assertEqual(changes[-1].sequence, sequence)
+        self.assertEqual(changes[-1].kind, RATING)
+        self.assertEqual(changes[-1].values, (0, 0, 5, 4))
+
+        expected["ratings"] = [
+            (0, 0, 5) if rating[:2] == (0, 0) else rating
+            for rating in expected["ratings"]
+        ]
+        self.assertEqual(describe(self.replayed()), expected)
+
+    def test_invalid_files(self):
+        path = os.path.join(self.directory, "other.log")
+        with open(path, "wb") as file:
+            file.write(b"not a change log")
+        self.assertRaises(ValueError, ChangeLog, path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.content` module."""
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.user import User
+from recomendalia.concept import Concept
+from recomendalia.rating import Rating
+from recomendalia.content import ContentRecommender
+
+
+class ContentRecommenderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        define = lambda name, **kwargs: \
+            Concept(name, self.registry, **kwargs)
+        self.lynch = define(u"David Lynch")
+        self.twin_peaks = define(u"Twin Peaks", created_by = self.lynch)
+        self.dune = define(u"Dune", created_by = self.lynch)
+        self.movies = define(u"Movies", contains = [self.dune])
+        self.user = User(u"Laura", self.registry)
+        Rating(self.user, self.twin_peaks, 5)
+
+    def suggestion(self, concept):
+        for suggestion in self.user.suggest_concepts(
+            recommender = ContentRecommender()
+        ):
+            if suggestion.concept is concept:
+                return suggestion
+        self.fail("%r was not suggested" % concept)
+
+    def test_other_works_by_the_same_creator(self):
+        suggestion = self.suggestion(self.dune)
+        self.assertEqual(suggestion.score, 5.0)
+        self.assertEqual(suggestion.contributors, [self.twin_peaks])
+        self.assertEqual(
+            [
+                (relation.source, relation.relation_type, relation.target)
+                for relation in suggestion.relations
+            ],
+            [
+                (self.twin_peaks, "created_by", self.lynch),
+                (self.lynch, "creator_of", self.dune)
+            ]
+        )
+
+    def test_creator(self):
+        suggestion = self.suggestion(self.lynch)
+        self.assertEqual(
+            [
+                (relation.source, relation.target)
+                for relation in suggestion.relations
+            ],
+            [(self.twin_peaks, self.lynch)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.factorization` module."""
+import unittest
+import numpy as np
+from recomendalia import factorization
+
+
+class SolveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.budget = factorization.SOLVE_BUDGET
+
+    def tearDown(self):
+        factorization.SOLVE_BUDGET = self.budget
+
+    def test_rows_larger_than_the_budget(self):
+        rng = np.random.RandomState(0)
+        rank = 4
+        counts = rng.randint(0, 10, 30)
+        counts[3] = 500
+        counts[4] = 0
+        indptr = np.zeros(len(counts) + 1, dtype = np.int64)
+        np.cumsum(counts, out = indptr[1:])
+        columns = rng.randint(0, 20, indptr[-1])
+        values = rng.rand(indptr[-1]) * 5
+        fixed = rng.randn(20, rank)
+
+        # Chunks of 6 ratings and blocks of 6 rows
+        factorization.SOLVE_BUDGET = 6 * rank * rank
+        result = factorization._solve(fixed, (indptr, columns, values), 0.1)
+
+        for row in xrange(len(counts)):
+            factors = fixed[columns[indptr[row]:indptr[row + 1]]]
+            a = factors.T.dot(factors) \
+                + 0.1 * max(counts[row], 1) * np.eye(rank)
+            b = factors.T.dot(values[indptr[row]:indptr[row + 1]])
+            np.testing.assert_allclose(
+                result[row],
+                np.linalg.solve(a, b),
+                atol = 1e-10
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.hierarchy` module."""
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.concept import Concept
+from recomendalia.relation import Relation
+from recomendalia.hierarchy import Hierarchy
+
+
+class HierarchyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.media = self.define(u"Media")
+        self.movies = self.define(u"Movies", contained_by = self.media)
+        self.series = self.define(u"Series", contained_by = self.media)
+        self.dune = self.define(u"Dune", contained_by = self.movies)
+        self.twin_peaks = self.define(
+            u"Twin Peaks",
+            contained_by = self.series
+        )
+        self.hierarchy = Hierarchy([self.media])
+        self.hierarchy.attach()
+
+    def tearDown(self):
+        self.hierarchy.detach()
+
+    def define(self, name, **relations):
+        return Concept(name, self.registry, **relations)
+
+    def assert_consistent(self):
+        hierarchy = self.hierarchy
+        order = hierarchy.order
+        self.assertEqual(len(order), len(set(order)))
+        for category in order:
+            expected = set(
+                concept
+                for concept in order
+                if category in concept.related("contained_by", None)
+            )
+            self.assertEqual(set(hierarchy.descendants(category)), expected)
+            positions = set(
+                position
+                for start, stop in hierarchy.ranges(category)
+                for position in xrange(start, stop)
+            )
+            self.assertEqual(
+                positions,
+                set(
+                    hierarchy.position(concept)
+                    for concept in expected | set([category])
+                )
+            )
+            for concept in order:
+                self.assertEqual(
+                    hierarchy.is_under(concept, category),
+                    concept in expected
+                )
+            self.assertEqual(
+                set(hierarchy.ancestors(category)),
+                set(category.related("contained_by", None))
+            )
+
+    def test_tree(self):
+        self.assert_consistent()
+        self.assertEqual(len(self.hierarchy.ranges(self.media)), 1)
+
+    def test_add_relation(self):
+        self.assert_consistent()
+        blue_velvet = self.define(u"Blue Velvet")
+        Relation(self.movies, "contains", blue_velvet)
+        self.assertIn(blue_velvet, self.hierarchy.order)
+        self.assertTrue(self.hierarchy.is_under(blue_velvet, self.media))
+        self.assertEqual(len(self.hierarchy.ranges(self.movies)), 1)
+        self.assert_consistent()
+
+    def test_add_category(self):
+        self.assert_consistent()
+        documentaries = self.define(u"Documentaries")
+        Relation(documentaries, "contained_by", self.movies)
+        Relation(self.dune, "contained_by", documentaries)
+        self.assertTrue(self.hierarchy.is_under(self.dune, documentaries))
+        self.assert_consistent()
+
+    def test_multiple_categories(self):
+        self.assert_consistent()
+        Relation(self.twin_peaks, "contained_by", self.movies)
+        self.assertTrue(self.hierarchy.is_under(self.twin_peaks, self.movies))
+        self.assertTrue(self.hierarchy.is_under(self.twin_peaks, self.series))
+        self.assert_consistent()
+
+
+if __name__ == "__main__":
+    unittest.main()
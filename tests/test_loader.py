@@ -0,0 +1,118 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.loader` module."""
+import unittest
+from StringIO import StringIO
+from recomendalia.registry import Registry
+from recomendalia.loader import BulkLoader
+
+RATINGS = """\
+{"user": "laura", "concept": "Twin Peaks", "score": 5}
+{"user": "laura", "concept": "Dune", "score": 7}
+{"user": "dale", "concept": "Dune", "score": 2.5}
+
+{"user": "dale", "concept": "Dune", "score": "many"}
+{"user": "dale", "concept": "Dune"}
+not json
+{"user": "dale", "concept": "Dune", "score": 3}
+{"user": "dale", "concept": "Dune", "score": 4}
+{"user": "laura", "concept": "Twin Peaks", "score": 1}
+"""
+
+FRIENDSHIPS = """\
+user,friend
+laura,dale
+laura,laura
+audrey
+dale,laura
+audrey,dale
+"""
+
+RELATIONS = """\
+{"source": "Dune", "relation_type": "created_by", "target": "Lynch"}
+{"source": "Dune", "relation_type": "admired_by", "target": "Lynch"}
+{"source": "Lynch", "relation_type": "creator_of", "target": "Dune"}
+"""
+
+
+class BulkLoaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def loader(self, **kwargs):
+        return BulkLoader(self.registry, chunk_size = 3, **kwargs)
+
+    def test_rejected_ratings(self):
+        stats = self.loader().load_ratings(StringIO(RATINGS), "jsonl")
+        self.assertEqual(stats.rows, 9)
+        self.assertEqual(stats.rejected, 5)
+        self.assertEqual(
+            sorted(line for line, message in stats.errors),
+            [2, 3, 5, 6, 7]
+        )
+        self.assertEqual(stats.loaded, 2)
+        self.assertEqual(stats.updated, 1)
+        self.assertEqual(stats.duplicates, 1)
+
+        users = dict((user.name, user) for user in self.registry.users)
+        scores = dict(
+            (concept.name, score)
+            for concept, score in users["laura"].ratings.iterscores()
+        )
+        self.assertEqual(scores, {"Twin Peaks": 1})
+        self.assertEqual(
+            [score for concept, score in users["dale"].ratings.iterscores()],
+            [4]
+        )
+
+    def test_duplicate_ratings(self):
+        stats = BulkLoader(self.registry).load_ratings(
+            StringIO(RATINGS),
+            "jsonl"
+        )
+        self.assertEqual(stats.rejected, 5)
+        self.assertEqual(stats.loaded, 2)
+        self.assertEqual(stats.updated, 0)
+        self.assertEqual(stats.duplicates, 2)
+        self.assertEqual(len(self.registry.ratings), 2)
+
+    def test_max_errors(self):
+        loader = self.loader()
+        loader.MAX_ERRORS = 2
+        stats = loader.load_ratings(StringIO(RATINGS), "jsonl")
+        self.assertEqual(stats.rejected, 5)
+        self.assertEqual(len(stats.errors), 2)
+
+    def test_strict(self):
+        loader = self.loader(strict = True)
+        self.assertRaises(
+            ValueError,
+            loader.load_ratings,
+            StringIO(RATINGS),
+            "jsonl"
+        )
+        self.assertEqual(len(self.registry.ratings), 0)
+
+    def test_rejected_friendships(self):
+        stats = self.loader().load_friendships(StringIO(FRIENDSHIPS), "csv")
+        self.assertEqual(stats.rows, 5)
+        self.assertEqual(
+            sorted(line for line, message in stats.errors),
+            [3, 4]
+        )
+        self.assertEqual(stats.rejected, 2)
+        self.assertEqual(stats.loaded, 2)
+        self.assertEqual(stats.duplicates, 1)
+
+    def test_rejected_relations(self):
+        stats = self.loader().load_relations(StringIO(RELATIONS), "jsonl")
+        self.assertEqual(stats.rows, 3)
+        self.assertEqual(stats.rejected, 1)
+        self.assertEqual(stats.errors[0][0], 2)
+        self.assertEqual(stats.loaded, 1)
+        self.assertEqual(stats.duplicates, 1)
+        self.assertEqual(len(self.registry.relations), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.minhash` module."""
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.sampledata import generate_sample_data
+from recomendalia.network import mutual_friend_counts, top_candidates
+from recomendalia.minhash import MinHashIndex
+
+
+class MinHashIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.users = generate_sample_data(
+            200,
+            seed = 3,
+            registry = self.registry
+        )[0]
+        self.index = MinHashIndex.from_users(self.users, seed = 1)
+
+    def test_candidates_are_friends_of_friends(self):
+        for user in self.users:
+            counts = mutual_friend_counts(user)
+            candidates = self.index.candidates(user)
+            self.assertTrue(set(candidates) <= set(counts))
+            for candidate, count in self.index.top_candidates(user, 10):
+                self.assertEqual(count, counts[candidate])
+
+    def test_recall(self):
+        # Candidates that don't share a band are missed; at the default bands
+        # and rows most of the exact top candidates should still be found
+        found = total = 0
+        for user in self.users:
+            expected = top_candidates(mutual_friend_counts(user), 10)
+            approximate = self.index.top_candidates(user, 10)
+            found += len(
+                set(candidate for candidate, count in expected)
+                & set(candidate for candidate, count in approximate)
+            )
+            total += len(expected)
+        self.assertTrue(total)
+        self.assertGreaterEqual(float(found) / total, 0.75)
+
+    def test_suggest_friends(self):
+        user = max(self.users, key = lambda user: len(user.friends))
+        for suggestion in user.suggest_friends(index = self.index):
+            self.assertNotIn(suggestion.user, user.friends)
+            self.assertEqual(
+                suggestion.rank,
+                len(user.get_friends_in_common(suggestion.user))
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.network` module."""
+import random
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.user import User
+from recomendalia.network import (
+    MutualFriendIndex,
+    mutual_friend_counts,
+    top_candidates
+)
+
+
+def shared_state():
+    # The size of the containers held by the User class
+    return dict(
+        (name, len(value))
+        for name, value in vars(User).items()
+        if isinstance(value, (list, dict, set))
+    )
+
+
+class MutualFriendCountsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Laura's friends are Dale, Audrey and Bobby. Shelly is a friend of
+        # all of them, Leland of two, and Donna of one.
+        self.registry = Registry()
+        define = lambda name: User(name, self.registry)
+        self.laura = define(u"Laura")
+        self.dale = define(u"Dale")
+        self.audrey = define(u"Audrey")
+        self.bobby = define(u"Bobby")
+        self.shelly = define(u"Shelly")
+        self.leland = define(u"Leland")
+        self.donna = define(u"Donna")
+        for friend in (self.dale, self.audrey, self.bobby):
+            self.laura.befriend(friend)
+            friend.befriend(self.shelly)
+        self.dale.befriend(self.audrey)
+        self.dale.befriend(self.leland)
+        self.bobby.befriend(self.leland)
+        self.audrey.befriend(self.donna)
+
+    def test_mutual_friend_counts(self):
+        self.assertEqual(
+            mutual_friend_counts(self.laura),
+            {self.shelly: 3, self.leland: 2, self.donna: 1}
+        )
+        self.assertEqual(
+            mutual_friend_counts(self.shelly),
+            {self.laura: 3, self.leland: 2, self.donna: 1}
+        )
+        self.assertEqual(
+            mutual_friend_counts(User(u"Lonely", self.registry)),
+            {}
+        )
+
+    def test_top_candidates(self):
+        counts = mutual_friend_counts(self.laura)
+        self.assertEqual(
+            top_candidates(counts, 8),
+            [(self.shelly, 3), (self.leland, 2), (self.donna, 1)]
+        )
+        self.assertEqual(top_candidates(counts, 1), [(self.shelly, 3)])
+        self.assertEqual(
+            top_candidates(counts, 8, min_friends_in_common = 2),
+            [(self.shelly, 3), (self.leland, 2)]
+        )
+        self.assertEqual(top_candidates(counts, 0), [])
+        self.assertEqual(top_candidates({}, 8), [])
+
+    def test_suggest_friends(self):
+        self.assertEqual(
+            [
+                (suggestion.user, suggestion.rank)
+                for suggestion in self.laura.suggest_friends(
+                    min_friends_in_common = 1
+                )
+            ],
+            [(self.shelly, 3), (self.leland, 2), (self.donna, 1)]
+        )
+
+    def test_no_shared_state(self):
+        # Suggestions used to be accumulated in a class level list, which
+        # grew with every call
+        class_state = shared_state()
+        expected = [
+            (suggestion.user, suggestion.rank)
+            for suggestion in self.laura.suggest_friends()
+        ]
+        for i in range(5):
+            for user in self.registry.users:
+                user.suggest_friends()
+            self.assertEqual(
+                [
+                    (suggestion.user, suggestion.rank)
+                    for suggestion in self.laura.suggest_friends()
+                ],
+                expected
+            )
+        self.assertEqual(shared_state(), class_state)
+        self.assertFalse(hasattr(self.laura, "network"))
+
+
+class MutualFriendIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.users = [
+            User(u"User %d" % i, self.registry)
+            for i in range(30)
+        ]
+        self.random = random.Random(3)
+        for i in range(60):
+            self.toggle()
+        self.index = MutualFriendIndex.from_users(self.users)
+        self.index.attach()
+
+    def tearDown(self):
+        self.index.detach()
+
+    def toggle(self):
+        a, b = self.random.sample(self.users, 2)
+        if b in a.friends:
+            a.unfriend(b)
+        else:
+            a.befriend(b)
+
+    def assert_matches_rebuild(self):
+        rebuilt = MutualFriendIndex.from_users(self.users)
+        for a in self.users:
+            for b in self.users:
+                if a is not b:
+                    self.assertEqual(
+                        self.index.friends_in_common(a, b),
+                        len(a.friends & b.friends)
+                    )
+                    self.assertEqual(
+                        self.index.friends_in_common(a, b),
+                        rebuilt.friends_in_common(a, b)
+                    )
+            self.assertEqual(
+                [
+                    count
+                    for candidate, count
+                    in self.index.top_candidates(a, 10)
+                ],
+                [
+                    count
+                    for candidate, count
+                    in rebuilt.top_candidates(a, 10)
+                ]
+            )
+            for candidate, count in self.index.top_candidates(a, 10):
+                self.assertNotIn(candidate, a.friends)
+
+    def test_befriend(self):
+        a = self.users[0]
+        b = next(
+            user
+            for user in self.users[1:]
+            if user not in a.friends
+        )
+        self.index.top_candidates(a, 5)
+        a.befriend(b)
+        self.assert_matches_rebuild()
+
+    def test_unfriend(self):
+        a = max(self.users, key = lambda user: len(user.friends))
+        self.index.top_candidates(a, 5)
+        a.unfriend(next(iter(a.friends)))
+        self.assert_matches_rebuild()
+
+    def test_random_changes(self):
+        for i in range(100):
+            self.toggle()
+            if i % 10 == 0:
+                for user in self.users:
+                    self.index.top_candidates(user, 5)
+        self.assert_matches_rebuild()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.pagerank` module."""
+import unittest
+import numpy as np
+from recomendalia.registry import Registry
+from recomendalia.user import User
+from recomendalia.concept import Concept
+from recomendalia.rating import Rating
+from recomendalia.pagerank import PersonalizedPageRank
+
+
+class PersonalizedPageRankTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Laura rated Twin Peaks, which was created by Lynch. Dale is a
+        # friend of Laura, and rated Dune.
+        self.registry = Registry()
+        self.lynch = Concept(u"Lynch", self.registry)
+        self.twin_peaks = Concept(
+            u"Twin Peaks",
+            self.registry,
+            created_by = self.lynch
+        )
+        self.dune = Concept(u"Dune", self.registry)
+        self.laura = User(u"Laura", self.registry)
+        self.dale = User(u"Dale", self.registry)
+        self.laura.befriend(self.dale)
+        Rating(self.laura, self.twin_peaks, 2)
+        Rating(self.dale, self.dune, 4)
+        self.recommender = PersonalizedPageRank(
+            alpha = 0.2,
+            epsilon = 1e-12,
+            friend_weight = 1.0,
+            rating_weight = 0.5,
+            relation_weights = {"created_by": 3.0, "creator_of": 2.0},
+            max_pushes = 10 ** 6
+        )
+
+    def test_rank(self):
+        # The transition probabilities of the walk, by hand: Laura has a
+        # friend (weight 1) and a rating (2 * 0.5); Dale has a friend (1)
+        # and a rating (4 * 0.5); Twin Peaks has a relation (3) and a rating
+        # (1); Lynch only relates back to Twin Peaks (2); Dune only leads
+        # back to Dale.
+        nodes = [
+            self.laura,
+            self.dale,
+            self.twin_peaks,
+            self.lynch,
+            self.dune
+        ]
+        transitions = np.array([
+            # Laura, Dale, Twin Peaks, Lynch, Dune
+            [0, 1 / 2., 1 / 2., 0, 0],
+            [1 / 3., 0, 0, 0, 2 / 3.],
+            [1 / 4., 0, 0, 3 / 4., 0],
+            [0, 0, 1, 0, 0],
+            [0, 1, 0, 0, 0]
+        ])
+        alpha = self.recommender.alpha
+        start = np.array([1.0, 0, 0, 0, 0])
+        expected = np.linalg.solve(
+            np.eye(len(nodes)) - (1 - alpha) * transitions.T,
+            alpha * start
+        )
+
+        ranks = self.recommender.rank(self.laura)
+        self.assertEqual(set(ranks), set(nodes))
+        for node, probability in zip(nodes, expected):
+            self.assertAlmostEqual(ranks[node], probability, places = 8)
+
+    def test_rated_concepts_are_excluded(self):
+        suggestions = self.recommender.suggest_concepts(self.laura)
+        ranks = self.recommender.rank(self.laura)
+        self.assertEqual(
+            [
+                (concept, probability)
+                for concept, probability, contributors in suggestions
+            ],
+            sorted(
+                [
+                    (self.lynch, ranks[self.lynch]),
+                    (self.dune, ranks[self.dune])
+                ],
+                key = lambda item: -item[1]
+            )
+        )
+        self.assertEqual(
+            [
+                suggestion.concept
+                for suggestion in self.laura.suggest_concepts(
+                    recommender = self.recommender
+                )
+            ],
+            [concept for concept, probability, contributors in suggestions]
+        )
+
+    def test_contributors(self):
+        suggestions = dict(
+            (concept, contributors)
+            for concept, probability, contributors
+            in self.recommender.suggest_concepts(self.laura)
+        )
+        self.assertEqual(suggestions[self.lynch](), [self.twin_peaks])
+        self.assertEqual(suggestions[self.dune](), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.parallel` module."""
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.user import User
+from recomendalia.rating import Rating
+from recomendalia.sampledata import generate_sample_data
+from recomendalia.batch import suggest_friends_for_users
+from recomendalia.similarity import suggest_concepts_for_users
+from recomendalia.parallel import ParallelRecommender
+
+
+class ParallelRecommenderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.users, self.concepts = generate_sample_data(
+            150,
+            seed = 7,
+            registry = self.registry
+        )
+
+        # Users with too few ratings for collaborative filtering
+        self.cold = [
+            User(u"Newcomer %d" % i, self.registry)
+            for i in range(User.COLD_START_RATINGS)
+        ]
+        for i, user in enumerate(self.cold):
+            user.befriend(self.users[i])
+            for concept in self.concepts[:i]:
+                Rating(user, concept, 4)
+
+        self.recommender = ParallelRecommender(self.registry, processes = 2)
+
+    def tearDown(self):
+        self.recommender.close()
+
+    def test_suggest_friends_for_all(self):
+        users = self.registry.users
+        suggestions = self.recommender.suggest_friends_for_all(count = 5)
+        expected = suggest_friends_for_users(users, count = 5)
+        self.assertEqual(set(suggestions), set(users))
+        for user in users:
+            self.assertEqual(
+                [suggestion.rank for suggestion in suggestions[user]],
+                [suggestion.rank for suggestion in expected[user]]
+            )
+            for suggestion in suggestions[user]:
+                friends_in_common = user.get_friends_in_common(
+                    suggestion.user
+                )
+                self.assertNotIn(suggestion.user, user.friends)
+                self.assertIsNot(suggestion.user, user)
+                self.assertEqual(suggestion.rank, len(friends_in_common))
+                self.assertEqual(
+                    set(suggestion.friendsincommon),
+                    set(friends_in_common)
+                )
+
+    def test_suggest_concepts_for_all(self):
+        suggestions = self.recommender.suggest_concepts_for_all(count = 5)
+        expected = suggest_concepts_for_users(self.users, count = 5)
+        self.assertEqual(set(suggestions), set(self.registry.users))
+        for user in self.users:
+            self.assertEqual(
+                [suggestion.concept for suggestion in suggestions[user]],
+                [concept for concept, score, contributors in expected[user]]
+            )
+            for suggestion, (concept, score, contributors) in zip(
+                suggestions[user],
+                expected[user]
+            ):
+                self.assertAlmostEqual(suggestion.score, score)
+                self.assertEqual(suggestion.contributors, contributors)
+
+    def test_cold_start(self):
+        suggestions = self.recommender.suggest_concepts_for_all(count = 5)
+        for user in self.cold:
+            self.assertTrue(suggestions[user])
+            self.assertEqual(
+                [
+                    (suggestion.concept, suggestion.contributors)
+                    for suggestion in suggestions[user]
+                ],
+                [
+                    (suggestion.concept, suggestion.contributors)
+                    for suggestion in user.suggest_concepts(count = 5)
+                ]
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
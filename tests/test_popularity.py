@@ -0,0 +1,119 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.popularity` module."""
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.user import User
+from recomendalia.concept import Concept
+from recomendalia.rating import Rating
+from recomendalia.popularity import PopularityRanking
+from recomendalia import similarity
+
+
+class PopularityTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        define = lambda name, **kwargs: \
+            Concept(name, self.registry, **kwargs)
+        self.movies = [define(u"Movie %d" % i) for i in range(4)]
+        self.books = [define(u"Book %d" % i) for i in range(3)]
+        self.movie_category = define(u"Movies", contains = self.movies)
+        self.book_category = define(u"Books", contains = self.books)
+
+        # Concepts with more ratings are more popular: books more than
+        # movies, and the first concepts of each category more than the
+        # rest. A flop brings the average of all scores down.
+        raters = [User(u"Rater %d" % i, self.registry) for i in range(8)]
+        for concepts, skip in ((self.books, 0), (self.movies, 3)):
+            for i, concept in enumerate(concepts):
+                for rater in raters[i + skip:]:
+                    Rating(rater, concept, 5)
+        self.flop = define(u"Flop")
+        for rater in raters:
+            Rating(rater, self.flop, 1)
+
+    def suggested(self, user):
+        return [
+            (suggestion.concept, suggestion.contributors)
+            for suggestion in user.suggest_concepts(count = 5)
+        ]
+
+    def suggested_concepts(self, user):
+        return [
+            suggestion.concept
+            for suggestion in user.suggest_concepts(count = 5)
+        ]
+
+    def test_new_users_get_popular_concepts(self):
+        user = User(u"Newcomer", self.registry)
+        self.assertEqual(
+            self.suggested(user),
+            [
+                (concept, [])
+                for concept in self.books + self.movies[:2]
+            ]
+        )
+        self.assertEqual(
+            [concept for concept, score in self.registry.popularity.top(
+                count = 5
+            )],
+            self.books + self.movies[:2]
+        )
+
+    def test_rated_categories_come_first(self):
+        user = User(u"Moviegoer", self.registry)
+        Rating(user, self.movies[0], 4)
+        self.assertEqual(
+            self.suggested(user),
+            [
+                (self.movies[1], [self.movies[0]]),
+                (self.movies[2], [self.movies[0]]),
+                (self.movies[3], [self.movies[0]]),
+                (self.books[0], []),
+                (self.books[1], [])
+            ]
+        )
+
+    def test_cold_start_threshold(self):
+        user = User(u"Regular", self.registry)
+        for concept in self.movies[:User.COLD_START_RATINGS]:
+            popular = [
+                concept
+                for concept, score, contributors
+                in self.registry.popularity.suggest_concepts(user, 5)
+            ]
+            self.assertEqual(self.suggested_concepts(user), popular)
+            Rating(user, concept, 3)
+
+        self.assertEqual(
+            self.suggested_concepts(user),
+            [
+                concept
+                for concept, score, contributors
+                in similarity.suggest_concepts(user, 5)
+            ]
+        )
+
+    def test_bayesian_average(self):
+        ranking = PopularityRanking(self.registry, prior_weight = 0)
+        self.assertEqual(ranking.score(self.books[2]), 5.0)
+        ranking = PopularityRanking(self.registry, by_count = True)
+        self.assertEqual(ranking.score(self.books[2]), 6)
+        self.assertEqual(
+            ranking.score(Concept(u"Unrated", self.registry)),
+            None
+        )
+
+    def test_refresh(self):
+        ranking = PopularityRanking(self.registry, max_age = 3600)
+        ranking.top()
+        hit = Concept(u"Movie 4", self.registry)
+        for i in range(30):
+            Rating(User(u"Fan %d" % i, self.registry), hit, 5)
+        self.assertEqual(ranking.score(hit), None)
+        ranking.refresh()
+        self.assertEqual(ranking.top(count = 1)[0][0], hit)
+
+
+if __name__ == "__main__":
+    unittest.main()
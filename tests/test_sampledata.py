@@ -0,0 +1,52 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.sampledata` module."""
+import unittest
+import numpy as np
+from recomendalia.registry import Registry
+from recomendalia.rating import Rating
+from recomendalia.sampledata import generate_sample_data, power_law
+
+
+class GenerateSampleDataTestCase(unittest.TestCase):
+
+    def test_score_weights_are_not_modified(self):
+        weights = np.array([1.0, 1.0, 1.0, 2.0, 4.0, 2.0])
+        users, concepts = generate_sample_data(
+            20,
+            seed = 1,
+            registry = Registry(),
+            score_weights = weights
+        )
+        self.assertEqual(weights.tolist(), [1.0, 1.0, 1.0, 2.0, 4.0, 2.0])
+
+    def test_score_weights(self):
+        registry = Registry()
+        generate_sample_data(
+            20,
+            seed = 1,
+            registry = registry,
+            score_weights = [0, 0, 0, 0, 0, 1]
+        )
+        self.assertTrue(len(registry.ratings))
+        self.assertEqual(
+            set(registry.ratings.scores),
+            set([Rating.MAX_SCORE])
+        )
+
+
+class PowerLawTestCase(unittest.TestCase):
+
+    def test_values(self):
+        draw = power_law(2.0, minimum = 2, maximum = 50)
+        values = draw(np.random.RandomState(0), 1000)
+        self.assertEqual(len(values), 1000)
+        self.assertTrue((values >= 2).all())
+        self.assertTrue((values <= 50).all())
+
+    def test_invalid_exponents(self):
+        for exponent in (1, 1.0, 0.5, -2):
+            self.assertRaises(ValueError, power_law, exponent)
+
+
+if __name__ == "__main__":
+    unittest.main()
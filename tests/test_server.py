@@ -0,0 +1,59 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.server` module."""
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.user import User
+from recomendalia.rating import Rating
+from recomendalia.sampledata import generate_sample_data
+from recomendalia.server import RecommendationServer
+
+
+class ConceptSuggestionsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.users, self.concepts = generate_sample_data(
+            100,
+            seed = 2,
+            registry = self.registry
+        )
+        self.server = RecommendationServer(
+            ("127.0.0.1", 0),
+            registry = self.registry
+        )
+
+    def tearDown(self):
+        self.server.server_close()
+
+    def served(self, user, count = 5):
+        return self.server._suggest_concepts([(user.id, count)])[
+            (user.id, count)
+        ]
+
+    def expected(self, user, count = 5):
+        return [
+            suggestion.concept.id
+            for suggestion in user.suggest_concepts(count)
+        ]
+
+    def test_cold_start_users_get_popular_concepts(self):
+        newcomer = User(u"Newcomer", self.registry)
+        Rating(newcomer, self.concepts[0], 5)
+        served = self.served(newcomer)
+        self.assertTrue(served)
+        self.assertEqual(
+            [item["concept"] for item in served],
+            self.expected(newcomer)
+        )
+
+    def test_users_with_ratings(self):
+        user = self.users[0]
+        self.assertTrue(len(user.ratings) >= User.COLD_START_RATINGS)
+        self.assertEqual(
+            [item["concept"] for item in self.served(user)],
+            self.expected(user)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.similarity` module."""
+import unittest
+import numpy as np
+from recomendalia.registry import Registry
+from recomendalia.sampledata import generate_sample_data
+from recomendalia import similarity
+
+
+class SuggestConceptsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.users, self.concepts = generate_sample_data(
+            150,
+            seed = 3,
+            registry = self.registry
+        )
+
+    def reference(self, user, count, adjusted):
+        # Score every concept using every user in the registry
+        matrix, rated, means = similarity.rating_matrix(
+            self.users,
+            self.concepts,
+            adjusted
+        )
+        row = self.users.index(user)
+        columns = np.flatnonzero(rated[row])
+        predictions = similarity.predict_scores(
+            similarity.concept_similarities(matrix, columns),
+            matrix[row, columns],
+            means[row] if adjusted else 0.0
+        )[0]
+        predictions[columns] = np.nan
+        return [
+            (self.concepts[j], predictions[j])
+            for j in similarity.top_scores(predictions, count)
+        ]
+
+    def test_matches_the_whole_registry(self):
+        for adjusted in (True, False):
+            for user in self.users[:20]:
+                expected = self.reference(user, 8, adjusted)
+                suggestions = similarity.suggest_concepts(user, 8, adjusted)
+                self.assertEqual(
+                    [concept for concept, score, contributors in suggestions],
+                    [concept for concept, score in expected]
+                )
+                for (concept, score, contributors), (other, value) in zip(
+                    suggestions,
+                    expected
+                ):
+                    self.assertAlmostEqual(score, value)
+
+    def test_batches_match_single_users(self):
+        users = self.users[:30]
+        batch = similarity.suggest_concepts_for_users(users, 5)
+        for user in users:
+            self.assertEqual(
+                [item[:2] for item in batch[user]],
+                [item[:2] for item in similarity.suggest_concepts(user, 5)]
+            )
+
+    def test_neighbourhood_limit(self):
+        user = self.users[0]
+        suggestions = similarity.suggest_concepts(
+            user,
+            8,
+            max_neighbours = 10
+        )
+        self.assertEqual(len(suggestions), 8)
+        for concept, score, contributors in suggestions:
+            self.assertNotIn(concept, user.ratings)
+
+
+class TopScoresTestCase(unittest.TestCase):
+
+    def test_ties_are_broken_by_position(self):
+        scores = np.array([1.0, 3.0, np.nan, 3.0, 2.0, 3.0, 3.0])
+        self.assertEqual(similarity.top_scores(scores, 3).tolist(), [1, 3, 5])
+        self.assertEqual(
+            similarity.top_scores(scores, 10).tolist(),
+            [1, 3, 5, 6, 4, 0]
+        )
+
+    def test_no_count(self):
+        scores = np.array([1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(similarity.top_scores(scores, 0).tolist(), [])
+        self.assertEqual(similarity.top_scores(scores, -2).tolist(), [])
+        self.assertEqual(similarity.top_scores(scores, 1).tolist(), [3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.similarityindex` module."""
+import random
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.rating import Rating
+from recomendalia.sampledata import generate_sample_data
+from recomendalia.similarityindex import SimilarityIndex
+
+
+class SimilarityIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.users, self.concepts = generate_sample_data(
+            60,
+            seed = 5,
+            registry = self.registry
+        )
+        self.index = SimilarityIndex.from_users(self.users)
+        self.index.attach()
+
+    def tearDown(self):
+        self.index.detach()
+
+    def assert_matches_rebuild(self):
+        rebuilt = SimilarityIndex.from_users(self.users)
+        for a in self.concepts:
+            for b in self.concepts:
+                if a is b:
+                    continue
+                self.assertEqual(
+                    self.index.co_ratings(a, b),
+                    rebuilt.co_ratings(a, b)
+                )
+                self.assertAlmostEqual(
+                    self.index.similarity(a, b),
+                    rebuilt.similarity(a, b)
+                )
+
+        for user in self.users[:10]:
+            scores = [
+                score
+                for concept, score, contributors
+                in self.index.suggest_concepts(user)
+            ]
+            expected = [
+                score
+                for concept, score, contributors
+                in rebuilt.suggest_concepts(user)
+            ]
+            self.assertEqual(len(scores), len(expected))
+            for score, expected_score in zip(scores, expected):
+                self.assertAlmostEqual(score, expected_score)
+
+    def test_new_ratings(self):
+        rng = random.Random(1)
+        for user in self.users[:20]:
+            unrated = [
+                concept
+                for concept in self.concepts
+                if concept not in user.ratings
+            ]
+            for concept in rng.sample(unrated, 3):
+                Rating(user, concept, rng.randint(
+                    Rating.MIN_SCORE,
+                    Rating.MAX_SCORE
+                ))
+        self.assert_matches_rebuild()
+
+    def test_replaced_ratings(self):
+        rng = random.Random(2)
+        for user in self.users[:20]:
+            for concept in rng.sample(list(user.ratings), 2):
+                score = user.ratings[concept].score
+                Rating(
+                    user,
+                    concept,
+                    Rating.MAX_SCORE - score + Rating.MIN_SCORE
+                )
+        self.assert_matches_rebuild()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.snapshot` module."""
+import os
+import shutil
+import tempfile
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.concept import Concept
+from recomendalia.sampledata import generate_sample_data
+from recomendalia.snapshot import save_snapshot, load_snapshot
+
+
+def describe(registry):
+    # A comparable summary of the contents of a registry
+    return {
+        "users": [user.name for user in registry.users],
+        "concepts": [concept.name for concept in registry.concepts],
+        "friends": [
+            sorted(friend.id for friend in user.friends)
+            for user in registry.users
+        ],
+        "ratings": sorted(
+            (user.id, concept.id, score)
+            for user in registry.users
+            for concept, score in user.ratings.iterscores()
+        ),
+        "relations": [
+            (
+                relation.source.id,
+                relation.relation_type,
+                relation.target.id
+            )
+            for relation in registry.relations
+        ]
+    }
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "data.snap")
+        self.registry = Registry()
+        generate_sample_data(80, seed = 6, registry = self.registry)
+        Concept(u"Ñandú", self.registry)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        save_snapshot(self.path, self.registry, sequence = 42)
+        snapshot = load_snapshot(self.path)
+        self.assertEqual(snapshot.sequence, 42)
+        self.assertEqual(snapshot.user_count, len(self.registry.users))
+        self.assertEqual(snapshot.rating_count, len(self.registry.ratings))
+        self.assertEqual(
+            snapshot.concept_name(len(self.registry.concepts) - 1),
+            u"Ñandú"
+        )
+        self.assertEqual(
+            describe(snapshot.registry),
+            describe(self.registry)
+        )
+
+    def test_aggregates(self):
+        save_snapshot(self.path, self.registry)
+        registry = load_snapshot(self.path).registry
+        for concept in self.registry.concepts:
+            stats = concept.rating_stats
+            loaded = registry.concepts[concept.id].rating_stats
+            self.assertEqual(
+                (loaded.count, loaded.total, loaded.squares),
+                (stats.count, stats.total, stats.squares)
+            )
+
+    def test_invalid_files(self):
+        with open(self.path, "wb") as file:
+            file.write(b"not a snapshot")
+        self.assertRaises(ValueError, load_snapshot, self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the `recomendalia.social` module."""
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.sampledata import generate_sample_data
+from recomendalia.network import mutual_friend_counts
+from recomendalia.social import SocialRecommender, suggest_concepts_for_users
+
+
+def reference_suggestions(user, count, min_score, decay):
+    # Social filtering, computed concept by concept
+    weights = dict((friend, 1.0) for friend in user.friends)
+    if decay:
+        for candidate, paths in mutual_friend_counts(user).iteritems():
+            weights[candidate] = decay * paths
+
+    totals = {}
+    for rater, weight in weights.iteritems():
+        for concept, score in rater.ratings.iterscores():
+            if score >= min_score and concept not in user.ratings:
+                totals[concept] = totals.get(concept, 0.0) + weight * score
+
+    return sorted(
+        totals.iteritems(),
+        key = lambda item: (-item[1], item[0].id)
+    )[:count]
+
+
+class SocialRecommenderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.users = generate_sample_data(
+            120,
+            seed = 8,
+            registry = self.registry
+        )[0]
+
+    def assert_same_suggestions(self, suggestions, expected):
+        self.assertEqual(
+            [concept for concept, score, contributors in suggestions],
+            [concept for concept, score in expected]
+        )
+        for (concept, score, contributors), (expected_concept, total) in zip(
+            suggestions,
+            expected
+        ):
+            self.assertAlmostEqual(score, total)
+
+    def check(self, min_score, decay):
+        recommender = SocialRecommender(min_score, decay)
+        batch = suggest_concepts_for_users(self.users, 5, min_score, decay)
+        self.assertEqual(set(batch), set(self.users))
+        for user in self.users:
+            expected = reference_suggestions(user, 5, min_score, decay)
+            self.assert_same_suggestions(batch[user], expected)
+            self.assert_same_suggestions(
+                recommender.suggest_concepts(user, 5),
+                expected
+            )
+
+    def test_friends(self):
+        self.check(4, 0.0)
+
+    def test_friends_of_friends(self):
+        self.check(3, 0.5)
+
+    def test_contributors(self):
+        user = self.users[0]
+        for concept, score, contributors in suggest_concepts_for_users(
+            [user],
+            5,
+            decay = 0.5
+        )[user]:
+            contributors = contributors()
+            self.assertTrue(contributors)
+            for contributor in contributors:
+                self.assertGreaterEqual(contributor.ratings[concept].score, 4)
+                self.assertTrue(
+                    contributor in user.friends
+                    or user.get_friends_in_common(contributor)
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
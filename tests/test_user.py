@@ -0,0 +1,62 @@
+#-*- coding: utf-8 -*-
+u"""Tests for the suggestion methods of the `User` class."""
+import unittest
+from recomendalia.registry import Registry
+from recomendalia.sampledata import generate_sample_data
+from recomendalia.network import MutualFriendIndex
+from recomendalia.minhash import MinHashIndex
+from recomendalia.bitsets import FriendBitsets
+
+
+class SuggestFriendsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.users = generate_sample_data(
+            200,
+            seed = 1,
+            registry = self.registry
+        )[0]
+
+    def assert_valid_suggestions(self, user, suggestions):
+        for suggestion in suggestions:
+            self.assertNotIn(suggestion.user, user.friends)
+            self.assertIsNot(suggestion.user, user)
+            self.assertEqual(
+                set(suggestion.friendsincommon),
+                set(user.get_friends_in_common(suggestion.user))
+            )
+
+    def test_without_index(self):
+        for user in self.users[:20]:
+            suggestions = user.suggest_friends()
+            self.assert_valid_suggestions(user, suggestions)
+            for suggestion in suggestions:
+                self.assertEqual(
+                    suggestion.rank,
+                    len(user.get_friends_in_common(suggestion.user))
+                )
+
+    def test_exact_indexes(self):
+        for index_class in (MutualFriendIndex, FriendBitsets):
+            index = index_class.from_users(self.users)
+            for user in self.users[:20]:
+                expected = user.suggest_friends()
+                suggestions = user.suggest_friends(index = index)
+                self.assertEqual(
+                    [suggestion.rank for suggestion in suggestions],
+                    [suggestion.rank for suggestion in expected]
+                )
+                self.assert_valid_suggestions(user, suggestions)
+
+    def test_minhash_index(self):
+        index = MinHashIndex.from_users(self.users)
+        for user in self.users[:20]:
+            self.assert_valid_suggestions(
+                user,
+                user.suggest_friends(index = index)
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()